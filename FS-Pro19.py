@@ -1,957 +1,1528 @@
-"""
-File Search Pro
-Copyright (C) 2024 [Kristopher Sorensen]
-
-This program is free software: you can redistribute it and/or modify
-it under the terms of the GNU General Public License as published by
-the Free Software Foundation, either version 3 of the License, or
-(at your option) any later version.
-
-This program is distributed in the hope that it will be useful,
-but WITHOUT ANY WARRANTY; without even the implied warranty of
-MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
-GNU General Public License for more details.
-
-You should have received a copy of the GNU General Public License
-along with this program. If not, see <https://www.gnu.org/licenses/>.
-"""
-
-import os
-import json
-import sys
-import shutil
-import win32com.client
-import threading
-from PyQt5.QtWidgets import (
-    QApplication, QMainWindow, QLabel, QLineEdit, QListWidget, QPushButton, QProgressBar,
-    QVBoxLayout, QWidget, QMessageBox, QFileDialog, QComboBox, QMenu, QInputDialog, QListWidgetItem, QTextBrowser, QDialog, QMenuBar
-)
-from PyQt5.QtCore import pyqtSignal, QObject, Qt
-from PyQt5.QtGui import QIcon
-from filelock import FileLock, Timeout
-from watchdog.observers import Observer
-from watchdog.events import FileSystemEventHandler
-
-# Path to save the JSON index file in the same directory as the script or .exe
-if getattr(sys, 'frozen', False):
-    APP_DIR = os.path.dirname(sys.executable)
-else:
-    APP_DIR = os.path.dirname(os.path.abspath(__file__))
-
-INDEX_FILE = os.path.join(APP_DIR, "file_index.json")
-ICON_FILE = os.path.join(APP_DIR, "FS-ICO.ico")
-TAGS_FILE = os.path.join(APP_DIR, "tags.json")  # File to store tags
-
-DARK_MODE_STYLESHEET = """
-    QMainWindow {
-        background-color: #2b2b2b;
-        color: #ffffff;
-    }
-    QLabel, QLineEdit, QListWidget, QPushButton, QComboBox {
-        color: #ffffff;
-        background-color: #3c3f41;
-        border: 1px solid #555555;
-    }
-    QPushButton:hover {
-        background-color: #555555;
-    }
-    QProgressBar {
-        background-color: #3c3f41;
-        color: #ffffff;
-        border: 1px solid #555555;
-        text-align: center;
-    }
-    QProgressBar::chunk {
-        background-color: #85c1e9;
-    }
-"""
-
-LIGHT_MODE_STYLESHEET = """
-    QMainWindow {
-        background-color: #f0f0f0;
-        color: #000000;
-    }
-    QLabel, QLineEdit, QListWidget, QPushButton, QComboBox {
-        color: #000000;
-        background-color: #ffffff;
-        border: 1px solid #cccccc;
-    }
-    QPushButton:hover {
-        background-color: #e6e6e6;
-    }
-    QProgressBar {
-        background-color: #ffffff;
-        color: #000000;
-        border: 1px solid #cccccc;
-        text-align: center;
-    }
-    QProgressBar::chunk {
-        background-color: #4caf50;
-    }
-"""
-# Help menu items
-class HelpDialog(QDialog):
-    """Custom dialog for displaying the Help information."""
-    def __init__(self, parent=None):
-        super().__init__(parent)
-        self.setWindowTitle("Help")
-        self.setGeometry(200, 200, 600, 400)
-        # Remove the "?" button by adjusting the window flags
-        self.setWindowFlags(self.windowFlags() & ~Qt.WindowContextHelpButtonHint)
-
-        layout = QVBoxLayout(self)
-
-        # Help content (update this content with the desired information)
-        help_content = """
-        <h2>File Search Pro - Help</h2>
-        <ul>
-            <li><b>Adding Directories:</b> Use the "Add Directory" button to select and index a directory.</li>
-            <li><b>Dynamic Updates are performed:</b>  If a file is removed,renamed or added to the directory you are indexing, it is automatically updated.</li>
-            <li><b>Refresh Index:</b> Use the "Refresh Index" button to refresh the index in the current directory to refresh your results list.</li>
-            <li><b>Deleting Directories:</b> Use the "Delete Directory" button to remove the current directory from the index and monitoring.</li>
-            <li><b>Filters:</b> Use the common file type and dev/engineering filters to narrow down your search results.</li>
-            <li><b>Real-Time Search:</b> Start typing in the search bar to filter the results based on file names.</li>
-            <li><b>Clear Search:</b> Use the "Clear Search" button to clear your search.</li>
-            <li><b>Add Tags:</b> Right-click on a file to add or edit tags. Tagged files are displayed with a yellow highlight.</li>
-            <li><b>Tags Info:</b> If someone renames a file in the original directory then your tag will disappear from that file in your index search results.</li>
-            <li><b>Search Tags:</b> In the real time search just type "tag:". All files with a tag in the current working directory will be displayed in your results.</li>
-            <li><b>Manage Tags:</b> Right-click on a file to add / edit or delete tags.</li>
-            <li><b>Opening Files:</b> Double-click a file in the list to open it with the default application.</li>
-            <li><b>Saving Files:</b> Right-click on a file and choose "Save As" to save it to a different location.</li>
-            <li><b>Email Files:</b> Right-click on a file and choose "Send As Email" to open and attach in an outlook email. Only works with Outlook...</li>
-            <li><b>Dark Mode:</b> Toggle dark mode using the "View Mode" menu.</li>
-            <li><b>Exclusions:</b> The application automatically excludes certain system directories like C:\\Windows and file types like .ini, .exe, .dll, .reg, etc.</li>
-        </ul>
-        """
-
-        # Add help content
-        help_text = QTextBrowser(self)
-        help_text.setHtml(help_content)
-        help_text.setReadOnly(True)
-        layout.addWidget(help_text)
-
-        # Close button
-        close_button = QPushButton("Close", self)
-        close_button.clicked.connect(self.close)
-        layout.addWidget(close_button)
-
-# Tag features
-class TagManager:
-    def __init__(self):
-        self.tags = {}
-        self.load_tags()
-
-    def load_tags(self):
-        """Loads tags from the JSON file."""
-        if os.path.exists(TAGS_FILE):
-            with open(TAGS_FILE, "r") as f:
-                self.tags = json.load(f)
-        else:
-            self.tags = {}
-
-    def save_tags(self):
-        """Saves tags to the JSON file."""
-        with open(TAGS_FILE, "w") as f:
-            json.dump(self.tags, f, indent=4)
-
-    def add_tag(self, file_path, tag):
-        """Adds a tag to a file."""
-        if file_path not in self.tags:
-            self.tags[file_path] = []
-        if tag not in self.tags[file_path]:
-            self.tags[file_path].append(tag)
-            self.save_tags()
-
-    def remove_tag(self, file_path, tag):
-        """Removes a tag from a file."""
-        if file_path in self.tags and tag in self.tags[file_path]:
-            self.tags[file_path].remove(tag)
-            if not self.tags[file_path]:  # Remove file if no tags left
-                del self.tags[file_path]
-            self.save_tags()
-
-    def get_tags(self, file_path):
-        """Gets tags for a file."""
-        return self.tags.get(file_path, [])
-    
-# Main application window event handler
-class FileMonitorHandler(FileSystemEventHandler):
-    def __init__(self, update_callback, remove_callback, rename_callback):
-        self.update_callback = update_callback
-        self.remove_callback = remove_callback
-        self.rename_callback = rename_callback
-
-    def on_created(self, event):
-        if not event.is_directory:
-            self.update_callback(event.src_path)
-
-    def on_modified(self, event):
-        if not event.is_directory:
-            self.update_callback(event.src_path)
-
-    def on_deleted(self, event):
-        if not event.is_directory:
-            self.remove_callback(event.src_path)
-
-    def on_moved(self, event):
-        if not event.is_directory:
-            self.rename_callback(event.src_path, event.dest_path)
-
-# Signal method to update progress
-class WorkerSignals(QObject):
-    progress = pyqtSignal(int)  # To update progress bar
-    indexing_complete = pyqtSignal()  # To notify when indexing is complete
-
-# Main window layout, features
-class FileSearcherApp(QMainWindow):
-    def __init__(self):
-        super().__init__()
-        self.setWindowTitle("File Search Pro Version 1.19")
-        self.setGeometry(100, 100, 900, 500)
-        self.tag_manager = TagManager()
-        # Initialize dark mode tracking
-        self.dark_mode_enabled = False
-        self.directories = []  # Store up to 10 directory paths
-        self.current_directory = None  # Currently selected directory
-        self.files = set()
-        self.last_modified_time = 0
-        self.lock = FileLock(f"{INDEX_FILE}.lock")
-        self.signals = WorkerSignals()
-        self.observer = None  # Watchdog observer for monitoring
-        self.files_lock = threading.Lock()  # Thread-safe lock for self.files
-
-        # Connect signals to GUI update methods
-        self.signals.progress.connect(self.update_progress_bar)
-        self.signals.indexing_complete.connect(self.on_indexing_complete)
-
-        if os.path.exists(ICON_FILE):
-            self.setWindowIcon(QIcon(ICON_FILE))
-
-        # Central widget and layout
-        self.central_widget = QWidget()
-        self.setCentralWidget(self.central_widget)
-        self.layout = QVBoxLayout(self.central_widget)
-
-        # Menu bar
-        menu_bar = self.menuBar()
-        # Add "View" menu for toggling themes
-        view_menu = QMenu("View Mode", self)
-        menu_bar.addMenu(view_menu)
-
-        # Add "Toggle Dark Mode" action
-        toggle_dark_mode_action = view_menu.addAction("Toggle Dark Mode")
-        toggle_dark_mode_action.triggered.connect(self.toggle_dark_mode)
-
-        # Help menu
-        help_menu = QMenu("Help", self)
-        menu_bar.addMenu(help_menu)
-
-        # Add "View Help" action
-        view_help_action = help_menu.addAction("View Help")
-        view_help_action.triggered.connect(self.show_help)
-
-        # Add Filter Dropdown
-        self.filter_dropdown = QComboBox(self)
-        self.filter_dropdown.addItem("Common Files Filter")  # Default option to show all files
-        self.filter_dropdown.addItems([".pdf", ".jpg", ".jpeg", ".doc", ".docx", ".xls", ".xlsx", ".png", ".ppt", ".pptx"])
-        self.filter_dropdown.currentIndexChanged.connect(self.apply_filter)  # Connect dropdown change to filter logic
-        self.layout.addWidget(self.filter_dropdown)
-
-        # Add Dev/Eng Filter Dropdown
-        self.dev_filter_dropdown = QComboBox(self)
-        self.dev_filter_dropdown.addItem("Dev/Eng Files Filter")  # Default option to show all files
-        self.dev_filter_dropdown.addItems([
-            ".js", ".py", ".java", ".cpp", ".c", ".cs", ".rb", ".php", ".html", ".css",
-            ".scss", ".ts", ".go", ".swift", ".kt", ".rs", ".sql", ".sh", ".bat", ".pl",
-            ".xml", ".json", ".yaml", ".yml", ".lua", ".asp", ".jsp", ".md", ".vue", ".jsx", ".tsx",
-            ".dwg", ".dxf", ".step", ".stp", ".iges", ".igs", ".prt", ".asm", ".sldprt",
-            ".sldasm", ".slddrw", ".stl", ".sch", ".brd", ".pcb", ".sp", ".dip", ".vsm", ".dsn", ".gbr"
-        ])
-        self.dev_filter_dropdown.currentIndexChanged.connect(self.apply_filter)
-        self.layout.addWidget(self.dev_filter_dropdown)
-
-
-        # Dropdown for directory selection
-        self.directory_dropdown = QComboBox(self)
-        self.directory_dropdown.setPlaceholderText("Select a directory")
-        self.directory_dropdown.currentIndexChanged.connect(self.change_directory)
-        self.layout.addWidget(self.directory_dropdown)
-
-        # Add Directory Button
-        self.add_directory_button = QPushButton("Add Directory", self)
-        self.add_directory_button.clicked.connect(self.add_directory)
-        self.layout.addWidget(self.add_directory_button)
-
-        # Add Delete Directory Button
-        self.delete_directory_button = QPushButton("Delete Directory", self)
-        self.delete_directory_button.clicked.connect(self.delete_directory)
-        self.layout.addWidget(self.delete_directory_button)
-
-
-        # Header
-        self.label_folder = QLabel("Monitoring Folder: None", self)
-        self.label_folder.setStyleSheet("color: green;")
-        self.layout.addWidget(self.label_folder)
-
-        # Search bar
-        self.search_bar = QLineEdit(self)
-        self.search_bar.setPlaceholderText("Real-Time-Search")
-        self.search_bar.textChanged.connect(self.filter_files)
-        self.layout.addWidget(self.search_bar)
-
-        # Clear Search button
-        self.clear_button = QPushButton("Clear Search", self)
-        self.clear_button.clicked.connect(self.clear_search)
-        self.clear_button.setStyleSheet("color: green;")
-        self.layout.addWidget(self.clear_button)
-
-        # Results list
-        self.result_list = QListWidget(self)
-        self.result_list.setContextMenuPolicy(Qt.CustomContextMenu)  # Enable custom context menu
-        self.result_list.customContextMenuRequested.connect(self.show_context_menu)
-        self.result_list.itemDoubleClicked.connect(self.open_file)
-        self.layout.addWidget(self.result_list)
-
-        # Progress bar
-        self.progress_bar = QProgressBar(self)
-        self.layout.addWidget(self.progress_bar)
-
-        # Refresh button
-        self.refresh_button = QPushButton("Refresh Index", self)
-        self.refresh_button.setStyleSheet("color: green;")
-        self.refresh_button.clicked.connect(self.refresh_files)
-        self.layout.addWidget(self.refresh_button)
-
-        # Initialize the app
-        self.load_or_index_files()
-        self.start_monitoring()
-
-
-    # Opens a selected file and attaches it in an emal automatically. OUTLOOK ONLY
-    def send_email(self, item):
-        """Sends the selected file as an email attachment using Outlook."""
-        # Retrieve the full file path from the item's data
-        selected_file = item.data(Qt.UserRole)
-        
-        if not selected_file or not os.path.exists(selected_file):
-            QMessageBox.critical(self, "Error", f"File not found: {selected_file}")
-            print(f"Error: File '{selected_file}' not found or no longer exists.")
-            return
-
-        try:
-            # Initialize Outlook application
-            outlook = win32com.client.Dispatch("Outlook.Application")
-            mail = outlook.CreateItem(0)  # Create a new email item
-
-            # Add details to the email
-            mail.Subject = "File Attachment"
-            mail.Body = "Please find the attached file."
-            mail.Attachments.Add(selected_file)  # Attach the selected file
-
-            # Display the email (for user to edit before sending)
-            mail.Display()
-            print(f"Email composed successfully with attachment: {selected_file}")
-        except Exception as e:
-            QMessageBox.critical(self, "Error", f"Failed to compose email: {e}")
-            print(f"Error sending email: {e}")
-
-    # Opens help menu
-    def show_help(self):
-        """Displays the Help dialog."""
-        help_dialog = HelpDialog(self)
-        help_dialog.exec_()
-
-    # These are the mouse right click functions
-    def show_context_menu(self, position):
-        """Displays the context menu when right-clicking on a file."""
-        item = self.result_list.itemAt(position)
-        if item:
-            context_menu = QMenu(self)
-            
-            save_as_action = context_menu.addAction("Save As...")
-            save_as_action.triggered.connect(lambda: self.save_file_as(item))
-
-            tag_action = context_menu.addAction("Add/Edit Tags")
-            tag_action.triggered.connect(lambda: self.manage_tags(item))
-
-            delete_tag_action = context_menu.addAction("Delete All Tags")
-            delete_tag_action.triggered.connect(lambda: self.delete_all_tags(item))
-
-            
-            send_email_action = context_menu.addAction("Send as Email...")
-            send_email_action.triggered.connect(lambda: self.send_email(item))
-
-            context_menu.exec_(self.result_list.mapToGlobal(position))
-
-
-    def delete_all_tags(self, item):
-        """Deletes all tags from a file after confirmation."""
-        selected_file = item.data(Qt.UserRole)
-        tags = self.tag_manager.get_tags(selected_file)
-
-        if tags:
-            reply = QMessageBox.question(self, "Delete All Tags", "Are you sure you want to delete all tags from this file?",
-                                        QMessageBox.Yes | QMessageBox.No, QMessageBox.No)
-            if reply == QMessageBox.Yes:
-                for tag in tags[:]:  # Iterate over a copy of the list
-                    self.tag_manager.remove_tag(selected_file, tag)
-                QMessageBox.information(self, "Tags Removed", "All tags have been removed from the file.")
-                self.refresh_files()  # Refresh the file list to reflect the changes
-        else:
-            QMessageBox.information(self, "No Tags", "This file does not have any tags to delete.")
-
-    # Add or edit tags
-    def manage_tags(self, item):
-        """Opens a dialog to add or remove tags for a file and updates the results list."""
-        # Retrieve the full file path from the item's data
-        selected_file = item.data(Qt.UserRole)
-
-        if not selected_file or not os.path.exists(selected_file):
-            QMessageBox.critical(self, "Error", f"File not found: {selected_file}")
-            print(f"Error: File '{selected_file}' not found or no longer exists.")
-            return
-
-        current_tags = self.tag_manager.get_tags(selected_file)
-
-        # Input dialog for managing tags
-        new_tags, ok = QInputDialog.getText(
-            self,
-            "Manage Tags",
-            "Enter tags separated by commas:",
-            text=", ".join(current_tags)
-        )
-
-        if ok:
-            # Update tags in TagManager
-            updated_tags = [tag.strip() for tag in new_tags.split(",") if tag.strip()]
-            self.tag_manager.tags[selected_file] = updated_tags
-            self.tag_manager.save_tags()
-
-            # Refresh the results list to display the updated tags
-            self.apply_filter()
-
-            QMessageBox.information(self, "Tags Updated", f"Tags for {os.path.basename(selected_file)} updated.")
-
-
-    # Saves a selected file to any location you want using a windows field dialog
-    def save_file_as(self, item):
-        """Opens a dialog for the user to save the selected file."""
-        # Retrieve the full file path from the item's data
-        selected_file = item.data(Qt.UserRole)
-
-        if not selected_file or not os.path.exists(selected_file):
-            QMessageBox.critical(self, "Error", f"File not found: {selected_file}")
-            print(f"Error: File '{selected_file}' not found or no longer exists.")
-            return
-
-        # Open a "Save As" dialog
-        target_path, _ = QFileDialog.getSaveFileName(self, "Save File As", os.path.basename(selected_file))
-        if target_path:
-            try:
-                shutil.copy(selected_file, target_path)  # Copy the file to the new location
-                QMessageBox.information(self, "File Saved", f"File saved to:\n{target_path}")
-                print(f"File saved to: {target_path}")
-            except Exception as e:
-                QMessageBox.critical(self, "Error", f"Failed to save file: {e}")
-                print(f"Error: Failed to save file '{selected_file}' with error: {e}")
-
-    # Toggles light & dark mode
-    def toggle_dark_mode(self):
-        """Toggles between dark mode and light mode."""
-        self.dark_mode_enabled = not self.dark_mode_enabled  # Toggle the mode
-        if self.dark_mode_enabled:
-            self.setStyleSheet(DARK_MODE_STYLESHEET)
-        else:
-            self.setStyleSheet(LIGHT_MODE_STYLESHEET)
-
-    # User slected file type filtering
-    def apply_filter(self):
-        """Filters the displayed results based on the selected file type and updates the list."""
-        file_type_filter = self.filter_dropdown.currentText()  # Existing file type filter
-        dev_filter = self.dev_filter_dropdown.currentText() if hasattr(self, 'dev_filter_dropdown') else "Dev/Eng Files Filter"
-        query = self.search_bar.text().strip().lower()
-        self.result_list.clear()
-
-        with self.files_lock:  # Safely access self.files
-            files_snapshot = list(self.files)
-
-        for file_path in files_snapshot:
-            file_name = os.path.basename(file_path).lower()
-            tags = ", ".join(self.tag_manager.get_tags(file_path))  # Get tags for the file
-            display_text = f"{file_name} [Tags: {tags}]" if tags else file_name
-
-            # Check if the file matches the filters
-            matches_file_type = file_type_filter == "Common Files Filter" or file_name.endswith(file_type_filter)
-            matches_dev_filter = dev_filter == "Dev/Eng Files Filter" or file_name.endswith(dev_filter)
-
-            # Apply the search query and both filters
-            if query in file_name and matches_file_type and matches_dev_filter:
-                # Create the QListWidgetItem
-                item = QListWidgetItem(display_text)
-                item.setData(Qt.UserRole, file_path)  # Store the full file path as data
-
-                # Highlight tags in light yellow if tags are present
-                if tags:
-                    item.setForeground(Qt.black)  # Default text color
-                    item.setBackground(Qt.yellow)  # Highlight tags in light yellow
-
-                # Add the item to the results list
-                self.result_list.addItem(item)
-
-
-    # Initially add your directory with system directory exclusions
-    def add_directory(self):
-        """Allows the user to add a directory and automatically index it."""
-        # Define excluded directories
-        excluded_directories = {
-    "C:\\Windows",
-    "C:\\Windows\\System32",
-    "C:\\Windows\\SysWOW64",
-    "C:\\Windows\\Temp",
-    "C:\\Windows\\Hyper-V",
-    "C:\\Program Files",
-    "C:\\Program Files (x86)",
-    "C:\\Recovery",
-    "C:\\System Volume Information",
-    "C:\\Perflogs",
-    "C:\\Users",
-    "C:\\Users\\AppData",
-    "C:\\$Recycle.Bin",
-    "C:\\Boot",
-    "C:\\EFI",
-    "Z:\\"
-}
-
-
-        directory = QFileDialog.getExistingDirectory(self, "Select Directory")
-        if directory:
-            if os.path.abspath(directory) in excluded_directories:
-                QMessageBox.warning(
-                    self,
-                    "Invalid Directory",
-                    f"The selected directory '{directory}' cannot be added as it is a protected system directory."
-                )
-                print(f"Attempted to add excluded directory: {directory}")
-                return
-
-            if directory in self.directories:
-                QMessageBox.warning(self, "Duplicate Directory", "This directory is already added.")
-                return
-
-            if len(self.directories) >= 10:
-                QMessageBox.warning(self, "Limit Reached", "You can only monitor up to 10 directories.")
-                return
-
-            # Add the new directory to the list and dropdown
-            self.directories.append(directory)
-            self.directory_dropdown.addItem(directory)
-            print(f"Added directory: {directory}")
-
-            # Automatically select and index the new directory
-            self.directory_dropdown.setCurrentIndex(self.directory_dropdown.count() - 1)
-            self.change_directory(self.directory_dropdown.currentIndex())
-
-    # Changes the working directory
-    def change_directory(self, index):
-        """Switches to the selected directory and updates the results list."""
-        if index >= 0 and index < len(self.directories):
-            self.current_directory = self.directories[index]
-            self.label_folder.setText(f"Monitoring Folder: {self.current_directory}")
-            self.files.clear()  # Clear the files list
-            self.result_list.clear()  # Clear the UI results list
-            print(f"Switched to directory: {self.current_directory}")
-
-
-            # Start indexing and update results after completion
-            def on_indexing_complete():
-                self.apply_filter()  # Apply filter to update results list
-                self.signals.indexing_complete.disconnect(on_indexing_complete)
-
-            self.signals.indexing_complete.connect(on_indexing_complete)
-            self.index_files()  # Start reindexing the new directory
-            self.start_monitoring()  # Restart monitoring for the new directory
-
-    # Monitors the current working directoies for any changes and dynamically updates them
-    def start_monitoring(self):
-        """Starts or restarts monitoring the folder for changes."""
-        if self.observer:
-            self.observer.stop()
-            self.observer.join()
-
-        if self.current_directory:
-            self.event_handler = FileMonitorHandler(
-                self.handle_file_event, self.handle_file_removed, self.handle_file_renamed
-            )
-            self.observer = Observer()
-            self.observer.schedule(self.event_handler, self.current_directory, recursive=True)
-            self.observer.start()
-            print(f"Monitoring started for directory: {self.current_directory}")
-
-    # Clear the current search and results list
-    def clear_search(self):
-        """Clears the search bar and refreshes the results list based on the selected filter."""
-        self.search_bar.clear()  # Clear the search query
-        self.result_list.clear()  # Clear the results list in the UI
-        self.apply_filter()  # Reapply the filter to reset the results list
-        self.result_list.clear()  # Clear the results list in the UI
-
-    def update_progress_bar(self, value):
-        """Update the progress bar safely from the signal."""
-        self.progress_bar.setValue(value)
-
-    def on_indexing_complete(self):
-        """Reset the progress bar when indexing is complete."""
-        self.progress_bar.setValue(0) 
-
-    def load_or_index_files(self):
-        """Loads the file index from disk or indexes the folder if needed."""
-        try:
-            with self.lock.acquire(timeout=10):  # Wait up to 10 seconds to acquire the lock
-                print("File lock acquired for reading index.")
-                if os.path.exists(INDEX_FILE):
-                    with open(INDEX_FILE, "r") as f:
-                        saved_data = json.load(f)
-                        self.directories = saved_data.get("directories", [])
-                        self.files = set(saved_data.get("files", []))
-                        self.last_modified_time = saved_data.get("last_modified_time", 0)
-
-                        # Populate the directory dropdown with saved directories
-                        self.directory_dropdown.clear()
-                        for directory in self.directories:
-                            self.directory_dropdown.addItem(directory)
-
-                        # Set the first directory as the current directory (if available)
-                        if self.directories:
-                            self.current_directory = self.directories[0]
-                            self.directory_dropdown.setCurrentIndex(0)
-                            self.label_folder.setText(f"Monitoring Folder: {self.current_directory}")
-                            print(f"Loaded directories: {self.directories}")
-                            print(f"Loaded {len(self.files)} files.")
-                        else:
-                            print("No directories found in saved index.")
-                else:
-                    print("No saved index file found.")
-        except Timeout:
-            QMessageBox.critical(self, "Error", "Could not acquire file lock for index file.")
-        finally:
-            print("File lock released after reading index.")
-
-
-    def delete_directory(self):
-        """Deletes the selected directory from the list after user confirmation."""
-        if not self.directories:
-            QMessageBox.warning(self, "No Directory", "No directories to delete.")
-            return
-
-        current_index = self.directory_dropdown.currentIndex()
-        if current_index < 0 or current_index >= len(self.directories):
-            QMessageBox.warning(self, "Invalid Selection", "Please select a valid directory to delete.")
-            return
-
-        directory_to_remove = self.directories[current_index]
-        reply = QMessageBox.question(
-            self,
-            "Confirm Deletion",
-            f"Are you sure you want to delete the directory:\n{directory_to_remove}?\n"
-            "This action will remove the directory from the index but will not delete its contents from the directory folder.",
-            QMessageBox.Yes | QMessageBox.No
-        )
-
-        if reply == QMessageBox.Yes:
-            # Remove the directory from the list
-            self.directories.pop(current_index)
-            self.directory_dropdown.removeItem(current_index)
-
-            # Clear the files if the current directory is deleted
-            if self.current_directory == directory_to_remove:
-                self.current_directory = None
-                self.files.clear()
-                self.result_list.clear()
-                self.label_folder.setText("Monitoring Folder: None")
-
-            # Save the updated state
-            self.save_index()
-            print(f"Deleted directory: {directory_to_remove}")
-        else:
-            print(f"Deletion canceled for directory: {directory_to_remove}")
-
-
-    def save_index(self):
-        """Saves the current index to disk."""
-        try:
-            with self.lock.acquire(timeout=10):  # Wait up to 10 seconds to acquire the lock
-                print("Saving index to JSON.")
-                with open(INDEX_FILE, "w") as f:
-                    json.dump(
-                        {
-                            "directories": self.directories,
-                            "last_modified_time": self.last_modified_time,
-                            "files": list(self.files),
-                        },
-                        f,
-                        indent=4  # Pretty print for easier debugging
-                    )
-                print(f"Index saved: {INDEX_FILE}")
-        except Timeout:
-            QMessageBox.critical(self, "Error", "Could not acquire file lock for saving index file.")
-        finally:
-            print("File lock released after saving index.")
-
-
-    def index_files(self):
-        """Indexes all files in the folder with real-time progress updates, excluding specific directories and file types."""
-        if not self.current_directory:
-            QMessageBox.warning(self, "No Directory", "Please select or add a directory to monitor.")
-            return
-
-        # Set the progress bar to 0% when indexing starts
-        self.progress_bar.setValue(0)
-        self.statusBar().setStyleSheet("color: red;")
-        self.statusBar().showMessage("Indexing Started, Please Wait...")
-
-        def scan_folder():
-            print(f"Starting indexing for directory: {self.current_directory}")
-            self.files.clear()
-            files = []
-
-            # Define excluded directories and file types
-            excluded_directories = {"C:\\Windows", "C:\\Program Files", "C:\\Program Files (x86)", "Z:\\"}
-            excluded_file_types = {".ini", ".tmp", ".bak", ".log", ".sys", ".dll", ".reg", ".cab", ".msi", ".drv", ".inf", ".db", ".ink", ".exe", ".scr"}
-
-            # Scan the directory and collect all files
-            for root, _, file_list in os.walk(self.current_directory):
-                # Skip excluded directories
-                if any(os.path.abspath(root).startswith(excluded) for excluded in excluded_directories):
-                    print(f"Skipping excluded directory: {root}")
-                    continue
-
-                for file in file_list:
-                    full_path = os.path.join(root, file)
-                    _, file_ext = os.path.splitext(full_path)
-
-                    # Skip excluded file types
-                    if file_ext.lower() in excluded_file_types:
-                        print(f"Skipping excluded file: {full_path}")
-                        continue
-
-                    files.append(full_path)
-
-            total_files = len(files)
-            if total_files == 0:
-                print("No valid files found in the directory.")
-                self.signals.progress.emit(100)  # Complete the progress bar
-                self.signals.indexing_complete.emit()
-                return
-
-            # Emit progress bar updates as files are indexed
-            current_progress = 0
-            for i, file_path in enumerate(files, start=1):
-                self.files.add(file_path)
-
-                # Update progress incrementally
-                new_progress = int((i / total_files) * 100)
-                if new_progress > current_progress:  # Emit only if progress has increased
-                    current_progress = new_progress
-                    self.signals.progress.emit(current_progress)
-                    self.statusBar().showMessage(f"Indexing progress: {current_progress}%")
-
-                print(f"Indexed: {file_path}")
-
-            # Save the index and signal completion
-            self.save_index()
-            self.signals.progress.emit(100)  # Ensure the progress bar reaches 100%
-            self.signals.indexing_complete.emit()
-            print(f"Indexing complete. Total files indexed: {len(self.files)}")
-            self.statusBar().setStyleSheet("color: green;")
-            self.statusBar().showMessage(f"Indexing Completed. Total files: {len(self.files)}")
-
-        # Start the background thread
-        self.indexing_thread = threading.Thread(target=scan_folder, daemon=True)
-        self.indexing_thread.start()
-
-
-
-    def is_safe_path(self, base_path, target_path):
-        """Ensure the target path is within the base path."""
-        base_path = os.path.abspath(base_path)
-        target_path = os.path.abspath(target_path)
-        return os.path.commonpath([base_path]) == os.path.commonpath([base_path, target_path])
-
-
-    def handle_file_event(self, file_path):
-        """Handles new or modified files detected by watchdog."""
-        if not self.is_safe_path(self.current_directory, file_path):
-            print(f"Blocked access to unsafe file path: {file_path}")
-            return
-
-        # Add the new or modified file to the index
-        if file_path not in self.files:
-            self.files.add(file_path)
-            self.save_index()  # Save the updated index
-            print(f"File added: {file_path}")
-
-
-    def handle_file_removed(self, file_path):
-        """Handles file removals detected by watchdog."""
-        if self.is_safe_path(self.current_directory, file_path):
-            if file_path in self.files:
-                self.files.discard(file_path)  # Remove the file from the index
-                self.save_index()  # Save the updated index
-                print(f"File removed: {file_path}")
-
-
-
-    def handle_file_renamed(self, old_path, new_path):
-        """Handles file renames or moves detected by watchdog."""
-        if not self.is_safe_path(self.current_directory, old_path) or not self.is_safe_path(self.current_directory, new_path):
-            print(f"Blocked unsafe rename/move: {old_path} -> {new_path}")
-            return
-
-        # Remove the old file and add the new one
-        if old_path in self.files:
-            self.files.remove(old_path)
-            self.result_list.clear()  # Clear the UI list to refresh
-
-        if new_path not in self.files:
-            self.files.add(new_path)
-            self.save_index()  # Save the updated index
-            print(f"File renamed: {old_path} -> {new_path}")
-
-
-    def filter_files(self):
-        """Filters the files based on the search query and selected file types."""
-        query = self.search_bar.text().strip().lower()
-        file_type_filter = self.filter_dropdown.currentText()
-        dev_filter = self.dev_filter_dropdown.currentText() if hasattr(self, 'dev_filter_dropdown') else "Dev Files Filter"
-        self.result_list.clear()
-
-        tag_search = False
-        if query.startswith("tag:"):
-            tag_search = True
-            query = query[4:].strip()  # Strip 'tag:' prefix
-
-        with self.files_lock:
-            files_snapshot = list(self.files)
-
-        for file_path in files_snapshot:
-            file_name = os.path.basename(file_path).lower()
-            tags = self.tag_manager.get_tags(file_path)
-            display_text = f"{file_name} [Tags: {', '.join(tags)}]" if tags else file_name
-
-            matches_file_type = file_type_filter == "Common Files Filter" or file_name.endswith(file_type_filter)
-            matches_dev_filter = dev_filter == "Dev/Eng Files Filter" or file_name.endswith(dev_filter)
-
-            if tag_search:
-                matches_query = any(query in tag.lower() for tag in tags)
-            else:
-                matches_query = query in file_name
-
-            if matches_query and matches_file_type and matches_dev_filter:
-                item = QListWidgetItem(display_text)
-                item.setData(Qt.UserRole, file_path)
-                if tags:
-                    item.setForeground(Qt.black)
-                    item.setBackground(Qt.yellow)
-                self.result_list.addItem(item)
-
-
-
-    def refresh_files(self):
-        """Refreshes the file list for the current directory and includes tags in the display."""
-        if not self.current_directory:
-            QMessageBox.warning(self, "No Directory", "Please select or add a directory to monitor.")
-            return
-
-        self.result_list.clear()  # Clear the results list in the UI
-
-        # Reindex the files
-        self.index_files()
-
-        # Apply the selected filter directly after reindexing
-        self.apply_filter()
-
-        # Use a snapshot of files to avoid threading issues
-        files_snapshot = list(self.files)  # Create a list copy of the set
-
-        for file_path in files_snapshot:
-            file_name = os.path.basename(file_path)
-            tags = ", ".join(self.tag_manager.get_tags(file_path))  # Get tags for the file
-            display_text = f"{file_name} [Tags: {tags}]" if tags else file_name
-            self.result_list.addItem(display_text)
-
-        print(f"File list refreshed for directory: {self.current_directory}")
-
-
-    def open_file(self, item):
-        """Opens a file with the default application."""
-        # Retrieve the full file path from the item's data
-        selected_file = item.data(Qt.UserRole)  # Fetch the stored file path
-
-        if not selected_file or not os.path.exists(selected_file):
-            QMessageBox.critical(self, "Error", f"File not found: {selected_file}")
-            print(f"Error: File '{selected_file}' not found or no longer exists.")
-            return
-
-        try:
-            # Use os.startfile to open the file with the default application
-            os.startfile(selected_file)
-            print(f"Opened file: {selected_file}")
-        except FileNotFoundError:
-            QMessageBox.critical(self, "Error", f"File no longer exists: {selected_file}")
-            print(f"Error: File '{selected_file}' does not exist.")
-        except OSError as e:
-            QMessageBox.critical(self, "Error", f"Failed to open file: {e}")
-            print(f"Error: Failed to open file '{selected_file}' with error: {e}")
-
-
-
-    def closeEvent(self, event):
-        """Handles application close event."""
-        # Check if indexing is in progress
-        if hasattr(self, "indexing_thread") and self.indexing_thread.is_alive():
-            reply = QMessageBox.question(
-                self,
-                "Indexing in Progress",
-                "Indexing is currently in progress. Do you want to cancel indexing and close the application?",
-                QMessageBox.Yes | QMessageBox.No
-            )
-
-            if reply == QMessageBox.Yes:
-                # Attempt to stop the indexing thread
-                try:
-                    self.indexing_thread.join(timeout=2)  # Allow the thread to terminate gracefully
-                    if self.indexing_thread.is_alive():
-                        QMessageBox.warning(self, "Indexing Interrupted", "Indexing thread could not be stopped.")
-                    else:
-                        print("Indexing thread stopped.")
-                except Exception as e:
-                    QMessageBox.critical(self, "Error", f"Failed to stop indexing thread: {e}")
-                    print(f"Error stopping indexing thread: {e}")
-            else:
-                event.ignore()  # Cancel the close event
-                return
-
-        # Stop monitoring
-        if hasattr(self, "observer") and self.observer is not None:
-            try:
-                self.observer.stop()
-                self.observer.join()
-                print("Observer stopped.")
-            except Exception as e:
-                print(f"Error stopping observer: {e}")
-
-        # Final cleanup
-        print("Application closing.")
-        event.accept()  # Accept the close event
-
-
-
-if __name__ == "__main__":
-    import sys
-
-    app = QApplication(sys.argv)
-    window = FileSearcherApp()
-    window.show()
-    sys.exit(app.exec_())
-
-
+"""
+File Search Pro
+Copyright (C) 2024 [Kristopher Sorensen]
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program. If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import time
+
+STARTUP_STARTED = time.perf_counter()  # Taken before the other imports, so the startup report includes them
+
+import os
+import sys
+import shutil
+import logging
+import sqlite3
+import multiprocessing
+import threading
+from array import array
+from PyQt5.QtWidgets import (
+    QApplication, QMainWindow, QLabel, QLineEdit, QTreeView, QHeaderView, QPushButton, QProgressBar,
+    QVBoxLayout, QWidget, QMessageBox, QFileDialog, QComboBox, QMenu, QInputDialog, QTextBrowser, QDialog, QMenuBar,
+    QCheckBox, QTreeWidget, QTreeWidgetItem, QPlainTextEdit
+)
+from PyQt5.QtCore import pyqtSignal, QObject, Qt, QAbstractTableModel, QModelIndex, QTimer
+from PyQt5.QtGui import QIcon, QBrush, QFontDatabase
+from fs_engine import SearchEngine
+from fs_engine.config import DEFAULT_EXCLUSION_RULES, SERVICE_MAX_SEARCH_PAGE_SIZE
+from fs_engine.metrics import write_metrics
+from fs_engine.query import explain_text
+from fs_engine.service import ServiceClient, ServiceError
+
+# Application files live in the same directory as the script or .exe
+if getattr(sys, 'frozen', False):
+    APP_DIR = os.path.dirname(sys.executable)
+else:
+    APP_DIR = os.path.dirname(os.path.abspath(__file__))
+
+ICON_FILE = os.path.join(APP_DIR, "FS-ICO.ico")
+SEARCH_DEBOUNCE_MS = 150  # Wait for a pause in typing before starting a search
+FILTER_COUNTS_INTERVAL_MS = 1000  # How often the file type dropdowns pick up counts changed by file events
+ALL_DIRECTORIES = "All Directories"  # First directory dropdown entry, searches every directory
+RESULT_COLUMNS = (("Name", "name"), ("Size", "size"), ("Modified", "modified"))  # Header label, engine sort column
+STARTUP_FALLBACK_MS = 500  # Start loading the index even if the window has not been painted by then
+STATS_REFRESH_MS = 1000  # How often the Stats dialog re-reads the engine metrics
+
+DARK_MODE_STYLESHEET = """
+    QMainWindow {
+        background-color: #2b2b2b;
+        color: #ffffff;
+    }
+    QLabel, QLineEdit, QTreeView, QHeaderView::section, QPushButton, QComboBox {
+        color: #ffffff;
+        background-color: #3c3f41;
+        border: 1px solid #555555;
+    }
+    QPushButton:hover {
+        background-color: #555555;
+    }
+    QProgressBar {
+        background-color: #3c3f41;
+        color: #ffffff;
+        border: 1px solid #555555;
+        text-align: center;
+    }
+    QProgressBar::chunk {
+        background-color: #85c1e9;
+    }
+"""
+
+LIGHT_MODE_STYLESHEET = """
+    QMainWindow {
+        background-color: #f0f0f0;
+        color: #000000;
+    }
+    QLabel, QLineEdit, QTreeView, QHeaderView::section, QPushButton, QComboBox {
+        color: #000000;
+        background-color: #ffffff;
+        border: 1px solid #cccccc;
+    }
+    QPushButton:hover {
+        background-color: #e6e6e6;
+    }
+    QProgressBar {
+        background-color: #ffffff;
+        color: #000000;
+        border: 1px solid #cccccc;
+        text-align: center;
+    }
+    QProgressBar::chunk {
+        background-color: #4caf50;
+    }
+"""
+# Help menu items
+class HelpDialog(QDialog):
+    """Custom dialog for displaying the Help information."""
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Help")
+        self.setGeometry(200, 200, 600, 400)
+        # Remove the "?" button by adjusting the window flags
+        self.setWindowFlags(self.windowFlags() & ~Qt.WindowContextHelpButtonHint)
+
+        layout = QVBoxLayout(self)
+
+        # Help content (update this content with the desired information)
+        help_content = """
+        <h2>File Search Pro - Help</h2>
+        <ul>
+            <li><b>Adding Directories:</b> Use the "Add Directory" button to select and index a directory.</li>
+            <li><b>Dynamic Updates are performed:</b>  If a file is removed,renamed or added to the directory you are indexing, it is automatically updated.</li>
+            <li><b>Network Drives:</b> Folders on network drives often send no change notifications. File Search Pro checks them for changes in the background instead, more often while files keep changing and less often when they are quiet or slow to read. Other folders are checked every few minutes too, and are checked more often if changes were missed.</li>
+            <li><b>Refresh Index:</b> Use the "Refresh Index" button to refresh the index in the current directory to refresh your results list.</li>
+            <li><b>Stats:</b> Choose "Stats..." in the Options menu for live indexing, file event, database, lock and search timings. "Save Metrics..." writes them to a JSON file, or to a Prometheus text file when the name ends in .prom.</li>
+            <li><b>Stop Indexing:</b> Choose "Stop Indexing" in the Options menu, or close the application, to stop a long scan. The next "Refresh Index" or start picks up where it stopped instead of starting over.</li>
+            <li><b>All Directories:</b> Every added directory stays indexed and monitored. Select "All Directories" in the directory dropdown to search all of them at once.</li>
+            <li><b>Deleting Directories:</b> Use the "Delete Directory" button to remove the current directory from the index and monitoring.</li>
+            <li><b>Filters:</b> Use the common file type and dev/engineering filters to narrow down your search results.</li>
+            <li><b>Real-Time Search:</b> Start typing in the search bar to filter the results based on file names. Every word must match, e.g. "motor drawing" finds "drawing_motor_v2.dwg". Quote a phrase to keep it together: "motor drawing".</li>
+            <li><b>Search Syntax:</b> Use "*" and "?" for wildcards ("report_??.pdf"), /slashes/ or "re:" for a regular expression ("/v\\d+\\.docx$/"), "ext:pdf,docx" for file types and "path:projects/2024" to match the folder. Combine terms with OR, put NOT or "-" before a term to exclude it and group with parentheses, e.g. "(invoice OR receipt) ext:pdf -draft".</li>
+            <li><b>Explain Search:</b> Choose "Explain Search..." in the Options menu to see how the current search runs: which index finds the candidates first and how many files each step keeps.</li>
+            <li><b>Size and Date Filters:</b> Add "size:", "modified:" or "created:" to the search, e.g. "report size:>100MB" or "modified:<7d" for files changed in the last 7 days. Use &lt;, &lt;=, &gt;, &gt;= or a range like "size:1MB..1GB" and "modified:2024-01-01..2024-06-30".</li>
+            <li><b>Sorting:</b> Click the Name, Size or Modified column header to sort the results, click it again to reverse the order.</li>
+            <li><b>Fuzzy Search:</b> Tick "Fuzzy Search" to match letters in order rather than an exact substring, e.g. "mtrdwg" finds "motor_drawing.dwg". The best 1000 matches are listed first, preferring matches at the start of words and an exact extension.</li>
+            <li><b>Search File Contents:</b> Turn on "Index File Contents" in the Options menu, then type "content:" followed by words, e.g. "content:connection timeout". Text and source files containing every word are listed with the first matching line.</li>
+            <li><b>Clear Search:</b> Use the "Clear Search" button to clear your search.</li>
+            <li><b>Add Tags:</b> Right-click on a file to add or edit tags. Tagged files are displayed with a yellow highlight.</li>
+            <li><b>Tags Info:</b> Tags follow a file when it is renamed or moved within your monitored directories, even if that happens while File Search Pro is closed.</li>
+            <li><b>Search Tags:</b> In the real time search just type "tag:". All files with a tag in the current working directory will be displayed in your results. "tag:client" lists the files with a tag containing "client", and it combines with other terms, e.g. "tag:client ext:pdf".</li>
+            <li><b>Manage Tags:</b> Right-click on a file to add / edit or delete tags.</li>
+            <li><b>Opening Files:</b> Double-click a file in the list to open it with the default application.</li>
+            <li><b>Saving Files:</b> Right-click on a file and choose "Save As" to save it to a different location.</li>
+            <li><b>Email Files:</b> Right-click on a file and choose "Send As Email" to open and attach in an outlook email. Only works with Outlook...</li>
+            <li><b>Dark Mode:</b> Toggle dark mode using the "View Mode" menu.</li>
+            <li><b>Duplicate Files:</b> Choose "Find Duplicate Files..." in the Options menu to list files with identical contents in the selected directories. Files are compared by size first and only read when sizes match; later runs only read files that changed.</li>
+            <li><b>Exclusions:</b> The application automatically excludes certain system directories like C:\\Windows and file types like .ini, .exe, .dll, .reg, etc. Choose "Exclusion Rules..." in the Options menu to add gitignore-style rules to the selected directory, one per line: <i>node_modules/</i> skips those directories and everything in them, <i>*.tmp</i> skips matching names, <i>/build/</i> only the top-level build directory, <i>docs/**/*.pdf</i> a path pattern, <i>size:&gt;1GB</i> large files, and <i>!keep.log</i> brings back a file an earlier rule excluded.</li>
+        </ul>
+        """
+
+        # Add help content
+        help_text = QTextBrowser(self)
+        help_text.setHtml(help_content)
+        help_text.setReadOnly(True)
+        layout.addWidget(help_text)
+
+        # Close button
+        close_button = QPushButton("Close", self)
+        close_button.clicked.connect(self.close)
+        layout.addWidget(close_button)
+
+# Duplicate files report
+class DuplicateSignals(QObject):
+    group_found = pyqtSignal(object, str, list)  # size, hash, paths of one confirmed group
+    finished = pyqtSignal()
+
+
+class DuplicatesDialog(QDialog):
+    """Lists groups of identical files in the selected directories as they are confirmed.
+
+    The search runs on a background thread and stops when the dialog is closed.
+    Hashes are cached in the index, so running it again only reads changed files.
+    """
+    def __init__(self, engine, roots, open_file, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Duplicate Files")
+        self.setGeometry(200, 200, 800, 500)
+        self.setWindowFlags(self.windowFlags() & ~Qt.WindowContextHelpButtonHint)
+        self.engine = engine
+        self.cancelled = False
+        self.groups = 0
+        self.wasted = 0
+
+        layout = QVBoxLayout(self)
+        self.status_label = QLabel("Searching for duplicate files...", self)
+        layout.addWidget(self.status_label)
+
+        self.tree = QTreeWidget(self)
+        self.tree.setHeaderLabels(["File", "Size"])
+        self.tree.header().setSectionResizeMode(0, QHeaderView.Stretch)
+        self.tree.header().setStretchLastSection(False)
+        # Double-clicking a file opens it, group rows carry no path
+        self.tree.doubleClicked.connect(lambda index: index.data(Qt.UserRole) and open_file(index))
+        layout.addWidget(self.tree)
+
+        close_button = QPushButton("Close", self)
+        close_button.clicked.connect(self.close)
+        layout.addWidget(close_button)
+
+        self.signals = DuplicateSignals()
+        self.signals.group_found.connect(self.add_group)
+        self.signals.finished.connect(self.search_finished)
+        threading.Thread(target=self.find_duplicates, args=(roots,), daemon=True).start()
+
+    def find_duplicates(self, roots):
+        """Runs on the background thread."""
+        try:
+            for size, digest, file_paths in self.engine.find_duplicates(roots, is_cancelled=lambda: self.cancelled):
+                self.signals.group_found.emit(size, digest, file_paths)
+        except sqlite3.Error as e:
+            print(f"Error finding duplicate files: {e}")
+        self.signals.finished.emit()
+
+    def add_group(self, size, digest, file_paths):
+        """Adds one confirmed group of identical files."""
+        group = QTreeWidgetItem(self.tree, [f"{len(file_paths)} identical files", format_size(size)])
+        group.setToolTip(0, digest)
+        for file_path in file_paths:
+            item = QTreeWidgetItem(group, [file_path, format_size(size)])
+            item.setData(0, Qt.UserRole, file_path)
+        group.setExpanded(True)
+        self.groups += 1
+        self.wasted += size * (len(file_paths) - 1)
+        self.status_label.setText(f"Searching... {self.groups} groups found, {format_size(self.wasted)} in extra copies.")
+
+    def search_finished(self):
+        if not self.cancelled:
+            self.status_label.setText(f"Done: {self.groups} groups found, {format_size(self.wasted)} in extra copies.")
+
+    def closeEvent(self, event):
+        self.cancelled = True
+        super().closeEvent(event)
+
+    def reject(self):
+        self.cancelled = True
+        super().reject()
+
+# Engine metrics
+def format_metric(name, value):
+    """Returns a metric value as text: durations in milliseconds, histograms as count, mean, p95 and max."""
+    if isinstance(value, dict):
+        return (
+            f"count {value['count']:,}, mean {value['mean'] * 1000:.1f} ms, "
+            f"p95 {value['p95'] * 1000:.1f} ms, max {value['max'] * 1000:.1f} ms"
+        )
+    if name.endswith("_seconds"):
+        return f"{value * 1000:.1f} ms"
+    return f"{value:,}"
+
+
+class ServiceMetrics:
+    """The metrics of the index service, read like the engine's Metrics by StatsDialog and write_metrics()."""
+    def __init__(self, request):
+        self.request = request  # (op, **arguments) -> result, see FileSearcherApp.service_request()
+
+    def snapshot(self):
+        return self.request("metrics")
+
+    def prometheus_text(self):
+        return self.request("metrics", prometheus=True)
+
+
+class StatsDialog(QDialog):
+    """Shows the engine metrics, re-read every STATS_REFRESH_MS while the dialog is open.
+
+    metrics is the engine's Metrics, or ServiceMetrics while the index service owns the index.
+    """
+    def __init__(self, metrics, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Stats")
+        self.setGeometry(200, 200, 900, 500)
+        self.setWindowFlags(self.windowFlags() & ~Qt.WindowContextHelpButtonHint)
+        self.metrics = metrics
+        self.items = {}  # (metric name, labels) -> tree item, updated in place so the view keeps its scroll position
+
+        layout = QVBoxLayout(self)
+        self.tree = QTreeWidget(self)
+        self.tree.setHeaderLabels(["Metric", "Labels", "Value"])
+        self.tree.setRootIsDecorated(False)
+        self.tree.header().setSectionResizeMode(2, QHeaderView.Stretch)
+        layout.addWidget(self.tree)
+
+        save_button = QPushButton("Save Metrics...", self)
+        save_button.clicked.connect(self.save_metrics)
+        layout.addWidget(save_button)
+
+        close_button = QPushButton("Close", self)
+        close_button.clicked.connect(self.close)
+        layout.addWidget(close_button)
+
+        self.refresh_timer = QTimer(self)
+        self.refresh_timer.timeout.connect(self.refresh)
+        self.refresh_timer.start(STATS_REFRESH_MS)
+        self.refresh()
+        for column in (0, 1):
+            self.tree.resizeColumnToContents(column)
+
+    def refresh(self):
+        try:
+            snapshot = self.metrics.snapshot()
+        except ServiceError as e:
+            print(f"Could not read the index service metrics: {e}")
+            return
+        for section in ("counters", "gauges", "histograms"):
+            for entry in snapshot[section]:
+                labels = ", ".join(f"{key}={value}" for key, value in entry["labels"].items())
+                key = (entry["name"], labels)
+                item = self.items.get(key)
+                if item is None:
+                    item = self.items[key] = QTreeWidgetItem(self.tree, [entry["name"], labels, ""])
+                item.setText(2, format_metric(entry["name"], entry["value"]))
+
+    def save_metrics(self):
+        file_path, _ = QFileDialog.getSaveFileName(
+            self, "Save Metrics", "metrics.json", "JSON (*.json);;Prometheus text (*.prom);;All Files (*)"
+        )
+        if not file_path:
+            return
+        try:
+            write_metrics(self.metrics, file_path)
+            print(f"Metrics saved to: {file_path}")
+        except (OSError, ServiceError) as e:
+            QMessageBox.critical(self, "Error", f"Could not save metrics: {e}")
+
+    def done(self, result):
+        self.refresh_timer.stop()
+        super().done(result)
+
+
+class ExplainDialog(QDialog):
+    """Shows how the current search is evaluated: the plan for each directory and the candidates each stage kept."""
+    def __init__(self, explanation, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Explain Search")
+        self.setGeometry(200, 200, 900, 500)
+        self.setWindowFlags(self.windowFlags() & ~Qt.WindowContextHelpButtonHint)
+
+        layout = QVBoxLayout(self)
+        plan_text = QTextBrowser(self)
+        plan_text.setFont(QFontDatabase.systemFont(QFontDatabase.FixedFont))
+        plan_text.setLineWrapMode(QTextBrowser.NoWrap)
+        plan_text.setPlainText(explain_text(explanation))
+        layout.addWidget(plan_text)
+
+        close_button = QPushButton("Close", self)
+        close_button.clicked.connect(self.close)
+        layout.addWidget(close_button)
+
+class ExclusionRulesDialog(QDialog):
+    """Edits the exclusion rules of one directory, one gitignore-style rule per line."""
+    def __init__(self, directory, rules, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Exclusion Rules")
+        self.setGeometry(200, 200, 600, 450)
+        self.setWindowFlags(self.windowFlags() & ~Qt.WindowContextHelpButtonHint)
+
+        layout = QVBoxLayout(self)
+        layout.addWidget(QLabel(f"Rules for {directory}, one per line, e.g. node_modules/, *.tmp, /build/, size:>1GB, !keep.log", self))
+        self.rules_edit = QPlainTextEdit(self)
+        self.rules_edit.setFont(QFontDatabase.systemFont(QFontDatabase.FixedFont))
+        self.rules_edit.setPlainText("\n".join(rules))
+        layout.addWidget(self.rules_edit)
+
+        defaults_label = QLabel(f"Always excluded first: {' '.join(DEFAULT_EXCLUSION_RULES)}", self)
+        defaults_label.setWordWrap(True)
+        layout.addWidget(defaults_label)
+
+        save_button = QPushButton("Save and Rescan", self)
+        save_button.clicked.connect(self.accept)
+        layout.addWidget(save_button)
+
+    def rules(self):
+        return self.rules_edit.toPlainText().splitlines()
+
+# Virtualized results model
+def format_size(size):
+    """Returns a file size as short human readable text, e.g. "1.5 MB"."""
+    for unit in ("bytes", "KB", "MB", "GB"):
+        if size < 1024:
+            return f"{size} {unit}" if unit == "bytes" else f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} TB"
+
+
+class ResultListModel(QAbstractTableModel):
+    """Table model over the matching files: name, size and modified time.
+
+    Paths, display text and tag highlighting are computed in data() for visible rows
+    only. Size and time come from the index, nothing is stat'ed while scrolling.
+    """
+    def __init__(self, engine, parent=None):
+        super().__init__(parent)
+        self.engine = engine  # Resolves refs with path_of() and metadata_of(), the SearchEngine or ServiceResults
+        self.tag_manager = engine.tag_manager
+        self.results = array("Q")  # Result refs of the matching files, 8 bytes per row
+        self.snippets = {}  # File path -> (line, text) when the query has a content: term
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.results)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(RESULT_COLUMNS)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if orientation == Qt.Horizontal and role == Qt.DisplayRole:
+            return RESULT_COLUMNS[section][0]
+        return None
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or index.row() >= len(self.results):
+            return None
+        ref = self.results[index.row()]
+        file_path = self.engine.path_of(ref)
+        if file_path is None:
+            return None  # The directory was removed since the query ran
+
+        if role == Qt.UserRole:
+            return file_path  # Full file path used by the context menu actions
+        if role == Qt.DisplayRole and index.column() > 0:
+            size, mtime, _ = self.engine.metadata_of(ref)
+            if index.column() == 1:
+                return format_size(size)
+            return time.strftime("%Y-%m-%d %H:%M", time.localtime(mtime)) if mtime else ""
+        if role == Qt.TextAlignmentRole and index.column() == 1:
+            return Qt.AlignRight | Qt.AlignVCenter
+        if role == Qt.DisplayRole:
+            file_name = os.path.basename(file_path).lower()
+            tags = self.tag_manager.get_tags(file_path)
+            text = f"{file_name} [Tags: {', '.join(tags)}]" if tags else file_name
+            snippet = self.snippets.get(file_path)
+            return f"{text}    line {snippet[0]}: {snippet[1]}" if snippet else text
+        if role == Qt.BackgroundRole and self.tag_manager.get_tags(file_path):
+            return QBrush(Qt.yellow)  # Highlight tagged files in yellow
+        if role == Qt.ForegroundRole and self.tag_manager.get_tags(file_path):
+            return QBrush(Qt.black)
+        return None
+
+    def set_results(self, results, snippets=None):
+        """Replaces the displayed results with a new list of result refs."""
+        self.beginResetModel()
+        self.results = array("Q", results)
+        self.snippets = snippets if snippets is not None else {}  # The service adds the snippets of later pages
+        self.endResetModel()
+
+    def append_results(self, results):
+        """Appends a page of result refs streamed from a running query."""
+        if not results:
+            return
+        first_row = len(self.results)
+        self.beginInsertRows(QModelIndex(), first_row, first_row + len(results) - 1)
+        self.results.extend(results)
+        self.endInsertRows()
+
+    def clear(self):
+        """Removes all displayed results."""
+        self.set_results([])
+
+    def set_engine(self, engine):
+        """Resolves refs with another engine from now on, e.g. ServiceResults once the index service is found."""
+        self.beginResetModel()
+        self.engine = engine
+        self.tag_manager = engine.tag_manager
+        self.results = array("Q")
+        self.snippets = {}
+        self.endResetModel()
+
+
+class ServiceResults:
+    """Answers searches through the index service, in place of the SearchEngine, when the service owns the index.
+
+    The window then holds no index of its own. A search streams pages of paths,
+    sizes and modified times from the service, and its refs are the search's
+    serial number in the high 32 bits and a row of its pages in the low ones. The
+    rows of the previous search stay readable until the new one's first page
+    replaces them on screen.
+    """
+    def __init__(self, request):
+        self.request = request  # (op, **arguments) -> result, see FileSearcherApp.service_request()
+        self.tag_manager = self  # Tags come with the result pages
+        self.serial = 0
+        self.searches = {}  # Serial -> {"paths", "sizes", "modified", "tags", "snippets"} of the pages received
+
+    def search(self, query, roots, suffixes, fuzzy, sort, descending, is_cancelled=None):
+        """Yields the refs of a search's results, requesting the next page once the last one is used up.
+
+        Runs on the query worker thread. Raises ServiceError if the service cannot answer.
+        """
+        self.serial += 1
+        serial = self.serial
+        rows = {"paths": [], "sizes": [], "modified": [], "tags": {}, "snippets": {}}
+        self.searches[serial] = rows
+        self.searches.pop(serial - 2, None)
+        offset = 0
+        limit = QueryExecutor.FIRST_PAGE_SIZE  # A small first page, so results appear at once
+        while offset is not None and not (is_cancelled is not None and is_cancelled()):
+            page = self.request(
+                "search", query=query, roots=roots, suffixes=suffixes, limit=limit, offset=offset, fuzzy=fuzzy, sort=sort,
+                descending=descending
+            )
+            first_row = len(rows["paths"])
+            rows["tags"].update(page["tags"])
+            rows["snippets"].update(page["snippets"])
+            rows["sizes"].extend(page["sizes"])
+            rows["modified"].extend(page["modified"])
+            rows["paths"].extend(page["paths"])  # Last, the GUI thread reads a row once its path is there
+            yield from range(serial << 32 | first_row, serial << 32 | len(rows["paths"]))
+            offset = page["next_offset"]
+            limit = SERVICE_MAX_SEARCH_PAGE_SIZE
+
+    def row(self, ref):
+        """Returns (rows of the ref's search, row number), or (None, None) if the search was dropped."""
+        rows = self.searches.get(ref >> 32)
+        row = ref & 0xFFFFFFFF
+        return (rows, row) if rows is not None and row < len(rows["paths"]) else (None, None)
+
+    def path_of(self, ref):
+        rows, row = self.row(ref)
+        return None if rows is None else rows["paths"][row]
+
+    def metadata_of(self, ref):
+        """Returns (size, mtime, None), the service sends no creation times."""
+        rows, row = self.row(ref)
+        return None if rows is None else (rows["sizes"][row], rows["modified"][row], None)
+
+    def snippets_of(self, ref):
+        """Returns the content snippets by path of the ref's search, filled in as its pages arrive."""
+        rows = self.searches.get(ref >> 32)
+        return None if rows is None else rows["snippets"]
+
+    def get_tags(self, file_path):
+        for rows in list(self.searches.values()):
+            tags = rows["tags"].get(file_path)
+            if tags is not None:
+                return tags
+        return []
+
+# Background query execution
+class QueryExecutor(QObject):
+    """Debounces queries and matches them on a worker thread.
+
+    Every query gets a generation number. A running query stops as soon as a newer
+    one is submitted, and pages from older generations are dropped by the receiver.
+    """
+    results_page = pyqtSignal(int, list)  # generation, page of matching result refs
+
+    FIRST_PAGE_SIZE = 200  # Sent as soon as it fills so results appear before the match finishes
+    PAGE_SIZE = 20000
+    CANCEL_CHECK_INTERVAL = 4096  # Candidates checked between generation checks
+
+    def __init__(self, prepare_query, record_query=None, parent=None):
+        super().__init__(parent)
+        self.prepare_query = prepare_query  # (params, is_cancelled) -> (candidate result refs, predicate or None)
+        self.record_query = record_query  # (params, seconds), called for every query that runs to completion
+        self.generation = 0
+        self.debounce_params = None
+        self.pending_params = None
+        self.condition = threading.Condition()
+        self.running = True
+
+        self.debounce_timer = QTimer(self)
+        self.debounce_timer.setSingleShot(True)
+        self.debounce_timer.timeout.connect(self.start_pending)
+
+        self.worker_thread = threading.Thread(target=self.run, daemon=True)
+        self.worker_thread.start()
+
+    def submit(self, params, delay=SEARCH_DEBOUNCE_MS):
+        """Schedules a query, replacing any query still waiting for the debounce delay."""
+        self.debounce_params = params
+        self.debounce_timer.start(delay)
+
+    def start_pending(self):
+        """Hands the debounced query to the worker and invalidates the running one."""
+        with self.condition:
+            self.generation += 1
+            self.pending_params = (self.generation, self.debounce_params)
+            self.condition.notify()
+
+    def is_current(self, generation):
+        """Returns True if no newer query has been started."""
+        return generation == self.generation
+
+    def stop(self):
+        """Stops the worker thread and cancels the running query."""
+        self.debounce_timer.stop()
+        with self.condition:
+            self.running = False
+            self.generation += 1
+            self.condition.notify()
+
+    def run(self):
+        while True:
+            with self.condition:
+                while self.running and self.pending_params is None:
+                    self.condition.wait()
+                if not self.running:
+                    return
+                generation, params = self.pending_params
+                self.pending_params = None
+            try:
+                self.execute(generation, params)
+            except Exception as e:
+                print(f"Error running query: {e}")
+
+    def execute(self, generation, params):
+        started = time.perf_counter()
+        candidates, predicate = self.prepare_query(params, lambda: generation != self.generation)
+        page = []
+        page_size = self.FIRST_PAGE_SIZE
+
+        for checked, ref in enumerate(candidates, start=1):
+            if checked % self.CANCEL_CHECK_INTERVAL == 0 and generation != self.generation:
+                return  # A newer query replaced this one, drop the partial results
+            if predicate is None or predicate(ref):
+                page.append(ref)
+                if len(page) >= page_size:
+                    self.results_page.emit(generation, page)
+                    page = []
+                    page_size = self.PAGE_SIZE
+
+        if generation == self.generation:
+            self.results_page.emit(generation, page)  # Final page, possibly empty
+            if self.record_query is not None:
+                self.record_query(params, time.perf_counter() - started)
+
+# Startup timing
+class StartupTimer:
+    """Seconds from launch to each startup stage, printed and saved in the index once startup indexing completes."""
+    def __init__(self, started):
+        self.started = started
+        self.stages = {}  # Stage name -> seconds since launch, in the order reached
+
+    def mark(self, stage):
+        self.stages[stage] = round(time.perf_counter() - self.started, 3)
+
+    def report(self):
+        return ", ".join(f"{stage} {seconds:.2f}s" for stage, seconds in self.stages.items())
+
+
+# Signal method to update progress
+class WorkerSignals(QObject):
+    progress = pyqtSignal(int)  # To update progress bar
+    files_loaded = pyqtSignal()  # To show the stored index before the scan finishes
+    indexing_complete = pyqtSignal()  # To notify when indexing is complete
+
+# Main window layout, features
+class FileSearcherApp(QMainWindow):
+    def __init__(self):
+        super().__init__()
+        self.startup_timer = StartupTimer(STARTUP_STARTED)
+        self.startup_timer.mark("imports")
+        self.started_up = False
+        self.setWindowTitle("File Search Pro Version 1.19")
+        self.setGeometry(100, 100, 900, 500)
+        self.engine = SearchEngine()  # Indexing, persistence, watching and matching
+        self.tag_manager = self.engine.tag_manager
+        self.service_connected = False  # True while an index service owns the index, see connect_service()
+        self.service_results = ServiceResults(self.service_request)  # Searches through the service
+        # Initialize dark mode tracking
+        self.dark_mode_enabled = False
+        self.current_directory = None  # Currently selected directory, None for all directories
+        self.signals = WorkerSignals()
+
+        # Connect signals to GUI update methods
+        self.signals.progress.connect(self.update_progress_bar)
+        self.signals.files_loaded.connect(self.apply_filter)
+        self.signals.indexing_complete.connect(self.on_indexing_complete)
+        self.signals.indexing_complete.connect(self.apply_filter)
+
+        if os.path.exists(ICON_FILE):
+            self.setWindowIcon(QIcon(ICON_FILE))
+
+        # Central widget and layout
+        self.central_widget = QWidget()
+        self.setCentralWidget(self.central_widget)
+        self.layout = QVBoxLayout(self.central_widget)
+
+        # Menu bar
+        menu_bar = self.menuBar()
+        # Add "View" menu for toggling themes
+        view_menu = QMenu("View Mode", self)
+        menu_bar.addMenu(view_menu)
+
+        # Add "Toggle Dark Mode" action
+        toggle_dark_mode_action = view_menu.addAction("Toggle Dark Mode")
+        toggle_dark_mode_action.triggered.connect(self.toggle_dark_mode)
+
+        # Options menu
+        options_menu = QMenu("Options", self)
+        menu_bar.addMenu(options_menu)
+
+        # Content indexing is off by default, it reads every text and source file once
+        self.content_indexing_action = options_menu.addAction("Index File Contents")
+        self.content_indexing_action.setCheckable(True)
+        self.content_indexing_action.toggled.connect(self.toggle_content_indexing)
+
+        # Duplicate report over the directories selected in the dropdown
+        find_duplicates_action = options_menu.addAction("Find Duplicate Files...")
+        find_duplicates_action.triggered.connect(self.show_duplicates)
+
+        # Stops the running scans, the next refresh resumes them
+        stop_indexing_action = options_menu.addAction("Stop Indexing")
+        stop_indexing_action.triggered.connect(self.stop_indexing)
+
+        # Live engine metrics, can be saved as JSON or Prometheus text
+        stats_action = options_menu.addAction("Stats...")
+        stats_action.triggered.connect(self.show_stats)
+
+        # Query plan of the current search with per-stage candidate counts
+        explain_action = options_menu.addAction("Explain Search...")
+        explain_action.triggered.connect(self.show_explain)
+
+        # Gitignore-style rules of the selected directory
+        exclusion_rules_action = options_menu.addAction("Exclusion Rules...")
+        exclusion_rules_action.triggered.connect(self.show_exclusion_rules)
+
+        # Help menu
+        help_menu = QMenu("Help", self)
+        menu_bar.addMenu(help_menu)
+
+        # Add "View Help" action
+        view_help_action = help_menu.addAction("View Help")
+        view_help_action.triggered.connect(self.show_help)
+
+        # Add Filter Dropdown
+        self.filter_dropdown = QComboBox(self)
+        self.filter_dropdown.addItem("Common Files Filter")  # Default option to show all files
+        for extension in [".pdf", ".jpg", ".jpeg", ".doc", ".docx", ".xls", ".xlsx", ".png", ".ppt", ".pptx"]:
+            self.filter_dropdown.addItem(extension, extension)  # The label gets a file count, the data keeps the extension
+        self.filter_dropdown.currentIndexChanged.connect(self.apply_filter)  # Connect dropdown change to filter logic
+        self.layout.addWidget(self.filter_dropdown)
+
+        # Add Dev/Eng Filter Dropdown
+        self.dev_filter_dropdown = QComboBox(self)
+        self.dev_filter_dropdown.addItem("Dev/Eng Files Filter")  # Default option to show all files
+        for extension in [
+            ".js", ".py", ".java", ".cpp", ".c", ".cs", ".rb", ".php", ".html", ".css",
+            ".scss", ".ts", ".go", ".swift", ".kt", ".rs", ".sql", ".sh", ".bat", ".pl",
+            ".xml", ".json", ".yaml", ".yml", ".lua", ".asp", ".jsp", ".md", ".vue", ".jsx", ".tsx",
+            ".dwg", ".dxf", ".step", ".stp", ".iges", ".igs", ".prt", ".asm", ".sldprt",
+            ".sldasm", ".slddrw", ".stl", ".sch", ".brd", ".pcb", ".sp", ".dip", ".vsm", ".dsn", ".gbr"
+        ]:
+            self.dev_filter_dropdown.addItem(extension, extension)
+        self.dev_filter_dropdown.currentIndexChanged.connect(self.apply_filter)
+        self.layout.addWidget(self.dev_filter_dropdown)
+
+        # Per extension counts come from the engine's extension facet, which file events keep current
+        self.filter_counts_timer = QTimer(self)
+        self.filter_counts_timer.timeout.connect(self.update_filter_counts)
+        self.filter_counts_timer.start(FILTER_COUNTS_INTERVAL_MS)
+
+
+        # Dropdown for directory selection
+        self.directory_dropdown = QComboBox(self)
+        self.directory_dropdown.setPlaceholderText("Select a directory")
+        self.directory_dropdown.addItem(ALL_DIRECTORIES)
+        self.directory_dropdown.currentIndexChanged.connect(self.change_directory)
+        self.layout.addWidget(self.directory_dropdown)
+
+        # Add Directory Button
+        self.add_directory_button = QPushButton("Add Directory", self)
+        self.add_directory_button.clicked.connect(self.add_directory)
+        self.layout.addWidget(self.add_directory_button)
+
+        # Add Delete Directory Button
+        self.delete_directory_button = QPushButton("Delete Directory", self)
+        self.delete_directory_button.clicked.connect(self.delete_directory)
+        self.layout.addWidget(self.delete_directory_button)
+
+
+        # Header
+        self.label_folder = QLabel("Monitoring Folder: None", self)
+        self.label_folder.setStyleSheet("color: green;")
+        self.layout.addWidget(self.label_folder)
+
+        # Search bar
+        self.search_bar = QLineEdit(self)
+        self.search_bar.setPlaceholderText("Real-Time-Search")
+        self.search_bar.textChanged.connect(self.filter_files)
+        self.query_executor = QueryExecutor(self.prepare_query, self.record_query, self)
+        self.query_executor.results_page.connect(self.on_results_page)
+        self.displayed_generation = 0  # Generation whose results are currently in the list
+        self.layout.addWidget(self.search_bar)
+
+        # Fuzzy search toggle, ranks the best matches instead of listing every substring match
+        self.fuzzy_checkbox = QCheckBox("Fuzzy Search (best matches first)", self)
+        self.fuzzy_checkbox.toggled.connect(self.apply_filter)
+        self.layout.addWidget(self.fuzzy_checkbox)
+
+        # Clear Search button
+        self.clear_button = QPushButton("Clear Search", self)
+        self.clear_button.clicked.connect(self.clear_search)
+        self.clear_button.setStyleSheet("color: green;")
+        self.layout.addWidget(self.clear_button)
+
+        # Results list, only visible rows are rendered
+        self.result_model = ResultListModel(self.engine, self)
+        self.result_list = QTreeView(self)
+        self.result_list.setModel(self.result_model)
+        self.result_list.setRootIsDecorated(False)
+        self.result_list.setUniformRowHeights(True)  # Skip measuring every row when the model resets
+        # Clicking a column header sorts by it in the engine, the model itself never sorts
+        self.sort_column = None  # None keeps the index order
+        self.sort_descending = False
+        header = self.result_list.header()
+        header.setSectionResizeMode(0, QHeaderView.Stretch)
+        header.setStretchLastSection(False)
+        header.setSectionsClickable(True)
+        header.setSortIndicatorShown(False)
+        header.sectionClicked.connect(self.sort_results)
+        self.result_list.setContextMenuPolicy(Qt.CustomContextMenu)  # Enable custom context menu
+        self.result_list.customContextMenuRequested.connect(self.show_context_menu)
+        self.result_list.doubleClicked.connect(self.open_file)
+        self.layout.addWidget(self.result_list)
+
+        # Progress bar
+        self.progress_bar = QProgressBar(self)
+        self.layout.addWidget(self.progress_bar)
+
+        # Refresh button
+        self.refresh_button = QPushButton("Refresh Index", self)
+        self.refresh_button.setStyleSheet("color: green;")
+        self.refresh_button.clicked.connect(self.refresh_files)
+        self.layout.addWidget(self.refresh_button)
+
+        # The saved index is loaded once the window is on screen, see paintEvent()
+        self.startup_timer.mark("window")
+        QTimer.singleShot(STARTUP_FALLBACK_MS, self.start_up)
+
+    def paintEvent(self, event):
+        super().paintEvent(event)
+        if not self.started_up:
+            self.startup_timer.mark("first_paint")
+            QTimer.singleShot(0, self.start_up)  # After this paint, so loading never delays the first frame
+
+    def start_up(self):
+        """Loads the saved directories and starts loading, indexing and watching them in the background. Runs once."""
+        if self.started_up:
+            return
+        self.started_up = True
+        self.load_or_index_files()
+
+    # Index service
+    def connect_service(self):
+        """Returns True if an index service (python -m fs_engine serve) runs for the index database.
+
+        The service then owns the index and this window holds none: searches, explain,
+        counts, tag writes and rescans are sent to the service, which keeps the index
+        current by watching and reconciling.
+        """
+        try:
+            self.service_request("ping")
+        except ServiceError:
+            return False
+        return True
+
+    def service_request(self, op, **arguments):
+        """Sends one request to the index service on a connection of its own, so any thread can send one."""
+        with ServiceClient(self.engine.index_store.db_path) as client:
+            return client.request(op, **arguments)
+
+    def in_process(self, feature):
+        """Returns True if the index runs in process, or tells the user that the index service manages the feature."""
+        if not self.service_connected:
+            return True
+        QMessageBox.information(
+            self, "Index Service",
+            f"{feature} is not available from this window while the index service is running. "
+            "Stop the service and restart File Search Pro to use it."
+        )
+        return False
+
+    def get_file_tags(self, file_path):
+        """Returns the tags of a file, from the index service if it is running. Returns None if that failed."""
+        if not self.service_connected:
+            return self.tag_manager.get_tags(file_path)
+        try:
+            return self.service_request("tags", path=file_path)
+        except ServiceError as e:
+            QMessageBox.critical(self, "Error", f"Could not read tags: {e}")
+            print(f"Could not read tags from the index service: {e}")
+            return None
+
+    def set_file_tags(self, file_path, tags):
+        """Replaces the tags of a file, through the index service if it is running. Returns False if that failed."""
+        if not self.service_connected:
+            self.tag_manager.set_tags(file_path, tags)
+            return True
+        try:
+            self.service_request("set_tags", path=file_path, tags=tags)
+        except ServiceError as e:
+            QMessageBox.critical(self, "Error", f"Could not save tags: {e}")
+            print(f"Could not save tags through the index service: {e}")
+            return False
+        return True
+
+    def file_counts(self, roots):
+        """Returns {"files": indexed files, "extensions": {extension: files}} of directories, from the service if it runs."""
+        if self.service_connected:
+            return self.service_request("counts", roots=roots)
+        return {"files": self.engine.file_count(roots), "extensions": self.engine.extension_counts(roots)}
+
+    @property
+    def directories(self):
+        """Monitored directory paths (up to 10), owned by the engine."""
+        return self.engine.directories
+
+    # Opens a selected file and attaches it in an emal automatically. OUTLOOK ONLY
+    def send_email(self, item):
+        """Sends the selected file as an email attachment using Outlook."""
+        # Retrieve the full file path from the item's data
+        selected_file = item.data(Qt.UserRole)
+        
+        if not selected_file or not os.path.exists(selected_file):
+            QMessageBox.critical(self, "Error", f"File not found: {selected_file}")
+            print(f"Error: File '{selected_file}' not found or no longer exists.")
+            return
+
+        try:
+            # Imported here, pywin32 is only needed for this one action
+            import win32com.client
+        except ImportError:
+            QMessageBox.critical(self, "Error", "Sending email needs Microsoft Outlook and the pywin32 package.")
+            print("Error sending email: pywin32 is not installed.")
+            return
+
+        try:
+            # Initialize Outlook application
+            outlook = win32com.client.Dispatch("Outlook.Application")
+            mail = outlook.CreateItem(0)  # Create a new email item
+
+            # Add details to the email
+            mail.Subject = "File Attachment"
+            mail.Body = "Please find the attached file."
+            mail.Attachments.Add(selected_file)  # Attach the selected file
+
+            # Display the email (for user to edit before sending)
+            mail.Display()
+            print(f"Email composed successfully with attachment: {selected_file}")
+        except Exception as e:
+            QMessageBox.critical(self, "Error", f"Failed to compose email: {e}")
+            print(f"Error sending email: {e}")
+
+    # Opens help menu
+    def show_help(self):
+        """Displays the Help dialog."""
+        help_dialog = HelpDialog(self)
+        help_dialog.exec_()
+
+    # These are the mouse right click functions
+    def show_context_menu(self, position):
+        """Displays the context menu when right-clicking on a file."""
+        item = self.result_list.indexAt(position)
+        if item.isValid():
+            context_menu = QMenu(self)
+            
+            save_as_action = context_menu.addAction("Save As...")
+            save_as_action.triggered.connect(lambda: self.save_file_as(item))
+
+            tag_action = context_menu.addAction("Add/Edit Tags")
+            tag_action.triggered.connect(lambda: self.manage_tags(item))
+
+            delete_tag_action = context_menu.addAction("Delete All Tags")
+            delete_tag_action.triggered.connect(lambda: self.delete_all_tags(item))
+
+            
+            send_email_action = context_menu.addAction("Send as Email...")
+            send_email_action.triggered.connect(lambda: self.send_email(item))
+
+            context_menu.exec_(self.result_list.mapToGlobal(position))
+
+
+    def delete_all_tags(self, item):
+        """Deletes all tags from a file after confirmation."""
+        selected_file = item.data(Qt.UserRole)
+        tags = self.get_file_tags(selected_file)
+        if tags is None:
+            return
+
+        if tags:
+            reply = QMessageBox.question(self, "Delete All Tags", "Are you sure you want to delete all tags from this file?",
+                                        QMessageBox.Yes | QMessageBox.No, QMessageBox.No)
+            if reply == QMessageBox.Yes:
+                if not self.set_file_tags(selected_file, []):  # One write of the tags file
+                    return
+                QMessageBox.information(self, "Tags Removed", "All tags have been removed from the file.")
+                self.apply_filter()  # Refresh the results list to reflect the changes
+        else:
+            QMessageBox.information(self, "No Tags", "This file does not have any tags to delete.")
+
+    # Add or edit tags
+    def manage_tags(self, item):
+        """Opens a dialog to add or remove tags for a file and updates the results list."""
+        # Retrieve the full file path from the item's data
+        selected_file = item.data(Qt.UserRole)
+
+        if not selected_file or not os.path.exists(selected_file):
+            QMessageBox.critical(self, "Error", f"File not found: {selected_file}")
+            print(f"Error: File '{selected_file}' not found or no longer exists.")
+            return
+
+        current_tags = self.get_file_tags(selected_file)
+        if current_tags is None:
+            return
+
+        # Input dialog for managing tags
+        new_tags, ok = QInputDialog.getText(
+            self,
+            "Manage Tags",
+            "Enter tags separated by commas:",
+            text=", ".join(current_tags)
+        )
+
+        if ok:
+            # Update tags in TagManager
+            updated_tags = [tag.strip() for tag in new_tags.split(",") if tag.strip()]
+            if not self.set_file_tags(selected_file, updated_tags):
+                return
+
+            # Refresh the results list to display the updated tags
+            self.apply_filter()
+
+            QMessageBox.information(self, "Tags Updated", f"Tags for {os.path.basename(selected_file)} updated.")
+
+
+    # Saves a selected file to any location you want using a windows field dialog
+    def save_file_as(self, item):
+        """Opens a dialog for the user to save the selected file."""
+        # Retrieve the full file path from the item's data
+        selected_file = item.data(Qt.UserRole)
+
+        if not selected_file or not os.path.exists(selected_file):
+            QMessageBox.critical(self, "Error", f"File not found: {selected_file}")
+            print(f"Error: File '{selected_file}' not found or no longer exists.")
+            return
+
+        # Open a "Save As" dialog
+        target_path, _ = QFileDialog.getSaveFileName(self, "Save File As", os.path.basename(selected_file))
+        if target_path:
+            try:
+                shutil.copy(selected_file, target_path)  # Copy the file to the new location
+                QMessageBox.information(self, "File Saved", f"File saved to:\n{target_path}")
+                print(f"File saved to: {target_path}")
+            except Exception as e:
+                QMessageBox.critical(self, "Error", f"Failed to save file: {e}")
+                print(f"Error: Failed to save file '{selected_file}' with error: {e}")
+
+    # Toggles light & dark mode
+    def toggle_content_indexing(self, enabled):
+        """Turns the content index on (indexing every directory) or off (dropping it)."""
+        if not self.in_process("Content indexing"):
+            self.content_indexing_action.blockSignals(True)
+            self.content_indexing_action.setChecked(not enabled)
+            self.content_indexing_action.blockSignals(False)
+            return
+        try:
+            self.engine.set_content_indexing(enabled)
+        except sqlite3.Error as e:
+            QMessageBox.critical(self, "Error", f"Could not save index database: {e}")
+            return
+        print(f"Content indexing {'enabled' if enabled else 'disabled'}.")
+        if enabled and self.directories:
+            self.index_files(self.directories)
+
+    def show_duplicates(self):
+        """Opens the duplicate files report for the selected directories."""
+        if not self.directories:
+            QMessageBox.information(self, "Duplicate Files", "Add a directory first.")
+            return
+        if not self.in_process("Finding duplicate files"):
+            return
+        duplicates_dialog = DuplicatesDialog(self.engine, self.selected_roots(), self.open_file, self)
+        duplicates_dialog.exec_()
+
+    def show_stats(self):
+        """Opens the Stats dialog."""
+        stats_dialog = StatsDialog(ServiceMetrics(self.service_request) if self.service_connected else self.engine.metrics, self)
+        stats_dialog.exec_()
+
+    def show_explain(self):
+        """Opens the query plan of the current search."""
+        params = self.search_params()
+        if self.service_connected:
+            try:
+                explanation = self.service_request(
+                    "explain", query=params["query"], roots=params["roots"], suffixes=self.query_suffixes(params)
+                )
+            except ServiceError as e:
+                QMessageBox.critical(self, "Error", f"Could not explain the search: {e}")
+                return
+        else:
+            explanation = self.engine.explain(params["query"], params["roots"], self.query_suffixes(params))
+        explain_dialog = ExplainDialog(explanation, self)
+        explain_dialog.exec_()
+
+    def show_exclusion_rules(self):
+        """Edits the exclusion rules of the selected directory and rescans what they change."""
+        if not self.current_directory:
+            QMessageBox.information(self, "Exclusion Rules", "Select a directory in the dropdown first.")
+            return
+        if not self.in_process("Exclusion rules"):
+            return
+        root = self.current_directory
+        rules_dialog = ExclusionRulesDialog(root, self.engine.exclusion_rules.get(root, []), self)
+        if not rules_dialog.exec_():
+            return
+        try:
+            self.engine.set_exclusion_rules(root, rules_dialog.rules())
+        except ValueError as e:
+            QMessageBox.warning(self, "Exclusion Rules", str(e))
+            return
+        except sqlite3.Error as e:
+            QMessageBox.critical(self, "Error", f"Could not save index database: {e}")
+            return
+        self.run_query(delay=0)
+        self.index_files([root])
+
+    def toggle_dark_mode(self):
+        """Toggles between dark mode and light mode."""
+        self.dark_mode_enabled = not self.dark_mode_enabled  # Toggle the mode
+        if self.dark_mode_enabled:
+            self.setStyleSheet(DARK_MODE_STYLESHEET)
+        else:
+            self.setStyleSheet(LIGHT_MODE_STYLESHEET)
+
+    # User slected file type filtering
+    def apply_filter(self):
+        """Filters the displayed results based on the selected file type and updates the list."""
+        self.run_query(delay=0)
+
+
+    # Initially add your directory with system directory exclusions
+    def add_directory(self):
+        """Allows the user to add a directory and automatically index it."""
+        if not self.in_process("The directory list"):
+            return
+        directory = QFileDialog.getExistingDirectory(self, "Select Directory")
+        if directory:
+            try:
+                self.engine.add_directory(directory)  # Rejects protected, duplicate and over the limit directories
+            except ValueError as e:
+                QMessageBox.warning(self, "Invalid Directory", str(e))
+                print(f"Could not add directory {directory}: {e}")
+                return
+            except sqlite3.Error as e:
+                QMessageBox.critical(self, "Error", f"Could not save index database: {e}")
+                return
+
+            # Add the new directory to the dropdown
+            self.directory_dropdown.addItem(directory)
+            print(f"Added directory: {directory}")
+
+            # Index and watch the new directory, then select it
+            self.index_files([directory])
+            self.start_monitoring()
+            self.directory_dropdown.setCurrentIndex(self.directory_dropdown.count() - 1)
+
+    # Changes the working directory
+    def change_directory(self, index):
+        """Switches to the selected directory, or all directories, and updates the results list."""
+        if index == 0:
+            self.current_directory = None
+            self.label_folder.setText(f"Monitoring Folder: {ALL_DIRECTORIES}")
+        elif 0 < index <= len(self.directories):
+            self.current_directory = self.directories[index - 1]
+            self.label_folder.setText(f"Monitoring Folder: {self.current_directory}")
+        else:
+            return
+        print(f"Switched to directory: {self.current_directory or ALL_DIRECTORIES}")
+
+        # Every shard is already indexed and watched, so switching only re-runs the query
+        self.update_filter_counts()
+        self.apply_filter()
+
+    def selected_roots(self):
+        """Returns the directories covered by the current dropdown selection."""
+        return [self.current_directory] if self.current_directory else list(self.directories)
+
+    # Monitors the current working directoies for any changes and dynamically updates them
+    def start_monitoring(self):
+        """Starts monitoring every directory for changes."""
+        self.engine.start_watching()
+
+    # Clear the current search and results list
+    def clear_search(self):
+        """Clears the search bar and refreshes the results list based on the selected filter."""
+        self.search_bar.clear()  # Clear the search query
+        self.apply_filter()  # Reapply the filter to reset the results list
+
+    def update_progress_bar(self, value):
+        """Update the progress bar safely from the signal."""
+        self.progress_bar.setValue(value)
+        if 0 < value < 100:
+            self.statusBar().showMessage(f"Indexing progress: {value}%")
+
+    def on_indexing_complete(self):
+        """Reset the progress bar when indexing is complete."""
+        self.progress_bar.setValue(0) 
+        self.update_filter_counts()
+
+    def update_filter_counts(self):
+        """Shows the number of indexed files of each type in the selected directories in the filter dropdowns."""
+        try:
+            counts = self.file_counts(self.selected_roots())["extensions"]
+        except ServiceError:
+            return  # Tried again by the next tick of the timer
+        for dropdown in (self.filter_dropdown, self.dev_filter_dropdown):
+            for index in range(1, dropdown.count()):
+                extension = dropdown.itemData(index)
+                text = f"{extension} ({counts.get(extension, 0):,})"
+                if dropdown.itemText(index) != text:
+                    dropdown.setItemText(index, text)
+
+    def load_or_index_files(self):
+        """Loads the saved directories and indexes all of them in the background."""
+        try:
+            self.engine.load()
+        except sqlite3.Error as e:
+            QMessageBox.critical(self, "Error", f"Could not read index database: {e}")
+            return
+        self.service_connected = self.connect_service()
+        if self.service_connected:
+            self.result_model.set_engine(self.service_results)
+            print("Connected to the index service, it scans and watches the directories.")
+
+        # Populate the directory dropdown with saved directories
+        self.directory_dropdown.blockSignals(True)
+        self.directory_dropdown.clear()
+        self.directory_dropdown.addItem(ALL_DIRECTORIES)
+        for directory in self.directories:
+            self.directory_dropdown.addItem(directory)
+        self.directory_dropdown.blockSignals(False)
+
+        self.content_indexing_action.blockSignals(True)
+        self.content_indexing_action.setChecked(self.engine.content_indexing)
+        self.content_indexing_action.blockSignals(False)
+
+        # Set the first directory as the current directory (if available)
+        self.startup_timer.mark("directories")
+        if self.directories:
+            self.directory_dropdown.setCurrentIndex(1)
+            print(f"Loaded directories: {self.directories}")
+            self.index_files(self.directories, startup=True)
+        else:
+            print("No directories found in saved index.")
+
+
+    def delete_directory(self):
+        """Deletes the selected directory from the list after user confirmation."""
+        if not self.directories:
+            QMessageBox.warning(self, "No Directory", "No directories to delete.")
+            return
+        if not self.in_process("The directory list"):
+            return
+
+        current_index = self.directory_dropdown.currentIndex() - 1  # Index 0 is "All Directories"
+        if current_index < 0 or current_index >= len(self.directories):
+            QMessageBox.warning(self, "Invalid Selection", "Please select a valid directory to delete.")
+            return
+
+        directory_to_remove = self.directories[current_index]
+        reply = QMessageBox.question(
+            self,
+            "Confirm Deletion",
+            f"Are you sure you want to delete the directory:\n{directory_to_remove}?\n"
+            "This action will remove the directory from the index but will not delete its contents from the directory folder.",
+            QMessageBox.Yes | QMessageBox.No
+        )
+
+        if reply == QMessageBox.Yes:
+            # Stop watching the directory and remove it from the index
+            try:
+                self.engine.remove_directory(directory_to_remove)
+            except sqlite3.Error as e:
+                QMessageBox.critical(self, "Error", f"Could not save index database: {e}")
+
+            # Removing the item selects a neighbouring entry, which refreshes the results
+            self.directory_dropdown.removeItem(current_index + 1)
+            print(f"Deleted directory: {directory_to_remove}")
+        else:
+            print(f"Deletion canceled for directory: {directory_to_remove}")
+
+
+    def index_files(self, roots=None, startup=False):
+        """Loads and incrementally re-indexes the given directories (default: the selected ones) in the background.
+
+        At startup the thread also starts watching, and times each stage for the startup report.
+        """
+        roots = roots if roots is not None else self.selected_roots()
+        if not roots:
+            QMessageBox.warning(self, "No Directory", "Please select or add a directory to monitor.")
+            return
+
+        # Set the progress bar to 0% when indexing starts
+        self.progress_bar.setValue(0)
+        self.statusBar().setStyleSheet("color: red;")
+        self.statusBar().showMessage("Indexing Started, Please Wait...")
+
+        def on_loaded(root):
+            if startup:
+                self.startup_timer.mark("index_loaded")  # The last directory's time is kept
+            self.signals.files_loaded.emit()  # Show the stored index first
+
+        def scan_folders():
+            complete = False
+            try:
+                if self.service_connected:
+                    complete = self.rescan_with_service(roots, startup)
+                else:
+                    if startup:
+                        # Scheduling recursive watches walks every tree on some platforms, so it stays off the GUI thread
+                        self.start_monitoring()
+                        self.startup_timer.mark("watching")
+                    # A directory that is already being scanned is not scanned twice, this waits for that scan
+                    scans = self.engine.index_directories(roots, on_progress=self.signals.progress.emit, on_loaded=on_loaded)
+                    complete = len(scans) == len(roots) and not any(scan.cancelled for scan in scans.values())
+                if startup:
+                    self.startup_timer.mark("indexed")
+                    print(f"Startup: {self.startup_timer.report()}")
+                    self.engine.save_startup_report(self.startup_timer.stages)
+            except sqlite3.Error as e:
+                print(f"Could not update index database: {e}")
+
+            # Signal completion
+            self.signals.progress.emit(100)  # Ensure the progress bar reaches 100%
+            self.signals.indexing_complete.emit()
+            try:
+                total_files = self.file_counts(roots)["files"]
+            except ServiceError as e:
+                total_files = f"unknown ({e})"
+            if not complete:
+                print(f"Indexing stopped. Total files indexed: {total_files}")
+                self.statusBar().setStyleSheet("color: red;")
+                self.statusBar().showMessage(f"Indexing Stopped, Refresh Index to resume. Total files: {total_files}")
+                return
+            print(f"Indexing complete. Total files indexed: {total_files}")
+            self.statusBar().setStyleSheet("color: green;")
+            self.statusBar().showMessage(f"Indexing Completed. Total files: {total_files}")
+
+        # Start the background thread
+        self.indexing_thread = threading.Thread(target=scan_folders, daemon=True)
+        self.indexing_thread.start()
+
+
+
+    def rescan_with_service(self, roots, startup):
+        """Has the index service rescan directories and returns True if the rescan completed. Runs on the indexing thread.
+
+        Nothing is rescanned at startup, the service keeps its index current.
+        """
+        if startup:
+            return True
+        try:
+            return self.service_request("index", roots=roots, wait=True)["complete"]
+        except ServiceError as e:
+            print(f"The index service could not rescan: {e}")
+            return False
+
+    def stop_indexing(self):
+        """Cancels the running scans. They stop after the directories being listed and resume on the next refresh."""
+        if self.service_connected:
+            print("Scans run in the index service, they cannot be stopped from here.")
+            return
+        if hasattr(self, "indexing_thread") and self.indexing_thread.is_alive():
+            self.engine.cancel_indexing(timeout=0)
+            print("Stopping indexing...")
+
+
+    def filter_files(self):
+        """Filters the files based on the search query once typing pauses."""
+        self.run_query(delay=SEARCH_DEBOUNCE_MS)
+
+
+    def run_query(self, delay):
+        """Submits the current search bar and filter state to the background query executor."""
+        self.query_executor.submit(self.search_params(), delay)
+
+
+    def search_params(self):
+        """Returns the current search bar, filter and sort state as query parameters."""
+        return {
+            "roots": self.selected_roots(),
+            "query": self.search_bar.text().strip(),
+            "file_type_filter": self.filter_dropdown.currentData(),
+            "dev_filter": self.dev_filter_dropdown.currentData() if hasattr(self, 'dev_filter_dropdown') else None,
+            "fuzzy": self.fuzzy_checkbox.isChecked(),
+            "sort": self.sort_column,
+            "descending": self.sort_descending,
+        }
+
+
+    def sort_results(self, section):
+        """Sorts the results by a clicked column header, a second click on the same column reverses the order."""
+        column = RESULT_COLUMNS[section][1]
+        self.sort_descending = column == self.sort_column and not self.sort_descending
+        self.sort_column = column
+        header = self.result_list.header()
+        header.setSortIndicatorShown(True)
+        header.setSortIndicator(section, Qt.DescendingOrder if self.sort_descending else Qt.AscendingOrder)
+        self.run_query(delay=0)
+
+
+    @staticmethod
+    def query_suffixes(params):
+        """Returns the file type suffixes selected in the filter dropdowns, whose default entries carry none."""
+        return [selected for selected in (params["file_type_filter"], params["dev_filter"]) if selected]
+
+    def prepare_query(self, params, is_cancelled=None):
+        """Returns the candidate files and the per-file predicate for a query. Runs on the query worker thread."""
+        if self.service_connected:
+            results = self.service_results.search(
+                params["query"], params["roots"], self.query_suffixes(params), params["fuzzy"], params["sort"],
+                params["descending"], is_cancelled
+            )
+            return results, None
+        return self.engine.prepare_query(
+            params["query"], params["roots"], self.query_suffixes(params), params["fuzzy"], is_cancelled,
+            params["sort"], params["descending"]
+        )
+
+    def record_query(self, params, seconds):
+        """Adds a completed query's latency to the engine metrics. Runs on the query worker thread."""
+        if self.service_connected:
+            return  # The service records the queries it answers
+        self.engine.record_query(params["query"], self.query_suffixes(params), params["fuzzy"], seconds)
+
+
+    def on_results_page(self, generation, page):
+        """Shows a page of streamed results, dropping pages from superseded queries."""
+        if not self.query_executor.is_current(generation):
+            return
+        if generation != self.displayed_generation:
+            # First page of a new query replaces the previous results
+            self.displayed_generation = generation
+            if self.service_connected:
+                snippets = self.service_results.snippets_of(page[0]) if page else None
+            else:
+                # No newer query has started, so the engine still holds this query's snippets
+                snippets = self.engine.content_snippets or None
+            self.result_model.set_results(page, snippets)
+        else:
+            self.result_model.append_results(page)
+
+
+    def refresh_files(self):
+        """Refreshes the file list for the current directory and includes tags in the display."""
+        if not self.directories:
+            QMessageBox.warning(self, "No Directory", "Please select or add a directory to monitor.")
+            return
+
+        # Reindex the files, the results are refreshed when indexing completes
+        self.index_files()
+
+        print(f"File list refreshed for directory: {self.current_directory or ALL_DIRECTORIES}")
+
+
+    def open_file(self, item):
+        """Opens a file with the default application."""
+        # Retrieve the full file path from the item's data
+        selected_file = item.data(Qt.UserRole)  # Fetch the stored file path
+
+        if not selected_file or not os.path.exists(selected_file):
+            QMessageBox.critical(self, "Error", f"File not found: {selected_file}")
+            print(f"Error: File '{selected_file}' not found or no longer exists.")
+            return
+
+        try:
+            # Use os.startfile to open the file with the default application
+            os.startfile(selected_file)
+            print(f"Opened file: {selected_file}")
+        except FileNotFoundError:
+            QMessageBox.critical(self, "Error", f"File no longer exists: {selected_file}")
+            print(f"Error: File '{selected_file}' does not exist.")
+        except OSError as e:
+            QMessageBox.critical(self, "Error", f"Failed to open file: {e}")
+            print(f"Error: Failed to open file '{selected_file}' with error: {e}")
+
+
+
+    def closeEvent(self, event):
+        """Handles application close event."""
+        # Check if indexing is in progress, a scan running in the index service carries on without this window
+        if not self.service_connected and hasattr(self, "indexing_thread") and self.indexing_thread.is_alive():
+            reply = QMessageBox.question(
+                self,
+                "Indexing in Progress",
+                "Indexing is currently in progress. Do you want to stop indexing and close the application?\n"
+                "Indexing resumes where it left off the next time you start File Search Pro.",
+                QMessageBox.Yes | QMessageBox.No
+            )
+
+            if reply == QMessageBox.Yes:
+                # Scans check for cancellation between directories, everything they indexed so far is kept
+                self.engine.cancel_indexing(timeout=0)
+                self.indexing_thread.join(timeout=10)
+                if self.indexing_thread.is_alive():
+                    print("Indexing thread did not stop in time.")
+                else:
+                    print("Indexing thread stopped.")
+            else:
+                event.ignore()  # Cancel the close event
+                return
+
+        # Stop monitoring and close the index
+        self.filter_counts_timer.stop()
+        self.query_executor.stop()
+        try:
+            self.engine.close()
+        except Exception as e:
+            print(f"Error stopping monitoring: {e}")
+
+        # Final cleanup
+        print("Application closing.")
+        event.accept()  # Accept the close event
+
+
+
+if __name__ == "__main__":
+    import sys
+
+    multiprocessing.freeze_support()  # The content indexer's worker processes in the .exe build
+    logging.basicConfig(level=logging.INFO, format="%(message)s")  # Engine messages go to the console
+    app = QApplication(sys.argv)
+    window = FileSearcherApp()
+    window.show()
+    sys.exit(app.exec_())
+
+
@@ -0,0 +1,300 @@
+"""
+File Search Pro - performance benchmarks
+Copyright (C) 2024 [Kristopher Sorensen]
+
+Licensed under the GNU General Public License v3 or later, see LICENSE.txt.
+
+Generates a synthetic directory tree and times the engine against it: full and
+no-op scans, engine import and index load, cold and warm query latency and memory
+use. Results are written as JSON so runs can be compared.
+
+    python benchmarks/bench.py --files 1000000 --output results.json
+    python benchmarks/bench.py --files 1000000 --compare results.json
+
+Trees are generated from a seed and reused while the tree parameters are unchanged.
+"""
+
+import os
+import gc
+import sys
+import json
+import time
+import random
+import shutil
+import logging
+import platform
+import argparse
+import statistics
+import tempfile
+import subprocess
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fs_engine import SearchEngine  # noqa: E402
+
+try:
+    import resource  # Not available on Windows
+except ImportError:
+    resource = None
+
+WORDS = (
+    "report invoice motor draft final backup photo scan notes budget project meeting "
+    "summary design spec review contract letter plan schedule export data chart model "
+    "assembly drawing quote order receipt manual guide release build test sample archive"
+).split()
+EXTENSIONS = [".pdf", ".docx", ".xlsx", ".txt", ".jpg", ".png", ".dwg", ".step", ".csv", ".zip", ".mp4", ".py"]
+
+
+# Synthetic trees
+def make_name(rng, distribution, number):
+    """Returns a file name stem for the given name distribution."""
+    if distribution == "words":
+        return "_".join(rng.choice(WORDS) for _ in range(rng.randint(1, 3))) + f"_{number}"
+    if distribution == "random":
+        return "".join(rng.choice("abcdefghijklmnopqrstuvwxyz0123456789") for _ in range(rng.randint(6, 24)))
+    if distribution == "long":
+        return "_".join(rng.choice(WORDS) for _ in range(rng.randint(6, 12))) + f"_{number}"
+    raise ValueError(f"Unknown name distribution: {distribution}")
+
+
+def pick_extension(rng):
+    """Picks an extension with a Zipf-like skew, a few types dominate as on real drives."""
+    rank = min(int(rng.paretovariate(1.2)), len(EXTENSIONS)) - 1
+    return EXTENSIONS[rank]
+
+
+def tree_directories(root, depth, fanout):
+    """Returns every directory of a tree with the given depth and fan-out, root first."""
+    directories = [root]
+    level = [root]
+    for _ in range(depth):
+        level = [os.path.join(parent, f"dir_{i}") for parent in level for i in range(fanout)]
+        directories.extend(level)
+    return directories
+
+
+def generate_tree(root, files, depth, fanout, names, seed):
+    """Creates the tree unless root already holds one generated with the same parameters."""
+    params = {"files": files, "depth": depth, "fanout": fanout, "names": names, "seed": seed}
+    manifest_path = root + ".json"  # Kept outside the tree so it is not indexed
+    if os.path.exists(manifest_path):
+        with open(manifest_path, "r") as f:
+            if json.load(f) == params:
+                return False
+    if os.path.exists(root):
+        shutil.rmtree(root)
+
+    rng = random.Random(seed)
+    directories = tree_directories(root, depth, fanout)
+    for directory in directories:
+        os.makedirs(directory, exist_ok=True)
+    for number in range(files):
+        file_name = make_name(rng, names, number) + pick_extension(rng)
+        with open(os.path.join(rng.choice(directories), file_name), "wb"):
+            pass
+    with open(manifest_path, "w") as f:
+        json.dump(params, f)
+    return True
+
+
+# Measurements
+def peak_rss_mb():
+    """Returns the peak resident set size of this process in MB, or None where unsupported."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def timed(function, *args):
+    """Returns (result, seconds) for one call."""
+    started = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - started
+
+
+def query_latency(engine, query, suffixes, repeat, fuzzy=False):
+    """Returns cold (first call) and warm (median of repeat calls) latency in milliseconds, and the hit count."""
+    results, cold = timed(engine.search, query, None, suffixes, None, fuzzy)
+    warm = [timed(engine.search, query, None, suffixes, None, fuzzy)[1] for _ in range(repeat)]
+    return {
+        "query": query,
+        "suffixes": list(suffixes),
+        "fuzzy": fuzzy,
+        "results": len(results),
+        "cold_ms": round(cold * 1000, 3),
+        "warm_ms": round(statistics.median(warm) * 1000, 3),
+        "warm_max_ms": round(max(warm) * 1000, 3),
+    }
+
+
+def tag_files(engine, fraction, seed):
+    """Tags a fraction of the indexed files and saves the tags file once."""
+    rng = random.Random(seed)
+    files = sorted(engine.search(""))
+    with engine.tag_manager.batch():
+        for file_path in rng.sample(files, int(len(files) * fraction)):
+            engine.tag_manager.add_tag(file_path, rng.choice(("urgent", "review", "archive", "client-a", "client-b")))
+    return len(engine.tag_manager.tags)
+
+
+def engine_import_seconds():
+    """Returns the time a fresh interpreter takes to import the engine, the part of a cold start before any index is read."""
+    code = "import time; started = time.perf_counter(); import fs_engine; print(time.perf_counter() - started)"
+    output = subprocess.run(
+        [sys.executable, "-c", code], cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        capture_output=True, text=True, check=True
+    ).stdout
+    return float(output)
+
+
+def run_benchmarks(args):
+    tree = os.path.abspath(args.tree)
+    _, seconds = timed(generate_tree, tree, args.files, args.depth, args.fanout, args.names, args.seed)
+    results = {"tree_generate_seconds": round(seconds, 3)}
+    results["engine_import_seconds"] = round(min(engine_import_seconds() for _ in range(3)), 4)
+
+    with tempfile.TemporaryDirectory(prefix="fs_bench_") as work_dir:
+        db_path = os.path.join(work_dir, "file_index.db")
+        legacy_index_file = os.path.join(work_dir, "file_index.json")
+        tags_file = os.path.join(work_dir, "tags.json")
+
+        # Full scan into an empty index, then a scan with nothing changed
+        engine = SearchEngine(db_path, legacy_index_file, tags_file)
+        engine.load()
+        engine.add_directory(tree)
+        scans, seconds = timed(engine.index_directories)
+        file_count = engine.file_count()
+        results["files"] = file_count
+        results["directories"] = scans[tree].directories_checked
+        results["scan_full_seconds"] = round(seconds, 3)
+        results["scan_full_files_per_second"] = round(file_count / seconds) if seconds else None
+        _, seconds = timed(engine.index_directories)
+        results["scan_noop_seconds"] = round(seconds, 3)
+        results["tagged_files"] = tag_files(engine, args.tag_fraction, args.seed)
+        engine.close()
+        results["index_file_mb"] = round(os.path.getsize(db_path) / (1024 * 1024), 1)
+
+        # Cold start: a fresh engine reading the stored index
+        del engine, scans
+        gc.collect()
+        engine = SearchEngine(db_path, legacy_index_file, tags_file)
+        _, seconds = timed(engine.load)
+        results["store_load_seconds"] = round(seconds, 4)
+        _, seconds = timed(engine.load_shard, tree)
+        results["index_load_seconds"] = round(seconds, 3)
+        # The loaded index answers queries before its trigram name index is built
+        _, seconds = timed(engine.search, "report")
+        results["query_before_name_index_ms"] = round(seconds * 1000, 3)
+        _, seconds = timed(engine.index_names, tree)
+        results["name_index_seconds"] = round(seconds, 3)
+
+        # Memory is traced on a second load, tracing slows the load down too much to time it
+        memory_engine = SearchEngine(db_path, legacy_index_file, tags_file)
+        memory_engine.load()
+        tracemalloc.start()
+        memory_engine.load_shard(tree)
+        memory_engine.index_names(tree)
+        traced, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        memory_engine.close()
+        del memory_engine
+        gc.collect()
+        results["index_memory_mb"] = round(traced / (1024 * 1024), 1)
+        results["index_bytes_per_file"] = round(traced / file_count) if file_count else None
+
+        rng = random.Random(args.seed)
+        queries = [
+            ("report", ()),
+            ("mo", ()),
+            (rng.choice(WORDS)[:4], ()),
+            ("", (".pdf",)),
+            ("invoice", (".xlsx",)),
+            ("zzzq", ()),
+            ("tag:review", ()),
+            ("tag:client", (".pdf",)),
+            # Query language: the extension facet, a range and the trigram index drive, a regex only filters
+            ("report ext:pdf size:>100kb", ()),
+            ("ext:docx /v\\d/", ()),
+            ("(report OR invoice) -draft", ()),
+            ("*_2024*.pdf", ()),
+        ]
+        results["queries"] = [query_latency(engine, query, suffixes, args.repeat) for query, suffixes in queries]
+        for query, suffixes in (("rpt", ()), ("mtrdrw", ()), ("inv", (".pdf",))):
+            results["queries"].append(query_latency(engine, query, suffixes, args.repeat, fuzzy=True))
+        engine.close()
+
+    results["peak_rss_mb"] = peak_rss_mb()
+    return results
+
+
+def compare(results, baseline, threshold):
+    """Logs timings that got slower than the baseline by more than threshold. Returns the regression count."""
+    def timings(run):
+        values = {key: value for key, value in run.items() if key.endswith(("_seconds", "_mb")) and value and key != "tree_generate_seconds"}
+        for entry in run.get("queries", []):
+            label = entry["query"] + "".join(entry["suffixes"]) + (" fuzzy" if entry.get("fuzzy") else "")
+            values[f"query {label} warm_ms"] = entry["warm_ms"]
+            values[f"query {label} cold_ms"] = entry["cold_ms"]
+        return values
+
+    regressions = 0
+    base_values = timings(baseline["results"])
+    for key, value in timings(results).items():
+        base = base_values.get(key)
+        if not base:
+            continue
+        ratio = value / base
+        scale = 1000 if key.endswith("_seconds") else 1
+        regressed = ratio > 1 + threshold and (value - base) * scale >= 1  # Ignore sub-millisecond noise
+        regressions += regressed
+        logging.info("%-40s %12s -> %-12s %6.2fx%s", key, base, value, ratio, "  REGRESSION" if regressed else "")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the File Search Pro engine on a synthetic tree.")
+    parser.add_argument("--tree", default=os.path.join(tempfile.gettempdir(), "fs_bench_tree"),
+                        help="Directory the synthetic tree is generated in (default: %(default)s)")
+    parser.add_argument("--files", type=int, default=100000, help="Number of files (default: %(default)s)")
+    parser.add_argument("--depth", type=int, default=3, help="Directory depth below the root (default: %(default)s)")
+    parser.add_argument("--fanout", type=int, default=10, help="Subdirectories per directory (default: %(default)s)")
+    parser.add_argument("--names", choices=("words", "random", "long"), default="words",
+                        help="File name distribution (default: %(default)s)")
+    parser.add_argument("--seed", type=int, default=1, help="Random seed (default: %(default)s)")
+    parser.add_argument("--tag-fraction", type=float, default=0.01, help="Fraction of files tagged (default: %(default)s)")
+    parser.add_argument("--repeat", type=int, default=5, help="Warm runs per query (default: %(default)s)")
+    parser.add_argument("--output", help="Write the results to this JSON file")
+    parser.add_argument("--compare", help="Compare against the results in this JSON file")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="Slowdown reported as a regression (default: %(default)s, i.e. 20%%)")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    run = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "machine": {
+            "platform": platform.platform(),
+            "python": platform.python_version(),
+            "cpu_count": os.cpu_count(),
+        },
+        "parameters": {key: value for key, value in vars(args).items() if key not in ("output", "compare")},
+        "results": run_benchmarks(args),
+    }
+    print(json.dumps(run, indent=4))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(run, f, indent=4)
+
+    if args.compare:
+        with open(args.compare, "r") as f:
+            baseline = json.load(f)
+        if baseline.get("parameters", {}).get("files") != args.files:
+            logging.warning("Baseline was run with a different tree, timings are not comparable.")
+        return 1 if compare(run["results"], baseline, args.threshold) else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
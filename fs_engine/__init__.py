@@ -0,0 +1,28 @@
+"""
+File Search Pro - indexing and search engine
+Copyright (C) 2024 [Kristopher Sorensen]
+
+Licensed under the GNU General Public License v3 or later, see LICENSE.txt.
+
+GUI-free engine shared by the Qt application and the command line interface
+(python -m fs_engine).
+"""
+
+from .crawler import DirectoryCrawler, IndexScan
+from .engine import IndexShard, SearchEngine, is_safe_path
+from .pathtable import PathTable
+from .store import IndexStore
+from .tags import TagManager
+from .trigram import TrigramIndex
+
+__all__ = [
+    "DirectoryCrawler",
+    "IndexScan",
+    "IndexShard",
+    "IndexStore",
+    "PathTable",
+    "SearchEngine",
+    "TagManager",
+    "TrigramIndex",
+    "is_safe_path",
+]
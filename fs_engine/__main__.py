@@ -0,0 +1,9 @@
+import sys
+import multiprocessing
+
+from .cli import main
+
+# Guarded because the content indexer's worker processes import this module again on Windows
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    sys.exit(main())
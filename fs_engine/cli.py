@@ -0,0 +1,377 @@
+"""
+File Search Pro - command line interface
+Copyright (C) 2024 [Kristopher Sorensen]
+
+Licensed under the GNU General Public License v3 or later, see LICENSE.txt.
+
+Every command writes JSON to stdout, one object per line, except explain --text.
+Log messages go to stderr.
+With --connect the index, search, explain, tags and stats commands are answered
+by the running index service (see service.py) instead of loading the index.
+With --metrics FILE the engine metrics are written to FILE when the command ends,
+and every second while watching. A .prom or .txt file gets the Prometheus text
+format, anything else JSON.
+
+    python -m fs_engine index [DIRECTORY ...] [--content | --no-content]
+    python -m fs_engine search QUERY [--directory DIR] [--ext .pdf] [--limit N] [--fuzzy]
+                                    [--sort {name,size,modified,created}] [--desc]
+    python -m fs_engine explain QUERY [--directory DIR] [--ext .pdf] [--text]
+    python -m fs_engine duplicates [--directory DIR] [--min-size SIZE]
+    python -m fs_engine rules DIRECTORY [RULE ...] [--clear] [--no-scan]
+    python -m fs_engine tags FILE [TAG ...] [--clear]
+    python -m fs_engine watch [--seconds N]
+    python -m fs_engine stats
+    python -m fs_engine serve
+    python -m fs_engine --connect search QUERY
+    python -m fs_engine --metrics metrics.prom watch
+"""
+
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import threading
+
+from .config import INDEX_DB_FILE, TAGS_FILE, DUPLICATE_MIN_SIZE, DEFAULT_EXCLUSION_RULES
+from .engine import SearchEngine, is_safe_path
+from .filters import parse_size
+from .metrics import write_metrics
+from .pathtable import SORT_COLUMNS
+from .query import explain_text
+from .service import IndexService, ServiceClient, ServiceError
+
+
+def emit(record):
+    """Writes one JSON line to stdout."""
+    sys.stdout.write(json.dumps(record) + "\n")
+    sys.stdout.flush()
+
+
+def cmd_index(engine, args):
+    if args.content is not None:
+        engine.set_content_indexing(args.content)
+    for directory in args.directories:
+        directory = os.path.abspath(directory)
+        if directory not in engine.directories:
+            try:
+                engine.add_directory(directory)
+            except ValueError as e:
+                emit({"directory": directory, "error": str(e)})
+                return 1
+
+    roots = [os.path.abspath(directory) for directory in args.directories] or None
+    started = time.perf_counter()
+    # Scan on a worker thread so Ctrl+C cancels between directories, the next run resumes from there
+    scans = {}
+    worker = threading.Thread(target=lambda: scans.update(engine.index_directories(roots)), daemon=True)
+    worker.start()
+    try:
+        while worker.is_alive():
+            worker.join(0.2)
+    except KeyboardInterrupt:
+        engine.cancel_indexing()
+        worker.join()
+    for root, scan in scans.items():
+        emit({
+            "directory": root,
+            "files": engine.file_count([root]),
+            "added": scan.files_added,
+            "removed": scan.files_removed,
+            "directories_checked": scan.directories_checked,
+            "directories_listed": scan.directories_listed,
+            "directories_failed": scan.directories_failed,
+            "excluded": scan.entries_excluded,
+            "cancelled": scan.cancelled,
+        })
+    emit({"total_files": engine.file_count(roots), "seconds": round(time.perf_counter() - started, 3)})
+    return 0
+
+
+def remote_index(client, args):
+    if args.content is not None:
+        emit({"error": "--content and --no-content cannot be sent to the index service."})
+        return 1
+    roots = [os.path.abspath(directory) for directory in args.directories] or None
+    emit({"started": client.request("index", roots=roots)})
+    return 0
+
+
+def cmd_search(engine, args):
+    roots = [os.path.abspath(args.directory)] if args.directory else None
+    for root in roots or engine.directories:
+        engine.load_shard(root)
+    for file_path in engine.search(args.query, roots, args.ext, args.limit, args.fuzzy, args.sort, args.desc):
+        size, mtime, _ = engine.file_metadata(file_path)
+        record = {"path": file_path, "size": size, "modified": mtime, "tags": engine.tag_manager.get_tags(file_path)}
+        if file_path in engine.content_snippets:
+            record["line"], record["snippet"] = engine.content_snippets[file_path]
+        emit(record)
+    return 0
+
+
+def remote_search(client, args):
+    roots = [os.path.abspath(args.directory)] if args.directory else None
+    # The service answers in pages, each one is printed before the next is requested
+    offset = 0
+    emitted = 0
+    while offset is not None and (args.limit is None or emitted < args.limit):
+        results = client.request(
+            "search", query=args.query, roots=roots, suffixes=args.ext,
+            limit=None if args.limit is None else args.limit - emitted, offset=offset, fuzzy=args.fuzzy, sort=args.sort,
+            descending=args.desc
+        )
+        tags = results["tags"]
+        snippets = results["snippets"]
+        for file_path, size, mtime in zip(results["paths"], results["sizes"], results["modified"]):
+            record = {"path": file_path, "size": size, "modified": mtime, "tags": tags.get(file_path, [])}
+            if file_path in snippets:
+                record["line"], record["snippet"] = snippets[file_path]
+            emit(record)
+            emitted += 1
+        offset = results["next_offset"]
+    return 0
+
+
+def cmd_explain(engine, args):
+    roots = [os.path.abspath(args.directory)] if args.directory else None
+    for root in roots or engine.directories:
+        engine.load_shard(root)
+    explanation = engine.explain(args.query, roots, args.ext)
+    if args.text:
+        sys.stdout.write(explain_text(explanation) + "\n")
+    else:
+        emit(explanation)
+    return 0
+
+
+def remote_explain(client, args):
+    roots = [os.path.abspath(args.directory)] if args.directory else None
+    explanation = client.request("explain", query=args.query, roots=roots, suffixes=args.ext)
+    if args.text:
+        sys.stdout.write(explain_text(explanation) + "\n")
+    else:
+        emit(explanation)
+    return 0
+
+
+def cmd_duplicates(engine, args):
+    roots = [os.path.abspath(args.directory)] if args.directory else None
+    for root in roots or engine.directories:
+        engine.load_shard(root)
+    started = time.perf_counter()
+    groups = wasted = 0
+    for size, digest, file_paths in engine.find_duplicates(roots, args.min_size):
+        emit({"size": size, "hash": digest, "paths": file_paths})
+        groups += 1
+        wasted += size * (len(file_paths) - 1)
+    emit({
+        "groups": groups,
+        "wasted_bytes": wasted,
+        "hashes_computed": engine.duplicate_finder.hashes_computed,
+        "seconds": round(time.perf_counter() - started, 3),
+    })
+    return 0
+
+
+def cmd_rules(engine, args):
+    root = os.path.abspath(args.directory)
+    if root not in engine.directories:
+        emit({"directory": root, "error": "Not a monitored directory, add it with the index command first."})
+        return 1
+    if not args.rules and not args.clear:
+        emit({"directory": root, "rules": engine.exclusion_rules.get(root, []), "defaults": list(DEFAULT_EXCLUSION_RULES)})
+        return 0
+    try:
+        changes = engine.set_exclusion_rules(root, args.rules)
+    except ValueError as e:
+        emit({"directory": root, "error": str(e)})
+        return 1
+    record = {"directory": root, "rules": engine.exclusion_rules[root], **changes}
+    if not args.no_scan:
+        # Lists only the directories the rule change affected
+        scan = engine.index_directories([root]).get(root)
+        if scan is not None:
+            record.update({"directories_listed": scan.directories_listed, "added": scan.files_added, "files": engine.file_count([root])})
+    emit(record)
+    return 0
+
+
+def cmd_tags(engine, args):
+    file_path = os.path.abspath(args.file)
+    if args.tags or args.clear:
+        if not any(is_safe_path(root, file_path) for root in engine.directories):
+            emit({"path": file_path, "error": "Not in a monitored directory."})
+            return 1
+        engine.tag_manager.set_tags(file_path, [tag.strip() for tag in args.tags if tag.strip()])
+    emit({"path": file_path, "tags": engine.tag_manager.get_tags(file_path)})
+    return 0
+
+
+def remote_tags(client, args):
+    file_path = os.path.abspath(args.file)
+    if args.tags or args.clear:
+        tags = client.request("set_tags", path=file_path, tags=args.tags)
+    else:
+        tags = client.request("tags", path=file_path)
+    emit({"path": file_path, "tags": tags})
+    return 0
+
+
+def cmd_watch(engine, args):
+    engine.index_directories()
+    engine.start_watching()
+    emit({"watching": engine.directories})
+    deadline = time.monotonic() + args.seconds if args.seconds else None
+    last_state = None
+    try:
+        while deadline is None or time.monotonic() < deadline:
+            time.sleep(1)
+            stats = engine.stats()
+            if args.metrics:
+                write_metrics(engine.metrics, args.metrics)
+            # Reconciler passes change the file count without any events
+            state = (stats["files"], stats["events_applied"])
+            if state != last_state:
+                last_state = state
+                record = {key: stats[key] for key in ("files", "events_received", "events_applied", "event_batches")}
+                record["polling"] = [root for root, status in stats["polling"].items() if status["polling"]]
+                emit(record)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        engine.stop_watching()
+    return 0
+
+
+def cmd_stats(engine, args):
+    for root in engine.directories:
+        engine.load_shard(root)
+    emit(engine.stats())
+    return 0
+
+
+def remote_stats(client, args):
+    emit(client.request("stats"))
+    return 0
+
+
+def cmd_serve(engine, args):
+    service = IndexService(engine)
+    try:
+        service.start()
+    except ServiceError as e:
+        emit({"error": str(e)})
+        return 1
+    emit({"serving": service.address, "directories": engine.directories})
+    try:
+        service.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="python -m fs_engine", description="File Search Pro indexing and search engine.")
+    parser.add_argument("--index-file", default=INDEX_DB_FILE, help="SQLite index database (default: %(default)s)")
+    parser.add_argument("--tags-file", default=TAGS_FILE, help="Tags JSON file (default: %(default)s)")
+    parser.add_argument("-v", "--verbose", action="store_true", help="Log progress to stderr")
+    parser.add_argument("--metrics", metavar="FILE", help="Write engine metrics to FILE, Prometheus text for .prom or .txt, else JSON")
+    parser.add_argument(
+        "--connect", action="store_true", help="Send index, search, explain, tags and stats to the running index service"
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    index_parser = commands.add_parser("index", help="Add directories and bring their index up to date")
+    index_parser.add_argument("directories", nargs="*", help="Directories to index (default: every monitored directory)")
+    index_parser.add_argument("--content", action="store_true", default=None, help="Turn on the content index for content: queries")
+    index_parser.add_argument("--no-content", dest="content", action="store_false", help="Turn off and drop the content index")
+    index_parser.set_defaults(handler=cmd_index, remote_handler=remote_index)
+
+    search_parser = commands.add_parser("search", help="Search the index")
+    search_parser.add_argument(
+        "query",
+        help='File name text, "quoted phrases", globs and /regular expressions/ with ext:, tag:, path:, content:, '
+             'size:, modified: and created: terms, combined with OR, NOT and parentheses, '
+             'e.g. "report ext:pdf,docx size:>100MB modified:<7d -draft"'
+    )
+    search_parser.add_argument("--directory", help="Only search this monitored directory")
+    search_parser.add_argument("--ext", action="append", default=[], help="Required file name suffix, may be repeated")
+    search_parser.add_argument("--limit", type=int, help="Maximum number of results")
+    search_parser.add_argument("--fuzzy", action="store_true", help="Rank fuzzy (in order subsequence) matches, best first")
+    search_parser.add_argument("--sort", choices=SORT_COLUMNS, help="Sort the results by this column")
+    search_parser.add_argument("--desc", action="store_true", help="Sort in descending order")
+    search_parser.set_defaults(handler=cmd_search, remote_handler=remote_search)
+
+    explain_parser = commands.add_parser("explain", help="Show how a query is evaluated and how many candidates each stage kept")
+    explain_parser.add_argument("query", help="Query, as for search")
+    explain_parser.add_argument("--directory", help="Only search this monitored directory")
+    explain_parser.add_argument("--ext", action="append", default=[], help="Required file name suffix, may be repeated")
+    explain_parser.add_argument("--text", action="store_true", help="Print the plan as an indented tree instead of JSON")
+    explain_parser.set_defaults(handler=cmd_explain, remote_handler=remote_explain)
+
+    duplicates_parser = commands.add_parser("duplicates", help="List groups of files with identical contents")
+    duplicates_parser.add_argument("--directory", help="Only check this monitored directory")
+    duplicates_parser.add_argument(
+        "--min-size", type=parse_size, default=DUPLICATE_MIN_SIZE, help='Skip smaller files, e.g. "100KB" (default: %(default)s bytes)'
+    )
+    duplicates_parser.set_defaults(handler=cmd_duplicates)
+
+    rules_parser = commands.add_parser(
+        "rules", help="Show or replace the exclusion rules of a monitored directory, e.g. node_modules/ *.tmp size:>1GB"
+    )
+    rules_parser.add_argument("directory", help="Monitored directory")
+    rules_parser.add_argument("rules", nargs="*", help="gitignore-style rules that replace the current ones")
+    rules_parser.add_argument("--clear", action="store_true", help="Remove every rule of the directory, the built-in ones stay")
+    rules_parser.add_argument("--no-scan", action="store_true", help="Do not list the affected directories now")
+    rules_parser.set_defaults(handler=cmd_rules)
+
+    tags_parser = commands.add_parser("tags", help="Show or replace the tags of a file")
+    tags_parser.add_argument("file", help="File in a monitored directory")
+    tags_parser.add_argument("tags", nargs="*", help="Tags that replace the current ones")
+    tags_parser.add_argument("--clear", action="store_true", help="Remove every tag of the file")
+    tags_parser.set_defaults(handler=cmd_tags, remote_handler=remote_tags)
+
+    watch_parser = commands.add_parser("watch", help="Index, then keep the index updated from file system events")
+    watch_parser.add_argument("--seconds", type=float, help="Stop after this many seconds (default: until interrupted)")
+    watch_parser.set_defaults(handler=cmd_watch)
+
+    stats_parser = commands.add_parser("stats", help="Print index statistics")
+    stats_parser.set_defaults(handler=cmd_stats, remote_handler=remote_stats)
+
+    serve_parser = commands.add_parser(
+        "serve", help="Run the index service: index, watch and answer --connect requests until interrupted"
+    )
+    serve_parser.set_defaults(handler=cmd_serve)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    logging.basicConfig(
+        stream=sys.stderr,
+        level=logging.INFO if args.verbose else logging.WARNING,
+        format="%(levelname)s %(name)s: %(message)s",
+    )
+    if args.connect:
+        remote_handler = getattr(args, "remote_handler", None)
+        if remote_handler is None:
+            emit({"error": f"The {args.command} command cannot be sent to the index service."})
+            return 2
+        try:
+            with ServiceClient(args.index_file) as client:
+                return remote_handler(client, args)
+        except ServiceError as e:
+            emit({"error": str(e)})
+            return 1
+
+    legacy_index_file = os.path.join(os.path.dirname(os.path.abspath(args.index_file)), "file_index.json")
+    engine = SearchEngine(args.index_file, legacy_index_file, args.tags_file)
+    try:
+        engine.load()
+        return args.handler(engine, args)
+    finally:
+        if args.metrics:
+            write_metrics(engine.metrics, args.metrics)
+        engine.close()
@@ -0,0 +1,95 @@
+"""
+File Search Pro - engine settings
+Copyright (C) 2024 [Kristopher Sorensen]
+
+Licensed under the GNU General Public License v3 or later, see LICENSE.txt.
+"""
+
+import os
+import sys
+
+# Index and tag files live in the same directory as the script or .exe
+if getattr(sys, 'frozen', False):
+    APP_DIR = os.path.dirname(sys.executable)
+else:
+    APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+INDEX_FILE = os.path.join(APP_DIR, "file_index.json")  # Legacy JSON index, migrated on first load
+INDEX_DB_FILE = os.path.join(APP_DIR, "file_index.db")
+TAGS_FILE = os.path.join(APP_DIR, "tags.json")  # File to store tags
+
+MAX_DIRECTORIES = 10  # Monitored directories
+CRAWLER_THREADS = 16  # Directories listed in parallel, network shares are latency bound
+CRAWLER_BATCH_SIZE = 2000  # Files handed to the index per batch
+LOAD_BATCH_SIZE = 20000  # Stored files read per query when a directory is loaded
+CLOSE_TIMEOUT = 10  # Seconds to wait for cancelled scans to stop when the engine closes
+EVENT_FLUSH_INTERVAL = 0.5  # Seconds between applying batches of file system events
+EVENT_BATCH_SIZE = 5000  # Pending paths that trigger an early flush
+FUZZY_RESULT_LIMIT = 1000  # Best matches kept by a fuzzy search
+METRICS_LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)  # Histogram bounds, seconds
+
+# Polling reconciler, for directories whose file events are unreliable (see reconciler.py)
+POLL_MIN_INTERVAL = 2  # Seconds between passes while a polled directory keeps changing
+POLL_MAX_INTERVAL = 300  # Seconds between passes once it has been quiet for a while
+POLL_VERIFY_INTERVAL = 600  # Seconds between passes over a directory whose file events are trusted
+POLL_IO_BUDGET = 0.1  # Share of the time passes over one directory may take, slow shares are polled less often
+POLL_WATCH_CHECK_INTERVAL = 10  # Seconds between checks for watches that stopped delivering events
+POLL_TRUST_PASSES = 5  # Passes in a row without changes after which missed events are trusted again
+NETWORK_FILE_SYSTEMS = {
+    "nfs", "nfs4", "cifs", "smb3", "smbfs", "afpfs", "ncpfs", "9p", "afs", "ceph", "glusterfs", "lustre", "davfs",
+    "fuse.sshfs", "fuse.rclone", "fuse.s3fs", "fuse.gcsfuse", "fuse.davfs2"
+}
+
+# Index service (python -m fs_engine serve, see service.py)
+SERVICE_MAX_REQUEST_BYTES = 1024 * 1024  # Larger requests close the connection
+SERVICE_SEARCH_PAGE_SIZE = 1000  # Results per search reply when the client sets no limit
+SERVICE_MAX_SEARCH_PAGE_SIZE = 10000  # Larger limits are clamped, clients page through the rest with offset
+
+# Content index, off by default
+CONTENT_MAX_FILE_SIZE = 4 * 1024 * 1024  # Larger files are recorded without tokens
+CONTENT_MMAP_THRESHOLD = 256 * 1024  # Files at least this large are memory mapped
+CONTENT_MAX_TOKENS = 50000  # Distinct tokens indexed per file
+CONTENT_WORKERS = os.cpu_count() or 1  # Tokenizer processes
+CONTENT_POOL_MIN_FILES = 32  # Smaller batches are tokenized without a process pool
+CONTENT_BATCH_SIZE = 500  # Files written to the store per transaction
+CONTENT_RESULT_LIMIT = 5000  # Files returned by a content: query
+CONTENT_FILE_TYPES = {
+    ".txt", ".md", ".rst", ".csv", ".tsv", ".json", ".xml", ".yaml", ".yml", ".toml", ".cfg", ".conf",
+    ".js", ".py", ".java", ".cpp", ".c", ".h", ".hpp", ".cs", ".rb", ".php", ".html", ".htm", ".css",
+    ".scss", ".ts", ".go", ".swift", ".kt", ".rs", ".sql", ".sh", ".bat", ".ps1", ".pl", ".lua",
+    ".asp", ".jsp", ".vue", ".jsx", ".tsx"
+}
+
+# Duplicate finder
+DUPLICATE_PARTIAL_BYTES = 4096  # Bytes hashed from each end of a file before the whole file is
+DUPLICATE_HASH_CHUNK_SIZE = 1024 * 1024  # Read size while hashing a whole file
+DUPLICATE_WORKERS = 8  # Hashing threads, reading is I/O bound
+DUPLICATE_SAVE_BATCH_SIZE = 1000  # Hashes written to the cache per transaction
+DUPLICATE_MIN_SIZE = 1  # Smaller files are never reported, every empty file would match
+
+# Directories skipped while indexing
+EXCLUDED_DIRECTORIES = ("C:\\Windows", "C:\\Program Files", "C:\\Program Files (x86)", "Z:\\")
+# Exclusion rules of every monitored directory, before its own rules (see exclusions.py)
+DEFAULT_EXCLUSION_RULES = (
+    "*.ini", "*.tmp", "*.bak", "*.log", "*.sys", "*.dll", "*.reg", "*.cab", "*.msi", "*.drv", "*.inf", "*.db", "*.ink", "*.exe", "*.scr"
+)
+
+# System directories that cannot be added as a monitored directory
+PROTECTED_DIRECTORIES = {
+    "C:\\Windows",
+    "C:\\Windows\\System32",
+    "C:\\Windows\\SysWOW64",
+    "C:\\Windows\\Temp",
+    "C:\\Windows\\Hyper-V",
+    "C:\\Program Files",
+    "C:\\Program Files (x86)",
+    "C:\\Recovery",
+    "C:\\System Volume Information",
+    "C:\\Perflogs",
+    "C:\\Users",
+    "C:\\Users\\AppData",
+    "C:\\$Recycle.Bin",
+    "C:\\Boot",
+    "C:\\EFI",
+    "Z:\\"
+}
@@ -0,0 +1,153 @@
+"""
+File Search Pro - file content index
+Copyright (C) 2024 [Kristopher Sorensen]
+
+Licensed under the GNU General Public License v3 or later, see LICENSE.txt.
+
+Text and source files are split into word tokens on a process pool. For every
+token the store keeps the first line it appears on and the text of that line, so a
+"content:" query returns files with a snippet without opening them again.
+"""
+
+import os
+import re
+import mmap
+import logging
+
+from .config import (
+    CONTENT_FILE_TYPES, CONTENT_MAX_FILE_SIZE, CONTENT_MMAP_THRESHOLD, CONTENT_MAX_TOKENS,
+    CONTENT_POOL_MIN_FILES, CONTENT_WORKERS, CONTENT_BATCH_SIZE
+)
+
+log = logging.getLogger(__name__)
+
+TOKEN_PATTERN = re.compile(r"\w{2,64}")
+BINARY_CHECK_BYTES = 8192
+SNIPPET_LENGTH = 200
+
+
+def is_content_file(file_path):
+    """Returns True if the file type is eligible for content indexing."""
+    return os.path.splitext(file_path)[1].lower() in CONTENT_FILE_TYPES
+
+
+def tokenize(text):
+    """Returns the lowercased word tokens of text."""
+    return [token.lower() for token in TOKEN_PATTERN.findall(text)]
+
+
+def read_lines(file_path, size):
+    """Yields the lines of a file as bytes. Files above CONTENT_MMAP_THRESHOLD are memory mapped, not read whole."""
+    with open(file_path, "rb") as f:
+        if size < CONTENT_MMAP_THRESHOLD:
+            data = f.read(CONTENT_MAX_FILE_SIZE)
+            if b"\0" in data[:BINARY_CHECK_BYTES]:
+                return
+            yield from data.splitlines()
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            if mapped.find(b"\0", 0, BINARY_CHECK_BYTES) >= 0:
+                return
+            yield from iter(mapped.readline, b"")
+
+
+def index_file(file_path):
+    """Tokenizes one file. Runs in a worker process.
+
+    Returns (path, mtime, size, postings, lines) where postings maps each token to
+    the first line number it appears on and lines holds the text of those lines.
+    postings is empty for binary files, files above CONTENT_MAX_FILE_SIZE and files
+    that cannot be read; the file is still recorded so it is not retried until it
+    changes. Returns None if the file is gone.
+    """
+    try:
+        stat = os.stat(file_path)
+    except OSError:
+        return None
+    postings = {}
+    lines = {}
+    if 0 < stat.st_size <= CONTENT_MAX_FILE_SIZE:
+        try:
+            for line_number, raw_line in enumerate(read_lines(file_path, stat.st_size), start=1):
+                line = raw_line.decode("utf-8", errors="replace").rstrip("\r\n")
+                for token in tokenize(line):
+                    if token not in postings:
+                        postings[token] = line_number
+                        lines[line_number] = line.strip()[:SNIPPET_LENGTH]
+                if len(postings) >= CONTENT_MAX_TOKENS:
+                    break
+        except (OSError, ValueError) as e:
+            log.debug("Could not read %s for the content index: %s", file_path, e)
+            postings = {}
+            lines = {}
+    return file_path, stat.st_mtime, stat.st_size, postings, lines
+
+
+# Content indexer
+class ContentIndexer:
+    """Keeps the stored content index in step with the file index.
+
+    Large batches of files are tokenized on a process pool, small ones (such as a
+    batch of watchdog events) in the calling thread, where starting worker processes
+    would cost more than the work.
+    """
+    def __init__(self, index_store, workers=CONTENT_WORKERS, pool_min_files=CONTENT_POOL_MIN_FILES):
+        self.index_store = index_store
+        self.workers = workers
+        self.pool_min_files = pool_min_files
+        self.files_indexed = 0
+        self.files_removed = 0
+
+    def scan(self, root, files, is_cancelled=None):
+        """Indexes new and changed eligible files below root and drops files that are gone. Returns the count indexed."""
+        stored = self.index_store.load_content_files(root)
+        changed = []
+        eligible = set()
+        for file_path in files:
+            if not is_content_file(file_path):
+                continue
+            eligible.add(file_path)
+            known = stored.get(file_path)
+            if known is not None:
+                try:
+                    stat = os.stat(file_path)
+                except OSError:
+                    continue
+                if (stat.st_mtime, stat.st_size) == known:
+                    continue
+            changed.append(file_path)
+        removed = [file_path for file_path in stored if file_path not in eligible]
+        return self.update(changed, removed, is_cancelled)
+
+    def update(self, changed, removed=(), is_cancelled=None):
+        """Re-indexes changed files and drops removed ones. Returns the number of files indexed."""
+        changed = [file_path for file_path in changed if is_content_file(file_path)]
+        removed = [file_path for file_path in removed if is_content_file(file_path)]
+        if removed:
+            self.index_store.apply_content_batch([], removed)
+            self.files_removed += len(removed)
+        if not changed:
+            return 0
+
+        # Chunks keep memory bounded and let a cancelled scan stop between them
+        pool = None
+        if len(changed) >= self.pool_min_files and self.workers > 1:
+            # Imported here, the process pool machinery is only needed for large batches and slows every startup
+            from concurrent.futures import ProcessPoolExecutor
+            pool = ProcessPoolExecutor(max_workers=self.workers)
+        indexed = 0
+        try:
+            for start in range(0, len(changed), CONTENT_BATCH_SIZE):
+                if is_cancelled is not None and is_cancelled():
+                    break
+                chunk = changed[start:start + CONTENT_BATCH_SIZE]
+                results = list(pool.map(index_file, chunk, chunksize=16) if pool else map(index_file, chunk))
+                gone = [file_path for file_path, result in zip(chunk, results) if result is None]
+                batch = [result for result in results if result is not None]
+                self.index_store.apply_content_batch(batch, gone)
+                indexed += len(batch)
+        finally:
+            if pool is not None:
+                pool.shutdown()
+        self.files_indexed += indexed
+        return indexed
@@ -0,0 +1,400 @@
+"""
+File Search Pro - directory crawler and incremental scans
+Copyright (C) 2024 [Kristopher Sorensen]
+
+Licensed under the GNU General Public License v3 or later, see LICENSE.txt.
+"""
+
+import os
+import json
+import logging
+import threading
+from collections import deque
+
+from .config import CRAWLER_BATCH_SIZE, CRAWLER_THREADS, EXCLUDED_DIRECTORIES
+from .exclusions import ExclusionRules
+
+log = logging.getLogger(__name__)
+
+UNKNOWN_RECORD = (None, 0, 0.0, 0.0)  # Record of a file that could not be stat'ed
+
+# DirEntry.inode() comes with the listing on POSIX systems but costs a call per file
+# on Windows, so Windows scans leave identities out until rename matching needs one
+LISTING_HAS_IDENTITY = os.name != "nt"
+
+
+def to_int64(value):
+    """Folds an unsigned number into a signed 64 bit integer, which is what SQLite stores."""
+    value &= (1 << 64) - 1
+    return value - (1 << 64) if value >= (1 << 63) else value
+
+
+def file_identity(st_dev, st_ino):
+    """Returns the stable (device, inode) identity of a file, or None if the file system has no inode numbers.
+
+    The identity survives renames and moves within a volume, on Windows it is the
+    NTFS file ID.
+    """
+    if not st_ino:
+        return None
+    return to_int64(st_dev), to_int64(st_ino)
+
+
+def path_record(path):
+    """Returns the file record (identity, size, mtime, ctime) of the file at path, or None if it cannot be read."""
+    try:
+        stat = os.stat(path, follow_symlinks=False)
+    except OSError:
+        return None
+    return file_identity(stat.st_dev, stat.st_ino), stat.st_size, stat.st_mtime, stat.st_ctime
+
+
+# Parallel directory crawler
+class DirectoryCrawler:
+    """Walks a directory tree with os.scandir on a work-stealing thread pool, one task per directory.
+
+    Each worker lists directories from the end of its own deque and steals from the
+    front of the other workers' deques when it runs dry. Every directory visited is
+    reported as on_directory(directory, mtime, subdirectories, files, exclusions), where
+    files maps each file path to its record (file_identity(), size, mtime, ctime) and
+    exclusions lists the rules that excluded entries of the listing. Directories in
+    known_directories whose mtime is unchanged are not listed again; their stored
+    subdirectories are visited, and files and exclusions are None.
+
+    rules are the root's ExclusionRules. An excluded directory is pruned before it
+    is queued, so it is never listed.
+
+    is_cancelled() is polled between directories. Once it returns True the workers
+    stop taking new directories and cancelled is set.
+    """
+    def __init__(
+        self, root, on_directory, on_progress=None, known_directories=None, threads=CRAWLER_THREADS, is_cancelled=None, rules=None
+    ):
+        self.root = root
+        self.rules = rules if rules is not None else ExclusionRules(root)
+        self.on_directory = on_directory
+        self.on_progress = on_progress
+        self.known_directories = known_directories or {}
+        self.threads = max(1, threads)
+        self.is_cancelled = is_cancelled
+        self.cancelled = False
+        self.queues = [deque() for _ in range(self.threads)]
+        self.condition = threading.Condition()
+        self.pending = 0  # Directories queued or being listed
+        self.visited = set()
+        self.directories_done = 0
+        self.directories_found = 0
+        self.directories_listed = 0
+        self.directories_failed = 0  # Could not be listed, e.g. permission denied
+        self.entries_excluded = 0  # Files and directories skipped by the exclusion rules
+
+    @staticmethod
+    def is_excluded_directory(path):
+        """Returns True if the directory is one of the protected system directories."""
+        return os.path.abspath(path).startswith(EXCLUDED_DIRECTORIES)
+
+    def run(self):
+        """Crawls the tree and returns the set of directories visited."""
+        if self.is_excluded_directory(self.root):
+            log.info("Skipping excluded directory: %s", self.root)
+            return self.visited
+        self.queues[0].append(self.root)
+        self.pending = self.directories_found = 1
+
+        workers = [threading.Thread(target=self.worker, args=(i,), daemon=True) for i in range(self.threads)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        return self.visited
+
+    def next_directory(self, worker_id):
+        """Pops from this worker's own deque, or steals the oldest entry from another worker."""
+        try:
+            return self.queues[worker_id].pop()
+        except IndexError:
+            pass
+        for offset in range(1, self.threads):
+            try:
+                return self.queues[(worker_id + offset) % self.threads].popleft()
+            except IndexError:
+                continue
+        return None
+
+    def scan_directory(self, directory, st_dev=0):
+        """Lists one directory and returns (subdirectories, files, exclusions), or None if it cannot be read.
+
+        Files are returned as {path: (identity, size, mtime, ctime)}. They are taken to
+        be on the directory's device st_dev. POSIX systems pay a stat call per file
+        for the size and times and get the inode number with the listing. Windows
+        gets the size and times with the listing, but its file ID would cost a call
+        per file, so the identity is None there (see LISTING_HAS_IDENTITY).
+        exclusions is the sorted list of rules that excluded an entry.
+        """
+        subdirectories = []
+        files = {}
+        exclusions = set()
+        excluded = 0
+        match = self.rules.match
+        sized = bool(self.rules.size_rules)
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    try:
+                        is_dir = entry.is_dir()
+                    except OSError:
+                        continue
+                    if is_dir:
+                        # Like os.walk, symlinked directories are not followed
+                        if entry.is_symlink() or self.is_excluded_directory(entry.path):
+                            continue
+                        rule = match(entry.path, entry.name, True)
+                        if rule is None:
+                            subdirectories.append(entry.path)
+                        else:
+                            exclusions.add(rule)
+                            excluded += 1
+                        continue
+                    # Without size: rules the name decides, and excluded files are not stat'ed
+                    rule = None if sized else match(entry.path, entry.name, False)
+                    if rule is None:
+                        try:
+                            stat = entry.stat(follow_symlinks=False)
+                            identity = file_identity(st_dev, entry.inode()) if LISTING_HAS_IDENTITY else None
+                            record = (identity, stat.st_size, stat.st_mtime, stat.st_ctime)
+                        except OSError:
+                            record = UNKNOWN_RECORD
+                        if sized:
+                            rule = match(entry.path, entry.name, False, record[1] if record is not UNKNOWN_RECORD else None)
+                    if rule is None:
+                        files[entry.path] = record
+                    else:
+                        exclusions.add(rule)
+                        excluded += 1
+        except OSError as e:
+            # One message per directory, the scan reports how many failed
+            log.debug("Could not list directory %s: %s", directory, e)
+            return None
+        if excluded:
+            with self.condition:
+                self.entries_excluded += excluded
+        return subdirectories, files, sorted(exclusions)
+
+    def visit(self, directory):
+        """Returns (mtime, subdirectories, files, exclusions) for a directory, listing it only if it changed."""
+        try:
+            # Read the mtime before listing so a change made during the listing is picked up next time
+            stat = os.stat(directory)
+        except OSError:
+            return None
+        mtime = stat.st_mtime
+        known = self.known_directories.get(directory)
+        if known is not None and known[0] == mtime:
+            match = self.rules.match
+            subdirectories = [
+                path for path in known[1]
+                if not self.is_excluded_directory(path) and match(path, os.path.basename(path), True) is None
+            ]
+            return mtime, subdirectories, None, None
+
+        listing = self.scan_directory(directory, stat.st_dev)
+        if listing is None:
+            with self.condition:
+                self.directories_failed += 1
+            # Keep what is already indexed rather than dropping a directory that failed to list
+            return (None, known[1], None, None) if known is not None else None
+        with self.condition:
+            self.directories_listed += 1
+        return (mtime,) + listing
+
+    def worker(self, worker_id):
+        own_queue = self.queues[worker_id]
+        while True:
+            if self.cancelled or (self.is_cancelled is not None and self.is_cancelled()):
+                self.cancelled = True
+                break
+            directory = self.next_directory(worker_id)
+            if directory is None:
+                with self.condition:
+                    if self.pending == 0:
+                        self.condition.notify_all()
+                        break
+                    self.condition.wait(0.05)
+                continue
+
+            result = self.visit(directory)
+            subdirectories = result[1] if result else []
+            if subdirectories:
+                # Count new directories before queueing them so pending never drops to zero early
+                with self.condition:
+                    self.pending += len(subdirectories)
+                    self.directories_found += len(subdirectories)
+                own_queue.extend(subdirectories)
+
+            if result:
+                self.on_directory(directory, *result)
+
+            with self.condition:
+                if result:
+                    self.visited.add(directory)
+                self.pending -= 1
+                self.directories_done += 1
+                directories_done, directories_found = self.directories_done, self.directories_found
+                if subdirectories or self.pending == 0:
+                    self.condition.notify_all()
+            if self.on_progress:
+                self.on_progress(directories_done, directories_found)
+
+
+# Incremental index scan
+class IndexScan:
+    """Brings the stored index for one root up to date with the file system.
+
+    Directories whose mtime matches the stored value are not listed again, so a
+    refresh only costs a stat per directory plus a listing of the changed ones.
+    Changes are written to the store and passed to apply_changes(added, removed)
+    in batches, added maps new and changed file paths to their records. A removed
+    file whose identity reappears at an added path was renamed or moved; those
+    (old path, new path) pairs are left in renamed. Files listed without an
+    identity keep their stored one, and added ones are stat'ed for it only when
+    the scan removed files to match them with.
+
+    Each listed directory is stored with the exclusion rules that skipped some of
+    its entries, so a rule change knows which directories to list again.
+
+    Subdirectories found by a listing are stored as pending (no mtime) in the same
+    batch as their parent, so they are listed by the next scan if this one is
+    cancelled or dies first. A cancelled scan keeps everything it wrote but does not
+    look for removed directories, it has not seen them all.
+    """
+    def __init__(
+        self, root, index_store, apply_changes, on_progress=None, batch_size=CRAWLER_BATCH_SIZE, is_cancelled=None, rules=None
+    ):
+        self.root = root
+        self.rules = rules
+        self.index_store = index_store
+        self.apply_changes = apply_changes
+        self.on_progress = on_progress
+        self.batch_size = batch_size
+        self.is_cancelled = is_cancelled
+        self.cancelled = False
+        self.lock = threading.Lock()
+        self.has_stored_files = False
+        self.directory_rows = []
+        self.pending_rows = []  # (path, parent) of subdirectories found but not listed yet
+        self.added = {}  # New file path -> record
+        self.updated = {}  # Indexed file path -> record, for files replaced or changed since the last scan
+        self.removed = []
+        self.added_identities = {}  # identity -> path, only tracked when there is a stored index to compare with
+        self.removed_identities = {}
+        self.unidentified = []  # Added paths listed without an identity, stat'ed if rename matching needs them
+        self.renamed = []
+        self.files_added = 0
+        self.files_removed = 0
+        self.directories_checked = 0
+        self.directories_listed = 0
+        self.directories_failed = 0
+        self.files_listed = 0
+        self.entries_excluded = 0
+
+    def run(self):
+        """Runs the scan. Counters are left on the IndexScan."""
+        known_directories = self.index_store.load_directories(self.root)
+        self.has_stored_files = self.index_store.has_files(self.root)
+        crawler = DirectoryCrawler(
+            self.root, self.on_directory, self.on_progress, known_directories, is_cancelled=self.is_cancelled, rules=self.rules
+        )
+        visited = crawler.run()
+        self.directories_checked = crawler.directories_done
+        self.directories_listed = crawler.directories_listed
+        self.directories_failed = crawler.directories_failed
+        self.entries_excluded = crawler.entries_excluded
+        if crawler.cancelled:
+            self.cancelled = True
+            with self.lock:
+                self.flush()
+            return
+
+        # Directories that were indexed before but are gone (or excluded) now
+        removed_directories = {path for path in known_directories if path not in visited}
+        if not known_directories and self.has_stored_files:
+            # First scan since the directory table existed, e.g. a migrated JSON index
+            removed_directories |= self.index_store.file_directories(self.root) - visited
+        removed_files = {}
+        for directory in removed_directories:
+            removed_files.update(self.index_store.files_in_directory(directory))
+
+        with self.lock:
+            self.removed.extend(removed_files)
+            self.track_removed(removed_files)
+            if self.removed_identities:
+                self.identify_added()
+            self.flush(removed_directories)
+            self.renamed = [
+                (old_path, self.added_identities[identity])
+                for identity, old_path in self.removed_identities.items() if identity in self.added_identities
+            ]
+
+    def on_directory(self, directory, mtime, subdirectories, files, exclusions):
+        if files is None:
+            return  # Unchanged, its stored row is still right
+        row = (directory, os.path.dirname(directory), mtime, json.dumps(exclusions) if exclusions else None)
+
+        old_files = self.index_store.files_in_directory(directory) if self.has_stored_files else {}
+        added = {}
+        updated = {}
+        for file_path, record in files.items():
+            old = old_files.get(file_path)
+            if old is None:
+                added[file_path] = record
+                continue
+            if record[0] is None and old[0] is not None:
+                record = (old[0],) + record[1:]  # Listed without an identity, keep the stored one
+            if old != record:
+                updated[file_path] = record
+        removed = {file_path: record for file_path, record in old_files.items() if file_path not in files}
+        with self.lock:
+            self.files_listed += len(files)
+            self.directory_rows.append(row)
+            self.pending_rows.extend((subdirectory, directory) for subdirectory in subdirectories)
+            self.added.update(added)
+            self.updated.update(updated)
+            self.removed.extend(removed)
+            if self.has_stored_files:
+                for file_path, record in added.items():
+                    if record[0]:
+                        self.added_identities[record[0]] = file_path
+                    else:
+                        self.unidentified.append(file_path)
+                self.track_removed(removed)
+            if len(self.added) + len(self.updated) + len(self.removed) + len(self.directory_rows) >= self.batch_size:
+                self.flush()
+
+    def track_removed(self, removed):
+        """Remembers the identities of removed files for rename matching. Called with self.lock held."""
+        self.removed_identities.update((record[0], file_path) for file_path, record in removed.items() if record[0])
+
+    def identify_added(self):
+        """Stats the added files that were listed without an identity, so they can be matched with removed ones.
+
+        The records are written with the next flush. Called with self.lock held.
+        """
+        for file_path in self.unidentified:
+            record = path_record(file_path)
+            if record is not None and record[0] is not None:
+                self.added_identities[record[0]] = file_path
+                self.updated[file_path] = record
+        self.unidentified = []
+
+    def flush(self, removed_directories=()):
+        """Writes the buffered changes in one transaction. Called with self.lock held."""
+        changed = {**self.added, **self.updated}
+        self.index_store.apply_scan_batch(self.directory_rows, changed, self.removed, removed_directories, self.pending_rows)
+        self.apply_changes(changed, self.removed)
+        self.files_added += len(self.added)
+        self.files_removed += len(self.removed)
+        self.directory_rows = []
+        self.pending_rows = []
+        self.added = {}
+        self.updated = {}
+        self.removed = []
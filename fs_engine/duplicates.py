@@ -0,0 +1,195 @@
+"""
+File Search Pro - duplicate file finder
+Copyright (C) 2024 [Kristopher Sorensen]
+
+Licensed under the GNU General Public License v3 or later, see LICENSE.txt.
+
+Duplicates are narrowed down in stages, each one cheaper than the next:
+
+1. files of equal size, straight from the in-memory index;
+2. equal hash of the first and last DUPLICATE_PARTIAL_BYTES;
+3. equal hash of the whole file, streamed in chunks.
+
+Hashing runs on a thread pool, hashlib releases the GIL while it works. Hashes are
+cached in the store by file identity together with the size and mtime they were
+computed for, so a later run only reads files that changed.
+"""
+
+import os
+import hashlib
+import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from .config import DUPLICATE_PARTIAL_BYTES, DUPLICATE_HASH_CHUNK_SIZE, DUPLICATE_WORKERS, DUPLICATE_SAVE_BATCH_SIZE
+from .crawler import path_record
+
+log = logging.getLogger(__name__)
+
+
+def new_hash():
+    return hashlib.blake2b(digest_size=16)
+
+
+def partial_hash(file_path, cached=None):
+    """Returns (size, mtime, partial hash, full hash or None) of a file, or None if it cannot be read. Runs on a worker thread.
+
+    cached is a stored (size, mtime, partial, full) entry, returned as is while the
+    file's size and mtime still match. A file of at most two blocks is read whole,
+    its partial hash is then also its full hash.
+    """
+    try:
+        stat = os.stat(file_path)
+        if cached is not None and cached[:2] == (stat.st_size, stat.st_mtime):
+            return cached
+        digest = new_hash()
+        with open(file_path, "rb") as f:
+            if stat.st_size <= 2 * DUPLICATE_PARTIAL_BYTES:
+                digest.update(f.read())
+            else:
+                digest.update(f.read(DUPLICATE_PARTIAL_BYTES))
+                f.seek(-DUPLICATE_PARTIAL_BYTES, os.SEEK_END)
+                digest.update(f.read(DUPLICATE_PARTIAL_BYTES))
+    except OSError as e:
+        log.debug("Could not hash %s: %s", file_path, e)
+        return None
+    partial = digest.digest()
+    return stat.st_size, stat.st_mtime, partial, partial if stat.st_size <= 2 * DUPLICATE_PARTIAL_BYTES else None
+
+
+def full_hash(file_path):
+    """Returns the hash of a whole file, or None if it cannot be read. Runs on a worker thread."""
+    digest = new_hash()
+    buffer = memoryview(bytearray(DUPLICATE_HASH_CHUNK_SIZE))
+    try:
+        with open(file_path, "rb", buffering=0) as f:
+            while True:
+                count = f.readinto(buffer)
+                if not count:
+                    break
+                digest.update(buffer[:count])
+    except OSError as e:
+        log.debug("Could not hash %s: %s", file_path, e)
+        return None
+    return digest.digest()
+
+
+# Duplicate finder
+class DuplicateFinder:
+    """Finds groups of files with identical contents, using and filling the store's hash cache.
+
+    Larger sizes are checked first, and whole-file hashes are scheduled ahead of
+    partial ones, so the groups that waste the most space are confirmed early.
+    At most twice as many files as there are workers are in flight at a time.
+    """
+    def __init__(self, index_store, workers=DUPLICATE_WORKERS):
+        self.index_store = index_store
+        self.workers = max(1, workers)
+        self.hashes_computed = 0  # Partial and full hashes the last find() could not take from the cache
+        self.groups_found = 0
+
+    def find(self, files, is_cancelled=None):
+        """Yields (size, hash, [paths]) for each group of identical files among (path, size) pairs.
+
+        Groups are yielded as soon as every file in them has been hashed.
+        """
+        by_size = {}
+        for file_path, size in files:
+            by_size.setdefault(size, []).append(file_path)
+        candidates = sorted(((size, paths) for size, paths in by_size.items() if len(paths) > 1), key=lambda group: -group[0])
+        candidate_paths = [file_path for _, paths in candidates for file_path in paths]
+        identities = self.index_store.file_identities(candidate_paths)
+        for file_path in candidate_paths:
+            if file_path not in identities:  # Indexed by a Windows scan, which leaves identities out
+                record = path_record(file_path)
+                if record is not None and record[0] is not None:
+                    identities[file_path] = record[0]
+        cached = self.index_store.load_hashes(set(identities.values()))
+        self.hashes_computed = 0
+        self.groups_found = 0
+
+        partial_jobs = deque((size, file_path) for size, paths in candidates for file_path in paths)
+        partials_left = {size: len(paths) for size, paths in candidates}  # Size group -> partial hashes to go
+        partials = {size: [] for size, _ in candidates}  # Size group -> [(path, (size, mtime, partial, full))]
+        full_jobs = deque()
+        fulls_left = {}  # (size, partial) -> full hashes to go
+        fulls = {}  # (size, partial) -> {full hash: [paths]}
+        new_hashes = []  # (identity, size, mtime, partial, full) rows for the cache
+
+        def finish_full_group(key):
+            for digest, paths in fulls.pop(key).items():
+                if len(paths) > 1:
+                    self.groups_found += 1
+                    yield key[0], digest.hex(), sorted(paths)
+
+        def finish_size_group(size):
+            groups = {}
+            for file_path, entry in partials.pop(size):
+                groups.setdefault((entry[0], entry[2]), []).append((file_path, entry))
+            for key, entries in groups.items():
+                if len(entries) < 2:
+                    continue
+                fulls[key] = {}
+                fulls_left[key] = 0
+                for file_path, entry in entries:
+                    if entry[3] is not None:
+                        fulls[key].setdefault(entry[3], []).append(file_path)
+                    else:
+                        full_jobs.append((key, file_path, entry))
+                        fulls_left[key] += 1
+                if not fulls_left[key]:
+                    yield from finish_full_group(key)
+
+        def remember(file_path, entry, old_entry):
+            identity = identities.get(file_path)
+            if identity is not None and entry != old_entry:
+                new_hashes.append((identity,) + entry)
+                if len(new_hashes) >= DUPLICATE_SAVE_BATCH_SIZE:
+                    self.index_store.save_hashes(new_hashes)
+                    new_hashes.clear()
+
+        running = {}  # future -> (stage, group key, path, entry)
+        pool = ThreadPoolExecutor(max_workers=self.workers)
+        try:
+            while running or partial_jobs or full_jobs:
+                if is_cancelled is not None and is_cancelled():
+                    break
+                while len(running) < 2 * self.workers and (full_jobs or partial_jobs):
+                    if full_jobs:
+                        key, file_path, entry = full_jobs.popleft()
+                        running[pool.submit(full_hash, file_path)] = ("full", key, file_path, entry)
+                    else:
+                        size, file_path = partial_jobs.popleft()
+                        old_entry = cached.get(identities.get(file_path))
+                        running[pool.submit(partial_hash, file_path, old_entry)] = ("partial", size, file_path, old_entry)
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    stage, key, file_path, entry = running.pop(future)
+                    if stage == "partial":
+                        result = future.result()
+                        if result is not None:
+                            if result is not entry:
+                                self.hashes_computed += 1
+                            remember(file_path, result, entry)
+                            partials[key].append((file_path, result))
+                        partials_left[key] -= 1
+                        if not partials_left[key]:
+                            yield from finish_size_group(key)
+                    else:
+                        digest = future.result()
+                        self.hashes_computed += 1
+                        if digest is not None:
+                            remember(file_path, entry[:3] + (digest,), entry)
+                            fulls[key].setdefault(digest, []).append(file_path)
+                        fulls_left[key] -= 1
+                        if not fulls_left[key]:
+                            yield from finish_full_group(key)
+        finally:
+            # Also runs when the caller stops reading, work already started is kept in the cache
+            for future in running:
+                future.cancel()
+            pool.shutdown(wait=True)
+            if new_hashes:
+                self.index_store.save_hashes(new_hashes)
+        log.info("Found %d duplicate groups, %d hashes computed.", self.groups_found, self.hashes_computed)
@@ -0,0 +1,910 @@
+"""
+File Search Pro - headless indexing and search engine
+Copyright (C) 2024 [Kristopher Sorensen]
+
+Licensed under the GNU General Public License v3 or later, see LICENSE.txt.
+"""
+
+import os
+import time
+import heapq
+import logging
+import itertools
+import threading
+from array import array
+from collections import Counter
+
+from .config import (
+    INDEX_DB_FILE, INDEX_FILE, TAGS_FILE, MAX_DIRECTORIES, PROTECTED_DIRECTORIES, FUZZY_RESULT_LIMIT, CONTENT_RESULT_LIMIT,
+    DUPLICATE_MIN_SIZE, CLOSE_TIMEOUT
+)
+from .content import ContentIndexer, tokenize
+from .crawler import IndexScan, LISTING_HAS_IDENTITY, path_record
+from .duplicates import DuplicateFinder
+from .exclusions import ExclusionRules, needs_relisting, parse_rules
+from .fuzzy import rank
+from .jobs import CancelToken, IndexJob, DONE, CANCELLED, FAILED
+from .metrics import Metrics, TimedLock, COUNTER
+from .pathtable import PathTable
+from .query import parse_query, suffix_terms, with_terms, bind, run
+from .reconciler import Reconciler
+from .store import IndexStore
+from .tags import TagManager
+
+log = logging.getLogger(__name__)
+
+# A result ref names one indexed file across every shard: the shard slot above REF_SHIFT, the file id below it
+REF_SHIFT = 32
+REF_MASK = (1 << REF_SHIFT) - 1
+
+
+def is_safe_path(base_path, target_path):
+    """Ensure the target path is within the base path."""
+    base_path = os.path.abspath(base_path)
+    target_path = os.path.abspath(target_path)
+    try:
+        return os.path.commonpath([base_path]) == os.path.commonpath([base_path, target_path])
+    except ValueError:
+        return False  # Paths on different drives
+
+
+# Per directory index shard
+class IndexShard:
+    """In-memory path table for one monitored directory."""
+    def __init__(self, root, slot):
+        self.root = root
+        self.slot = slot  # Unique per shard for the life of the engine, so refs never point into a later shard
+        self.ref_base = slot << REF_SHIFT
+        self.table = PathTable(root)
+        self.loaded = False  # True once the stored index has been read
+        self.load_seconds = None  # Time load_shard() took
+        self.name_index_seconds = None  # Time index_names() took
+
+    def apply_changes(self, added, removed):
+        """Updates the path table from {path: (identity, size, mtime, ctime)} and removed paths. The caller holds the engine lock."""
+        for file_path in removed:
+            self.table.remove(file_path)
+        for file_path, record in added.items():
+            self.table.add(file_path, *record[1:])
+
+    def refs(self, file_ids):
+        """Returns an iterator over the result refs of file ids of this shard."""
+        return map(self.ref_base.__or__, file_ids)
+
+
+# Search engine
+class SearchEngine:
+    """Indexing, persistence, watching, tags and query matching without any GUI.
+
+    Every monitored directory has its own IndexShard. Methods that scan run
+    synchronously; callers decide which thread to run them on.
+    """
+    def __init__(self, db_path=INDEX_DB_FILE, legacy_index_file=INDEX_FILE, tags_file=TAGS_FILE):
+        self.metrics = Metrics()  # Scan, event, store, lock and query metrics, see metrics.py
+        self.metrics.add_collector(self.collect_metrics)
+        self.index_store = IndexStore(db_path, legacy_index_file, self.metrics)
+        self.tag_manager = TagManager(tags_file)
+        self.lock = TimedLock(self.metrics, "engine")  # Guards the shards
+        self.directories = []  # Monitored directory paths, in dropdown order
+        self.shards = {}  # Directory path -> IndexShard
+        self.slots = {}  # Shard slot -> IndexShard, resolves result refs
+        self.next_slot = itertools.count(1)
+        self.last_modified_time = 0
+        self.event_queue = None
+        self.observer = None  # Watchdog observer shared by every directory
+        self.watches = {}  # Directory path -> watchdog watch
+        self.watch_lock = threading.RLock()  # Guards the observer and watches, watching may start on a background thread
+        self.watch_errors = {}  # Directory path -> why it could not be watched
+        self.reconciler = None  # Polls directories whose file events are unreliable, runs while watching
+        self.content_indexing = False  # Index the text of text and source files, stored in the index meta table
+        self.content_indexer = ContentIndexer(self.index_store)
+        self.content_snippets = {}  # File path -> (line, text) for the results of the last content: query
+        self.duplicate_finder = DuplicateFinder(self.index_store)
+        self.exclusion_rules = {}  # Directory path -> its own exclusion rule lines, stored in the index meta table
+        self.rule_matchers = {}  # Directory path -> compiled ExclusionRules
+        self.jobs = {}  # Directory path -> the IndexJob scanning it, at most one per directory
+        self.index_token = CancelToken()  # Parent token of every job, replaced by cancel_indexing()
+
+    def load(self):
+        """Loads the saved directory list. File sets are read by load_shard()."""
+        saved_data = self.index_store.load()
+        self.directories = saved_data["directories"]
+        self.last_modified_time = saved_data["last_modified_time"]
+        self.content_indexing = bool(self.index_store.get_meta("content_indexing", False))
+        self.exclusion_rules = self.index_store.get_meta("exclusion_rules", {})
+        self.rule_matchers = {}
+        with self.lock:
+            self.shards = {}
+            self.slots = {}
+            for directory in self.directories:
+                self.create_shard(directory)
+        return self.directories
+
+    def create_shard(self, directory):
+        """Creates the empty shard of a directory. The caller holds the lock."""
+        shard = self.shards[directory] = IndexShard(directory, next(self.next_slot))
+        self.slots[shard.slot] = shard
+        return shard
+
+    def save(self):
+        """Saves the directory list. File rows are written as they change."""
+        self.index_store.save_directories(self.directories, self.last_modified_time)
+
+    def add_directory(self, directory):
+        """Adds a monitored directory. Raises ValueError if it cannot be added."""
+        if os.path.abspath(directory) in PROTECTED_DIRECTORIES:
+            raise ValueError(f"The selected directory '{directory}' cannot be added as it is a protected system directory.")
+        if directory in self.directories:
+            raise ValueError("This directory is already added.")
+        if len(self.directories) >= MAX_DIRECTORIES:
+            raise ValueError(f"You can only monitor up to {MAX_DIRECTORIES} directories.")
+
+        self.directories.append(directory)
+        with self.lock:
+            self.create_shard(directory)
+        self.save()
+        if self.observer is not None:
+            self.update_watches()
+
+    def remove_directory(self, directory):
+        """Stops monitoring a directory and drops its index rows."""
+        self.directories.remove(directory)
+        with self.lock:
+            job = self.jobs.get(directory)
+        if job is not None:
+            job.cancel()
+            job.wait()
+        with self.lock:
+            shard = self.shards.pop(directory, None)
+            if shard is not None:
+                del self.slots[shard.slot]
+        self.metrics.remove(root=directory)
+        if self.observer is not None:
+            self.update_watches()
+        self.index_store.remove_root(directory)
+        self.rule_matchers.pop(directory, None)
+        if self.exclusion_rules.pop(directory, None) is not None:
+            self.index_store.set_meta("exclusion_rules", self.exclusion_rules)
+        self.save()
+
+    def rules_for(self, root):
+        """Returns the compiled exclusion rules of a monitored directory."""
+        matcher = self.rule_matchers.get(root)
+        if matcher is None:
+            matcher = self.rule_matchers[root] = ExclusionRules(root, self.exclusion_rules.get(root, ()))
+        return matcher
+
+    def set_exclusion_rules(self, root, lines):
+        """Replaces the exclusion rules of a monitored directory, see exclusions.py. Raises ValueError for an invalid rule.
+
+        Indexed files and directories that the new rules exclude are dropped at once,
+        without touching the disk. Directories where a rule that no longer applies
+        skipped entries lose their mtime, so the next scan lists only those again.
+        Returns {"files_removed", "directories_pruned", "directories_relisted"}.
+        """
+        if root not in self.directories:
+            raise ValueError(f"'{root}' is not a monitored directory.")
+        old_rules = self.rules_for(root)
+        new_rules = ExclusionRules(root, lines)
+        with self.lock:
+            job = self.jobs.get(root)
+        if job is not None:
+            # A scan running with the old rules would store what they let through, the next scan resumes it
+            job.cancel()
+            job.wait()
+        self.load_shard(root)
+        self.exclusion_rules[root] = parse_rules(lines)
+        self.rule_matchers[root] = new_rules
+        self.index_store.set_meta("exclusion_rules", self.exclusion_rules)
+
+        # Parents sort before their children, so a directory below a pruned one is seen after it
+        pruned = []
+        excluded_directories = set()
+        fired = {}  # Directory -> rules that exclude entries of it now, recorded as if it had been listed
+        for directory in sorted(self.index_store.load_directories(root)):
+            if directory == root:
+                continue
+            parent = os.path.dirname(directory)
+            if parent in excluded_directories:
+                excluded_directories.add(directory)
+                continue
+            rule = new_rules.match(directory, os.path.basename(directory), True)
+            if rule is not None:
+                excluded_directories.add(directory)
+                pruned.append(directory)
+                fired.setdefault(parent, set()).add(rule)
+
+        with self.lock:
+            shard = self.shards[root]
+            table = shard.table
+            file_ids = array("I", table.ids())
+        # Rows are only ever appended, so the snapshot is checked without the lock
+        removed = []
+        match = new_rules.match
+        for file_id in file_ids:
+            file_path = table.path(file_id)
+            directory = os.path.dirname(file_path)
+            if directory in excluded_directories:
+                removed.append(file_path)
+                continue
+            rule = match(file_path, table.names[file_id], False, table.file_size[file_id])
+            if rule is not None:
+                removed.append(file_path)
+                fired.setdefault(directory, set()).add(rule)
+
+        relisted = [
+            directory for directory, fired in self.index_store.directory_exclusions(root).items()
+            if directory not in excluded_directories and needs_relisting(fired, old_rules.lines, new_rules.lines)
+        ]
+        self.index_store.apply_rule_change(removed, pruned, relisted, fired)
+        with self.lock:
+            if self.shards.get(root) is shard:
+                shard.apply_changes({}, removed)
+        if self.content_indexing and removed:
+            self.content_indexer.update([], removed)
+        log.info(
+            "Exclusion rules of %s changed: %d files removed, %d directories pruned, %d to list again.",
+            root, len(removed), len(pruned), len(relisted)
+        )
+        return {"files_removed": len(removed), "directories_pruned": len(pruned), "directories_relisted": len(relisted)}
+
+    def set_content_indexing(self, enabled):
+        """Turns the content index on or off. Turning it off drops the stored content index."""
+        self.content_indexing = enabled
+        self.index_store.set_meta("content_indexing", enabled)
+        if not enabled:
+            self.index_store.clear_content()
+
+    def load_shard(self, root):
+        """Reads the stored file set of a directory into memory. Returns False if it was already loaded."""
+        with self.lock:
+            shard = self.shards.get(root)
+        if shard is None or shard.loaded:
+            return False
+
+        # The path table is built before taking the lock. Its trigram index is left to index_names(), so the
+        # directory is searchable sooner; until then names are matched by scanning the name block
+        started = time.perf_counter()
+        table = PathTable(root, name_index=False)
+        table.load(self.index_store.load_files(root))
+        with self.lock:
+            shard.table = table
+            shard.loaded = True
+        shard.load_seconds = time.perf_counter() - started
+        self.metrics.observe("filesearch_index_load_seconds", shard.load_seconds, root=root)
+        log.info("Loaded %d stored files for directory: %s (%.2f s)", len(table), root, shard.load_seconds)
+        return True
+
+    def index_names(self, root):
+        """Builds the trigram name index that load_shard() leaves out. Returns False if there was nothing to build."""
+        with self.lock:
+            shard = self.shards.get(root)
+            if shard is None or shard.table.name_index is not None:
+                return False
+            table = shard.table
+            count = len(table.names)
+        # Rows are only ever appended, the files added meanwhile are indexed once the lock is held again
+        started = time.perf_counter()
+        name_index = table.build_name_index(count)
+        with self.lock:
+            if shard.table is not table:
+                return False
+            table.set_name_index(name_index, count)
+        shard.name_index_seconds = time.perf_counter() - started
+        self.metrics.observe("filesearch_name_index_seconds", shard.name_index_seconds, root=root)
+        log.info("Built the name index for directory: %s (%.2f s)", root, shard.name_index_seconds)
+        return True
+
+    def scan_directory(self, root, on_progress=None, parent_token=None, quiet=False):
+        """Brings one directory's index up to date. Returns the IndexScan, or None if the directory is unknown.
+
+        The scan runs as the directory's IndexJob. If a job for the directory is
+        already running this waits for it and returns its scan instead of starting a
+        second one. A cancelled scan returns early with scan.cancelled set. quiet
+        logs the start and end of the scan at debug level, for background passes.
+        """
+        level = logging.DEBUG if quiet else logging.INFO
+        with self.lock:
+            shard = self.shards.get(root)
+            if shard is None:
+                return None
+            running = self.jobs.get(root)
+            if running is None:
+                job = self.jobs[root] = IndexJob(root, parent_token or self.index_token)
+        if running is not None:
+            log.info("Directory %s is already being indexed, waiting for that scan.", root)
+            running.wait()
+            return running.scan
+
+        def apply_changes(added, removed):
+            with self.lock:
+                if self.shards.get(root) is shard:  # Skip if the directory was removed meanwhile
+                    shard.apply_changes(added, removed)
+
+        current_progress = 0
+
+        def report_progress(directories_done, directories_found):
+            # The tree size is unknown up front, so progress is directories listed out of directories found
+            nonlocal current_progress
+            new_progress = min(99, int(directories_done / directories_found * 100))
+            if new_progress > current_progress:  # Report only if progress has increased
+                current_progress = new_progress
+                on_progress(current_progress)
+
+        # Only directories whose mtime changed since the last scan, or that an interrupted scan never listed, are listed
+        try:
+            job.pending_directories = self.index_store.pending_directory_count(root)
+            if job.resumed:
+                log.log(level, "Resuming indexing for directory: %s (%d directories left)", root, job.pending_directories)
+            else:
+                log.log(level, "Starting indexing for directory: %s", root)
+            scan = job.scan = IndexScan(
+                root, self.index_store, apply_changes, report_progress if on_progress else None, is_cancelled=job.is_cancelled,
+                rules=self.rules_for(root)
+            )
+            scan.run()
+        except Exception as e:
+            job.finish(FAILED, str(e))
+            self.record_scan(job)
+            raise
+        finally:
+            with self.lock:
+                del self.jobs[root]
+        if scan.directories_failed:
+            log.warning("Could not list %d directories in %s.", scan.directories_failed, root)
+        if scan.cancelled:
+            log.log(level, "Indexing cancelled for directory: %s, the next scan resumes it.", root)
+            job.finish(CANCELLED)
+            self.record_scan(job)
+            return scan
+
+        log.log(
+            level, "Checked %d directories, listed %d: %d files added, %d removed.",
+            scan.directories_checked, scan.directories_listed, scan.files_added, scan.files_removed
+        )
+        self.follow_renames(scan.renamed)
+        if not LISTING_HAS_IDENTITY:
+            self.identify_tagged_files(root)
+        job.finish(DONE)
+        self.record_scan(job)
+        return scan
+
+    def reconcile_directory(self, root, parent_token=None):
+        """Runs a background pass over one directory for the Reconciler. Returns the IndexScan.
+
+        Returns None without scanning if the directory is gone, its stored index is
+        not loaded yet or it is being scanned already. Pending file events are
+        applied first, so the pass only finds changes they missed.
+        """
+        with self.lock:
+            shard = self.shards.get(root)
+            if shard is None or not shard.loaded or root in self.jobs:
+                return None
+        event_queue = self.event_queue
+        if event_queue is not None:
+            event_queue.flush()
+        token = parent_token or self.index_token
+        scan = self.scan_directory(root, parent_token=token, quiet=True)
+        if scan is not None and not scan.cancelled and self.content_indexing and (scan.files_added or scan.files_removed):
+            self.index_content(root, token.is_cancelled)
+        return scan
+
+    def record_scan(self, job):
+        """Adds an ended scan job to the metrics: totals, duration and rates per directory."""
+        metrics = self.metrics
+        root = job.root
+        seconds = job.finished - job.started
+        metrics.inc("filesearch_scans_total", root=root, state=job.state)
+        metrics.observe("filesearch_scan_seconds", seconds, root=root)
+        scan = job.scan
+        if scan is None:
+            return
+        metrics.inc("filesearch_scan_directories_checked_total", scan.directories_checked, root=root)
+        metrics.inc("filesearch_scan_directories_listed_total", scan.directories_listed, root=root)
+        metrics.inc("filesearch_scan_directories_failed_total", scan.directories_failed, root=root)
+        metrics.inc("filesearch_scan_files_listed_total", scan.files_listed, root=root)
+        metrics.inc("filesearch_scan_entries_excluded_total", scan.entries_excluded, root=root)
+        metrics.inc("filesearch_scan_files_added_total", scan.files_added, root=root)
+        metrics.inc("filesearch_scan_files_removed_total", scan.files_removed, root=root)
+        if seconds > 0:
+            metrics.set("filesearch_scan_directories_per_second", round(scan.directories_checked / seconds, 1), root=root)
+            metrics.set("filesearch_scan_files_per_second", round(scan.files_listed / seconds, 1), root=root)
+
+    def cancel_indexing(self, timeout=None):
+        """Cancels every running scan and any index_directories() call still working through its directories.
+
+        Scans stop after the directories being listed, and what they wrote is kept.
+        Waits up to timeout seconds (None: no limit, 0: not at all) and returns True
+        if every job has ended.
+        """
+        with self.lock:
+            self.index_token.cancel()
+            self.index_token = CancelToken()
+            jobs = list(self.jobs.values())
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for job in jobs:
+            if not job.wait(None if deadline is None else max(0, deadline - time.monotonic())):
+                return False
+        return True
+
+    def follow_renames(self, renamed):
+        """Moves tags along with files that were renamed or moved, matched by file identity."""
+        moved = self.tag_manager.rename_files(renamed) if renamed else 0
+        if moved:
+            log.info("Moved the tags of %d renamed files.", moved)
+        return moved
+
+    def identify_tagged_files(self, root):
+        """Stores the identities of the tagged files of a directory that were indexed without one.
+
+        Scans on Windows leave file identities out, and tags can only follow a
+        rename of a file whose identity is stored.
+        """
+        with self.tag_manager.lock:
+            tagged = [file_path for file_path in self.tag_manager.tags if is_safe_path(root, file_path)]
+        with self.lock:
+            shard = self.shards.get(root)
+            tagged = [file_path for file_path in tagged if shard is not None and file_path in shard.table]
+        identities = self.index_store.file_identities(tagged)
+        records = {}
+        for file_path in tagged:
+            if file_path not in identities:
+                record = path_record(file_path)
+                if record is not None and record[0] is not None:
+                    records[file_path] = record
+        if records:
+            self.index_store.apply_scan_batch([], records, [])
+
+    def index_directories(self, roots=None, on_progress=None, on_loaded=None):
+        """Loads and incrementally re-indexes directories (default: all). Returns the IndexScan per directory.
+
+        Every stored index is loaded before the first scan starts, so all
+        directories are searchable as early as possible. cancel_indexing() stops
+        the running scan and skips the directories not started yet.
+        """
+        roots = list(self.directories) if roots is None else roots
+        token = self.index_token
+        scans = {}
+        for root in roots:
+            if token.is_cancelled():
+                break
+            if self.load_shard(root) and on_loaded:
+                on_loaded(root)
+        for root in roots:
+            if token.is_cancelled():
+                break
+            self.index_names(root)
+            scan = self.scan_directory(root, on_progress, token)
+            if scan is not None:
+                scans[root] = scan
+                if self.content_indexing and not scan.cancelled:
+                    self.index_content(root, token.is_cancelled)
+        self.last_modified_time = time.time()
+        self.save()
+        return scans
+
+    def index_content(self, root, is_cancelled=None):
+        """Brings the content index of one directory up to date with its file set."""
+        with self.lock:
+            shard = self.shards.get(root)
+            if shard is None:
+                return 0
+            table = shard.table
+            file_ids = list(table.ids())
+        # Rows are only ever appended, so the paths can be joined outside the lock
+        indexed = self.content_indexer.scan(root, [table.path(file_id) for file_id in file_ids], is_cancelled)
+        log.info("Content indexed %d new or changed files in %s.", indexed, root)
+        return indexed
+
+    def find_duplicates(self, roots=None, min_size=DUPLICATE_MIN_SIZE, is_cancelled=None):
+        """Yields (size, hash, [paths]) for each group of identical files in the given directories (default: all).
+
+        Files are only hashed when another indexed file has the same size, and each
+        group is yielded as soon as it is confirmed, largest files first.
+        """
+        with self.lock:
+            snapshot = [
+                (self.shards[root].table, array("I", self.shards[root].table.ids()))
+                for root in (self.directories if roots is None else roots) if root in self.shards
+            ]
+        # Count sizes first so paths are only joined for files that share a size with another file
+        sizes = Counter(size for table, file_ids in snapshot for size in map(table.file_size.__getitem__, file_ids))
+        files = (
+            (table.path(file_id), size)
+            for table, file_ids in snapshot for file_id, size in zip(file_ids, map(table.file_size.__getitem__, file_ids))
+            if size >= min_size and sizes[size] > 1
+        )
+        yield from self.duplicate_finder.find(files, is_cancelled)
+        if roots is None:
+            self.index_store.prune_hashes()
+
+    def extension_counts(self, roots=None):
+        """Returns {extension: indexed file count} for the given directories (default: all).
+
+        The counts are kept current by the path tables, so this never walks the files.
+        """
+        counts = {}
+        with self.lock:
+            for root in (self.shards if roots is None else roots):
+                shard = self.shards.get(root)
+                if shard is None:
+                    continue
+                for extension, count in shard.table.count_extensions().items():
+                    counts[extension] = counts.get(extension, 0) + count
+        return counts
+
+    def file_count(self, roots=None):
+        """Returns the number of indexed files in the given directories (default: all)."""
+        with self.lock:
+            roots = self.shards if roots is None else roots
+            return sum(len(self.shards[root].table) for root in roots if root in self.shards)
+
+    def start_watching(self):
+        """Starts the shared observer and the event queue, and watches every directory."""
+        with self.watch_lock:
+            if self.observer is None:
+                # Imported here so searching and scanning work without watchdog installed
+                from watchdog.observers import Observer
+                from .events import FileEventQueue, FileMonitorHandler
+
+                self.event_queue = FileEventQueue(self.apply_file_events, metrics=self.metrics)
+                self.event_handler = FileMonitorHandler(self.event_queue)
+                self.observer = Observer()
+                self.observer.start()
+            self.update_watches()
+            if self.reconciler is None:
+                self.reconciler = Reconciler(self)
+
+    def update_watches(self):
+        """Schedules new directories on the observer and unschedules removed ones."""
+        with self.watch_lock:
+            if self.observer is None:
+                return
+            for directory in list(self.watches):
+                if directory not in self.directories:
+                    self.observer.unschedule(self.watches.pop(directory))
+                    log.info("Monitoring stopped for directory: %s", directory)
+            for directory in list(self.watch_errors):
+                if directory not in self.directories:
+                    del self.watch_errors[directory]
+
+            for directory in self.directories:
+                if directory not in self.watches and directory not in self.watch_errors:
+                    try:
+                        self.watches[directory] = self.observer.schedule(self.event_handler, directory, recursive=True)
+                        log.info("Monitoring started for directory: %s", directory)
+                    except OSError as e:
+                        # The reconciler polls the directory instead
+                        self.watch_errors[directory] = str(e)
+                        log.warning("Could not monitor directory %s: %s", directory, e)
+            if self.reconciler is not None:
+                self.reconciler.update()
+
+    def stopped_watches(self):
+        """Returns {directory: reason} for the directories that get no file events: their watch failed or stopped."""
+        with self.watch_lock:
+            if self.observer is None:
+                return {}
+            alive = {emitter.watch for emitter in self.observer.emitters if emitter.is_alive()}
+            stopped = {directory: f"watch failed: {error}" for directory, error in self.watch_errors.items()}
+            stopped.update((directory, "watch stopped") for directory, watch in self.watches.items() if watch not in alive)
+            return stopped
+
+    def stop_watching(self):
+        """Stops the reconciler and the observer, and applies any pending events."""
+        # Stopped before taking the watch lock, the reconciler thread takes it too
+        reconciler, self.reconciler = self.reconciler, None
+        if reconciler is not None:
+            reconciler.stop()
+        with self.watch_lock:
+            if self.observer is not None:
+                self.observer.stop()
+                self.observer.join()
+                self.observer = None
+                self.watches = {}
+                self.watch_errors = {}
+                log.info("Observer stopped.")
+            if self.event_queue is not None:
+                self.event_queue.stop()
+                self.event_queue = None
+
+    def close(self):
+        """Cancels indexing, stops watching and closes the index store."""
+        if not self.cancel_indexing(CLOSE_TIMEOUT):
+            log.warning("Indexing did not stop within %s seconds, closing anyway.", CLOSE_TIMEOUT)
+        self.stop_watching()
+        self.index_store.close()
+
+    def apply_file_events(self, added, removed):
+        """Applies a batch of coalesced watchdog events to the index in one store transaction.
+
+        added holds created and modified paths. Modified files that are already indexed
+        get their size and times updated.
+        """
+        added_events = added
+        # Stat before taking the lock, files that are gone again by now are skipped
+        records = {}
+        roots = list(self.directories)
+        for file_path in added:
+            record = path_record(file_path)
+            if record is None:
+                continue
+            root = next((root for root in roots if is_safe_path(root, file_path)), None)
+            # Files in an excluded directory are skipped too, the scan never lists it
+            if root is None or self.rules_for(root).match_path(file_path, record[1]) is None:
+                records[file_path] = record
+
+        with self.lock:
+            shards = list(self.shards.values())
+            changes = {}  # shard -> ({added or modified path: record}, [removed path])
+            modified = {}
+            blocked = 0
+            for file_path, is_added in itertools.chain(((path, True) for path in records), ((path, False) for path in removed)):
+                matched = False
+                for shard in shards:
+                    if is_safe_path(shard.root, file_path):
+                        matched = True
+                        file_id = shard.table.file_id(file_path)
+                        if is_added and (file_id is None or shard.table.metadata(file_id) != records[file_path][1:]):
+                            changes.setdefault(shard, ({}, []))[0][file_path] = records[file_path]
+                            if file_id is not None:
+                                modified[file_path] = records[file_path]
+                        elif not is_added and file_id is not None:
+                            changes.setdefault(shard, ({}, []))[1].append(file_path)
+                blocked += not matched
+
+            for shard, (shard_added, shard_removed) in changes.items():
+                shard.apply_changes(shard_added, shard_removed)
+
+        if blocked:
+            log.warning("Blocked %d file paths outside the monitored directories.", blocked)
+        added = {
+            file_path: record for shard_added, _ in changes.values()
+            for file_path, record in shard_added.items() if file_path not in modified
+        }
+        removed = {file_path for _, shard_removed in changes.values() for file_path in shard_removed}
+        if self.content_indexing:
+            # Modified files are in added too, their content changed even though the index entry did not
+            with self.lock:
+                indexed_files = [
+                    file_path for file_path in added_events
+                    if any(file_path in shard.table for shard in shards)
+                ]
+            self.content_indexer.update(indexed_files, removed)
+        if not added and not removed and not modified:
+            return 0
+
+        # A removed path whose identity shows up again under an added path was renamed or moved
+        removed_identities = self.index_store.file_identities(removed)
+        self.index_store.apply_scan_batch([], {**added, **modified}, removed)
+        log.debug("Index updated: %d files added, %d modified, %d removed.", len(added), len(modified), len(removed))
+
+        new_paths = {record[0]: file_path for file_path, record in added.items() if record[0]}
+        self.follow_renames([
+            (old_path, new_paths[identity]) for old_path, identity in removed_identities.items() if identity in new_paths
+        ])
+        return len(added) + len(modified) + len(removed)
+
+    def prepare_query(self, query, roots=None, suffixes=(), fuzzy=False, is_cancelled=None, sort=None, descending=False):
+        """Returns the candidate result refs and a per-ref predicate (or None) for a query.
+
+        query is written in the query language of query.py: file name text, ext:,
+        tag:, path:, content:, size: and modified: terms, globs and regular
+        expressions, combined with AND, OR and NOT. Every entry in suffixes must
+        also match the end of the file name. With fuzzy set, the plain words of the
+        query match names that contain their characters in order, and the best
+        FUZZY_RESULT_LIMIT names that match the rest of the query come back ranked,
+        best first. sort orders the results by one of SORT_COLUMNS instead.
+        Candidates are produced lazily from the path tables; path_of() turns a ref
+        into a file path.
+        """
+        parsed = self.compile_query(query, roots, suffixes)
+        if fuzzy:
+            text, rest = parsed.split_fuzzy()
+            if text:
+                candidates = self.rank_fuzzy(text, rest, roots, is_cancelled)
+                if sort is not None:
+                    candidates.sort(key=self.ref_sort_key(self.shard_tables(roots), sort), reverse=descending)
+                return candidates, None
+
+        with self.lock:
+            searches = [(shard, run(plan, sort, descending)) for shard, plan in self.plan_query(parsed, roots)]
+        tables = {shard.slot: shard.table for shard, _ in searches}
+        refs = [shard.refs(file_ids) for shard, file_ids in searches]
+        if sort is not None and len(refs) > 1:
+            return heapq.merge(*refs, key=self.ref_sort_key(tables, sort), reverse=descending), None
+        return itertools.chain.from_iterable(refs), None
+
+    def compile_query(self, query, roots=None, suffixes=()):
+        """Parses a query, adds the required suffixes and looks up the files of its tag: and content: terms."""
+        parsed = with_terms(parse_query(query), suffix_terms(suffixes))
+        for warning in parsed.warnings:
+            log.debug("Query %r: %s", query, warning)
+        self.content_snippets = {}
+        parsed.resolve(
+            lambda text: self.tag_manager.find_files(text),
+            lambda text: self.search_content(text, roots, suffixes),
+        )
+        return parsed
+
+    def plan_query(self, parsed, roots=None):
+        """Returns [(shard, plan)]: a parsed query compiled for each selected directory. Call with the lock held."""
+        return [
+            (self.shards[root], bind(parsed.root, self.shards[root].table))
+            for root in (self.directories if roots is None else roots) if root in self.shards
+        ]
+
+    def explain(self, query, roots=None, suffixes=()):
+        """Runs a query and returns its plan for each directory with the candidates every stage produced and passed.
+
+        The result is a JSON serialisable dict, query.explain_text() formats it.
+        """
+        started = time.perf_counter()
+        parsed = self.compile_query(query, roots, suffixes)
+        with self.lock:
+            searches = self.plan_query(parsed, roots)
+            for _, plan in searches:
+                plan.instrument()
+            searches = [(shard, plan, run(plan)) for shard, plan in searches]
+        directories = [
+            {"directory": shard.root, "results": sum(1 for _ in file_ids), "plan": plan.explain()}
+            for shard, plan, file_ids in searches
+        ]
+        return {
+            "query": query,
+            "kind": parsed.kind(),
+            "warnings": parsed.warnings,
+            "directories": directories,
+            "results": sum(directory["results"] for directory in directories),
+            "seconds": round(time.perf_counter() - started, 6),
+        }
+
+    @staticmethod
+    def ref_sort_key(tables, column):
+        """Returns key(ref) sorting result refs of the given {slot: path table} by one of SORT_COLUMNS."""
+        keys = {slot: table.sort_key(column) for slot, table in tables.items()}
+        return lambda ref: keys[ref >> REF_SHIFT](ref & REF_MASK)
+
+    def shard_tables(self, roots=None):
+        """Returns {slot: path table} of the given directories (default: all)."""
+        with self.lock:
+            roots = self.directories if roots is None else roots
+            return {self.shards[root].slot: self.shards[root].table for root in roots if root in self.shards}
+
+    def file_refs(self, file_paths, roots=None):
+        """Returns the result refs of the indexed files among file_paths, in order."""
+        refs = []
+        with self.lock:
+            shards = [self.shards[root] for root in (self.directories if roots is None else roots) if root in self.shards]
+            for file_path in file_paths:
+                for shard in shards:
+                    file_id = shard.table.file_id(file_path)
+                    if file_id is not None:
+                        refs.append(shard.ref_base | file_id)
+                        break
+        return refs
+
+    def path_of(self, ref):
+        """Returns the file path of a result ref, or None if its directory is no longer monitored."""
+        shard = self.slots.get(ref >> REF_SHIFT)
+        return None if shard is None else shard.table.path(ref & REF_MASK)
+
+    def metadata_of(self, ref):
+        """Returns (size, mtime, ctime) of a result ref, or None if its directory is no longer monitored."""
+        shard = self.slots.get(ref >> REF_SHIFT)
+        return None if shard is None else shard.table.metadata(ref & REF_MASK)
+
+    def file_metadata(self, file_path):
+        """Returns (size, mtime, ctime) of an indexed file path, or None if it is not indexed."""
+        refs = self.file_refs([file_path])
+        return self.metadata_of(refs[0]) if refs else None
+
+    def search_content(self, text, roots=None, suffixes=()):
+        """Returns the paths of files containing every word of text (each as a word prefix) and keeps their snippets.
+
+        Snippets come from the content index, no file is opened. They are left in
+        content_snippets as {path: (line, text)} until the next query.
+        """
+        def accept(file_path):
+            file_path = file_path.lower()
+            return all(file_path.endswith(suffix) for suffix in suffixes)
+
+        roots = self.directories if roots is None else roots
+        suffixes = [suffix.lower() for suffix in suffixes]
+        matches = self.index_store.search_content(tokenize(text), roots, CONTENT_RESULT_LIMIT, accept if suffixes else None)
+        self.content_snippets.update((file_path, (line, snippet)) for file_path, line, snippet in matches)
+        return [file_path for file_path, _, _ in matches]
+
+    def rank_fuzzy(self, text, rest=None, roots=None, is_cancelled=None):
+        """Returns the refs of the best fuzzy matches of text across the selected directories, best first.
+
+        rest is a parsed query the names must match as well, see Query.split_fuzzy().
+        """
+        with self.lock:
+            # The name blocks are immutable snapshots, ranking them does not need the lock
+            name_blocks = [
+                (shard.ref_base, shard.table.name_block(), None if rest is None or rest.root is None else plan.test)
+                for shard, plan in self.plan_query(rest or parse_query(""), roots)
+            ]
+
+        ranked = []
+        for ref_base, name_block, accept in name_blocks:
+            for score, negative_length, file_id in rank(text, name_block, FUZZY_RESULT_LIMIT, accept, is_cancelled):
+                ranked.append((score, negative_length, ref_base | file_id))
+        if len(name_blocks) > 1:
+            ranked = heapq.nlargest(FUZZY_RESULT_LIMIT, ranked, key=lambda entry: entry[:2])  # (score, -name length)
+        return [ref for _, _, ref in ranked]
+
+    def search(self, query, roots=None, suffixes=(), limit=None, fuzzy=False, sort=None, descending=False):
+        """Returns the matching file paths, at most limit of them."""
+        return [self.path_of(ref) for ref in self.search_refs(query, roots, suffixes, limit, fuzzy, sort, descending)]
+
+    def search_refs(self, query, roots=None, suffixes=(), limit=None, fuzzy=False, sort=None, descending=False):
+        """Returns the result refs of the matching files, at most limit of them."""
+        started = time.perf_counter()
+        candidates, predicate = self.prepare_query(query, roots, suffixes, fuzzy, None, sort, descending)
+        results = []
+        for ref in candidates:
+            if predicate is None or predicate(ref):
+                results.append(ref)
+                if limit is not None and len(results) >= limit:
+                    break
+        self.record_query(query, suffixes, fuzzy, time.perf_counter() - started)
+        return results
+
+    def record_query(self, query, suffixes, fuzzy, seconds):
+        """Adds the latency of a completed query to the metrics, by the kind of search it ran (see Query.kind())."""
+        kind = with_terms(parse_query(query), suffix_terms(suffixes)).kind(fuzzy)
+        self.metrics.observe("filesearch_query_seconds", seconds, type=kind)
+
+    def collect_metrics(self, metrics):
+        """Sets the metrics that are read on demand: indexed files, running scans and the file event queue."""
+        with self.lock:
+            for root, shard in self.shards.items():
+                metrics.set("filesearch_indexed_files", len(shard.table), root=root)
+            metrics.set("filesearch_scans_running", len(self.jobs))
+        event_queue = self.event_queue
+        if event_queue is not None:
+            metrics.set("filesearch_event_queue_depth", len(event_queue.pending))
+            metrics.set("filesearch_events_received_total", event_queue.events_received, COUNTER)
+            metrics.set("filesearch_events_applied_total", event_queue.events_applied, COUNTER)
+            metrics.set("filesearch_event_batches_total", event_queue.batches_applied, COUNTER)
+
+    def save_startup_report(self, stages):
+        """Stores {stage: seconds since launch} of the last application startup, shown by stats()."""
+        self.index_store.set_meta("startup_report", stages)
+
+    def stats(self):
+        """Returns index statistics as a JSON serialisable dict."""
+        with self.lock:
+            directories = {
+                root: {
+                    "files": len(shard.table),
+                    "loaded": shard.loaded,
+                    "name_index": shard.table.name_index is not None,
+                    "load_seconds": shard.load_seconds,
+                    "name_index_seconds": shard.name_index_seconds,
+                    "exclusion_rules": self.exclusion_rules.get(root, []),
+                }
+                for root, shard in self.shards.items()
+            }
+        stats = {
+            "index_file": self.index_store.db_path,
+            "last_modified_time": self.last_modified_time,
+            "directories": directories,
+            "files": sum(entry["files"] for entry in directories.values()),
+            "extensions": dict(heapq.nlargest(20, self.extension_counts().items(), key=lambda item: item[1])),
+            "tagged_files": len(self.tag_manager.tags),
+            "tags": len(self.tag_manager.vocabulary),
+            "content_indexing": self.content_indexing,
+            "content_files": self.index_store.content_file_count(),
+            "watching": self.observer is not None,
+            "polling": self.reconciler.status() if self.reconciler is not None else {},
+            "indexing": {root: job.status() for root, job in list(self.jobs.items())},
+            "last_startup": self.index_store.get_meta("startup_report"),
+        }
+        if self.event_queue is not None:
+            stats["events_received"] = self.event_queue.events_received
+            stats["events_applied"] = self.event_queue.events_applied
+            stats["event_batches"] = self.event_queue.batches_applied
+        return stats
@@ -0,0 +1,121 @@
+"""
+File Search Pro - file system event handling
+Copyright (C) 2024 [Kristopher Sorensen]
+
+Licensed under the GNU General Public License v3 or later, see LICENSE.txt.
+"""
+
+import time
+import logging
+import threading
+
+from watchdog.events import FileSystemEventHandler
+
+from .config import EVENT_BATCH_SIZE, EVENT_FLUSH_INTERVAL
+
+log = logging.getLogger(__name__)
+
+# Coalescing file event queue
+class FileEventQueue:
+    """Coalesces watchdog events per path and applies the net changes in batches.
+
+    Only the state after the last event for a path is kept, so created, modified and
+    deleted in quick succession nets out to a single removal, which is a no-op for a
+    path that was never indexed. apply_batch(added, removed) is called from the
+    queue's own thread every flush_interval seconds, or sooner once batch_size paths
+    are pending, and returns the number of changes it applied. With metrics given,
+    the time each batch takes is recorded there.
+    """
+    def __init__(self, apply_batch, flush_interval=EVENT_FLUSH_INTERVAL, batch_size=EVENT_BATCH_SIZE, metrics=None):
+        self.apply_batch = apply_batch
+        self.metrics = metrics
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.pending = {}  # file path -> True if it exists after its last event
+        self.condition = threading.Condition()
+        self.flush_lock = threading.Lock()  # One batch at a time, flush() is also called from other threads
+        self.running = True
+        self.events_received = 0
+        self.events_applied = 0
+        self.batches_applied = 0
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def put(self, file_path, exists):
+        """Records the latest state of a path."""
+        with self.condition:
+            self.pending[file_path] = exists
+            self.events_received += 1
+            if len(self.pending) >= self.batch_size:
+                self.condition.notify()
+
+    def put_move(self, old_path, new_path):
+        """Records a rename or move as a removal and an addition."""
+        with self.condition:
+            self.pending[old_path] = False
+            self.pending[new_path] = True
+            self.events_received += 1
+            if len(self.pending) >= self.batch_size:
+                self.condition.notify()
+
+    def run(self):
+        while True:
+            with self.condition:
+                if self.running and len(self.pending) < self.batch_size:
+                    self.condition.wait(self.flush_interval)
+                running = self.running
+            self.flush()
+            if not running:
+                return
+
+    def flush(self):
+        """Applies the pending net changes as one batch."""
+        with self.flush_lock:
+            self.apply_pending()
+
+    def apply_pending(self):
+        with self.condition:
+            if not self.pending:
+                return
+            pending, self.pending = self.pending, {}
+        added = [file_path for file_path, exists in pending.items() if exists]
+        removed = [file_path for file_path, exists in pending.items() if not exists]
+        started = time.perf_counter()
+        try:
+            applied = self.apply_batch(added, removed)
+        except Exception as e:
+            log.exception("Error applying file events: %s", e)
+            return
+        if self.metrics is not None:
+            self.metrics.observe("filesearch_event_batch_seconds", time.perf_counter() - started)
+        with self.condition:
+            self.events_applied += applied
+            self.batches_applied += 1
+
+    def stop(self):
+        """Applies anything still pending and stops the queue thread."""
+        with self.condition:
+            self.running = False
+            self.condition.notify()
+        self.thread.join(timeout=5)
+
+# Watchdog event handler
+class FileMonitorHandler(FileSystemEventHandler):
+    def __init__(self, event_queue):
+        self.event_queue = event_queue
+
+    def on_created(self, event):
+        if not event.is_directory:
+            self.event_queue.put(event.src_path, True)
+
+    def on_modified(self, event):
+        if not event.is_directory:
+            self.event_queue.put(event.src_path, True)
+
+    def on_deleted(self, event):
+        if not event.is_directory:
+            self.event_queue.put(event.src_path, False)
+
+    def on_moved(self, event):
+        if not event.is_directory:
+            self.event_queue.put_move(event.src_path, event.dest_path)
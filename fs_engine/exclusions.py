@@ -0,0 +1,273 @@
+"""
+File Search Pro - exclusion rules
+Copyright (C) 2024 [Kristopher Sorensen]
+
+Licensed under the GNU General Public License v3 or later, see LICENSE.txt.
+
+Every monitored directory has a list of gitignore-style rules, applied after
+the built-in DEFAULT_EXCLUSION_RULES:
+
+    node_modules/       a directory with this name at any depth, and everything in it
+    *.tmp               a file with this extension at any depth, directories are still walked
+    build-*             a file or directory name at any depth
+    /build/             anchored to the monitored directory: only its top-level build directory
+    docs/**/*.pdf       a path below the monitored directory, ** spans any number of directories
+    !keep.log           re-includes what an earlier rule excluded
+    size:>1GB           files whose size is in the range, see filters.parse_range()
+    # comment
+
+The last rule that matches decides, as in .gitignore, and matching ignores case.
+An excluded directory is pruned: it is never listed, so nothing inside it can
+be re-included.
+
+ExclusionRules compiles the rules of one directory once. Without ! rules, names
+are looked up in dicts of literal names and extensions and the other patterns
+run as one combined regular expression, so a typical rule set costs a dict
+lookup per directory entry.
+"""
+
+import os
+import re
+import time
+
+from .config import DEFAULT_EXCLUSION_RULES
+from .filters import parse_range
+
+GLOB_CHARACTERS = "*?["
+
+
+class Rule:
+    """One parsed rule line. pattern is a regular expression over the name, or over the relative path when anchored."""
+    def __init__(self, text, index):
+        self.text = text
+        self.index = index
+        self.negated = False
+        self.directory_only = False
+        self.anchored = False
+        self.pattern = None
+        self.size_range = None  # (low, high) of a size: rule
+        self.extension = None  # ".ext" of a "*.ext" rule, which only matches files
+
+        line = text
+        if line.startswith("!"):
+            self.negated = True
+            line = line[1:]
+        elif line.startswith(("\\!", "\\#")):
+            line = line[1:]
+        if line.startswith("size:"):
+            try:
+                self.size_range = parse_range("size", line[5:], time.time())
+            except ValueError as e:
+                raise ValueError(f"Invalid rule {text!r}: {e}") from None
+            return
+        if line.endswith("/"):
+            self.directory_only = True
+            line = line.rstrip("/")
+        if line.startswith("**/"):
+            line = line[3:]
+        if "/" in line:
+            # A slash anywhere but at the end anchors the pattern to the monitored directory
+            self.anchored = True
+            line = line.lstrip("/")
+        if not line:
+            raise ValueError(f"Invalid rule {text!r}: empty pattern")
+        self.glob = line.lower()
+        self.pattern = re.compile(translate(self.glob), re.IGNORECASE | re.DOTALL)
+        glob = self.glob
+        if (
+            not self.anchored and not self.directory_only and glob.startswith("*.") and glob.rfind(".") == 1
+            and not any(char in glob[1:] for char in GLOB_CHARACTERS)
+        ):
+            self.extension = glob[1:]
+
+    @property
+    def literal_name(self):
+        """Returns the name an unanchored rule without wildcards matches, else None."""
+        if self.anchored or self.pattern is None or any(char in self.glob for char in GLOB_CHARACTERS):
+            return None
+        return self.glob
+
+    def matches(self, name, relative, is_dir, size):
+        """Returns True if the rule matches an entry. relative() returns its path below the monitored directory."""
+        if self.size_range is not None:
+            if is_dir or size is None:
+                return False
+            low, high = self.size_range
+            return (low is None or size >= low) and (high is None or size <= high)
+        if (self.directory_only and not is_dir) or (self.extension is not None and is_dir):
+            return False
+        return self.pattern.fullmatch(relative() if self.anchored else name) is not None
+
+
+def translate(glob):
+    """Returns a regular expression for a gitignore glob: * and ? stay within one path component, ** spans several."""
+    parts = []
+    position = 0
+    length = len(glob)
+    while position < length:
+        char = glob[position]
+        if glob.startswith("**", position):
+            position += 2
+            if glob.startswith("/", position):
+                parts.append("(?:.*/)?")  # a/**/b also matches a/b
+                position += 1
+            else:
+                parts.append(".*")
+            continue
+        if char == "*":
+            parts.append("[^/]*")
+        elif char == "?":
+            parts.append("[^/]")
+        elif char == "[":
+            # A class ends at the first ] after an optional leading ! and a leading ], like in fnmatch
+            end = position + 1
+            if glob.startswith("!", end):
+                end += 1
+            if glob.startswith("]", end):
+                end += 1
+            end = glob.find("]", end)
+            if end < 0:
+                parts.append("\\[")
+            else:
+                chars = glob[position + 1:end].replace("\\", "\\\\")
+                if chars.startswith("!"):
+                    chars = "^" + chars[1:]
+                elif chars.startswith("^"):
+                    chars = "\\" + chars
+                parts.append("[" + chars + "]")
+                position = end
+        else:
+            parts.append(re.escape(char))
+        position += 1
+    return "".join(parts)
+
+
+def parse_rules(lines):
+    """Returns the rule lines without blanks, comments and surrounding spaces. Raises ValueError for an invalid rule."""
+    rules = []
+    for line in lines:
+        line = line.strip()
+        if line and not line.startswith("#"):
+            Rule(line, 0)  # Raises on an invalid rule
+            rules.append(line)
+    return rules
+
+
+def negations_after(rules, text):
+    """Returns the set of ! rules that follow the last occurrence of a rule text."""
+    position = max((index for index, rule in enumerate(rules) if rule == text), default=-1)
+    return {rule for rule in rules[position + 1:] if rule.startswith("!")}
+
+
+def needs_relisting(fired, old_rules, new_rules):
+    """Returns True if an entry excluded by one of the fired rules may be included by the new rules.
+
+    That happens when the rule is gone, or when a ! rule after it is new.
+    Entries the new rules exclude are found in the index instead, without
+    listing anything.
+    """
+    for text in fired:
+        if text not in new_rules or negations_after(new_rules, text) - negations_after(old_rules, text):
+            return True
+    return False
+
+
+# Compiled rules
+class ExclusionRules:
+    """The compiled exclusion rules of one monitored directory, DEFAULT_EXCLUSION_RULES first."""
+    def __init__(self, root, lines=(), defaults=DEFAULT_EXCLUSION_RULES):
+        self.root = root
+        self.prefix_length = len(os.path.join(root, ""))
+        self.lines = list(defaults) + parse_rules(lines)
+        self.rules = [Rule(line, index) for index, line in enumerate(self.lines)]
+        self.ordered = any(rule.negated for rule in self.rules)  # Last match wins, checked rule by rule
+        self.size_rules = [rule for rule in self.rules if rule.size_range is not None]
+
+        # Without ! rules any match excludes, so matches are looked up all at once
+        self.names = {}  # Lowercased name -> rule
+        self.directory_names = {}
+        self.extensions = {}  # Lowercased extension -> rule, for "*.ext"
+        patterns = {(anchored, directory_only): [] for anchored in (False, True) for directory_only in (False, True)}
+        for rule in self.rules:
+            if rule.pattern is None:
+                continue
+            if rule.literal_name is not None:
+                (self.directory_names if rule.directory_only else self.names).setdefault(rule.literal_name, rule)
+            elif rule.extension is not None:
+                self.extensions.setdefault(rule.extension, rule)
+            else:
+                patterns[rule.anchored, rule.directory_only].append(rule)
+        self.anchored = bool(patterns[True, False] or patterns[True, True])
+        self.combined = {key: combine(rules) for key, rules in patterns.items()}
+
+    def __len__(self):
+        return len(self.lines)
+
+    def relative(self, path):
+        """Returns a path below the root with / separators."""
+        relative = path[self.prefix_length:]
+        return relative.replace(os.sep, "/") if os.sep != "/" else relative
+
+    def match(self, path, name, is_dir, size=None):
+        """Returns the text of the rule that excludes an entry, or None if it is included.
+
+        path is the full path and name its basename. size is only needed for files.
+        """
+        if self.ordered:
+            relative = lambda: self.relative(path)
+            for rule in reversed(self.rules):
+                if rule.matches(name, relative, is_dir, size):
+                    return None if rule.negated else rule.text
+            return None
+
+        name = name.lower()
+        rule = self.names.get(name)
+        if rule is None and is_dir:
+            rule = self.directory_names.get(name)
+        if rule is None and not is_dir:
+            dot = name.rfind(".")
+            if dot >= 0:
+                rule = self.extensions.get(name[dot:])
+        if rule is not None:
+            return rule.text
+        text = self.match_pattern(False, name, is_dir)
+        if text is None and self.anchored:
+            text = self.match_pattern(True, self.relative(path).lower(), is_dir)
+        if text is None and size is not None and not is_dir:
+            for rule in self.size_rules:
+                if rule.matches(name, None, False, size):
+                    return rule.text
+        return text
+
+    def match_pattern(self, anchored, text, is_dir):
+        for directory_only in (False, True) if is_dir else (False,):
+            combined = self.combined[anchored, directory_only]
+            if combined is not None:
+                match = combined[0].fullmatch(text)
+                if match is not None:
+                    return combined[1][match.lastgroup]
+        return None
+
+    def match_path(self, path, size=None):
+        """Returns the rule that excludes a file or any directory between it and the root, or None.
+
+        For paths that were not found by listing their directory, like file events.
+        """
+        relative = path[self.prefix_length:]
+        parts = relative.split(os.sep)
+        directory = self.root
+        for part in parts[:-1]:
+            directory = os.path.join(directory, part)
+            text = self.match(directory, part, True)
+            if text is not None:
+                return text
+        return self.match(path, parts[-1], False, size)
+
+
+def combine(rules):
+    """Returns (one regular expression matching any of the rules, {group name: rule text}), or None without rules."""
+    if not rules:
+        return None
+    groups = {f"r{rule.index}": rule.text for rule in rules}
+    pattern = "|".join(f"(?P<r{rule.index}>{rule.pattern.pattern})" for rule in rules)
+    return re.compile(pattern, re.IGNORECASE | re.DOTALL), groups
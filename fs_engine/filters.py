@@ -0,0 +1,89 @@
+"""
+File Search Pro - size and date filters
+Copyright (C) 2024 [Kristopher Sorensen]
+
+Licensed under the GNU General Public License v3 or later, see LICENSE.txt.
+
+Filters are query terms (see query.py) next to the file name text:
+
+    size:>100MB  size:<=4k  size:1mb..1gb
+    modified:<7d  modified:>1y  modified:>2024-01-01  modified:2024-01-01..2024-06-30
+    created:<30d  created:2024-01-01..2024-06-30
+
+An age like "<7d" means less than 7 days old. They are answered from the
+metadata columns of the path tables, nothing is stat'ed at query time.
+"""
+
+import re
+import math
+from datetime import datetime, timedelta
+
+COMPARISON_PATTERN = re.compile(r"(<=|>=|<|>|=)?(.+)")
+SIZE_UNITS = {"": 1, "b": 1, "k": 1 << 10, "kb": 1 << 10, "m": 1 << 20, "mb": 1 << 20, "g": 1 << 30, "gb": 1 << 30, "t": 1 << 40, "tb": 1 << 40}
+AGE_UNITS = {"s": 1, "m": 60, "min": 60, "h": 3600, "d": 86400, "w": 7 * 86400, "mo": 30 * 86400, "y": 365 * 86400}
+SIZE_PATTERN = re.compile(r"(\d+(?:\.\d+)?)([a-z]*)")
+AGE_PATTERN = re.compile(r"(\d+(?:\.\d+)?)([a-z]+)")
+
+
+def parse_size(text):
+    """Returns a size like "100MB" or "4k" in bytes (1024 based). Raises ValueError."""
+    match = SIZE_PATTERN.fullmatch(text.lower())
+    if not match or match.group(2) not in SIZE_UNITS:
+        raise ValueError(f"Invalid size: {text}")
+    return int(float(match.group(1)) * SIZE_UNITS[match.group(2)])
+
+
+def parse_time(text, now):
+    """Returns (start, end, is_age) for an age like "7d" or a date like "2024-01-31". Raises ValueError.
+
+    An age is a single moment, start and end are the same. A date runs from its
+    local midnight up to, but not including, the next day's.
+    """
+    match = AGE_PATTERN.fullmatch(text.lower())
+    if match and match.group(2) in AGE_UNITS:
+        timestamp = now - float(match.group(1)) * AGE_UNITS[match.group(2)]
+        return timestamp, timestamp, True
+    day = datetime.strptime(text, "%Y-%m-%d")
+    # The next midnight, not 86400 seconds on, days are 23 or 25 hours long when the clocks change
+    return day.timestamp(), (day + timedelta(days=1)).timestamp(), False
+
+
+def before(timestamp):
+    """Returns the last time before timestamp, the inclusive upper bound of a range that ends there."""
+    return math.nextafter(timestamp, -math.inf)
+
+
+def parse_range(column, value, now):
+    """Returns the inclusive (low, high) bounds one filter value selects, None for an open end. Raises ValueError.
+
+    A date covers its whole day: 2024-01-01..2024-06-30 includes June 30,
+    >2024-06-30 starts on July 1 and <2024-06-30 ends before June 30.
+    """
+    if ".." in value:
+        low_text, high_text = value.split("..", 1)
+        if column == "size":
+            return parse_size(low_text) if low_text else None, parse_size(high_text) if high_text else None
+        low = parse_time(low_text, now) if low_text else None
+        high = parse_time(high_text, now) if high_text else None
+        # An age range runs backwards in time: 1d..7d is between 7 and 1 days old
+        if (low and low[2]) or (high and high[2]):
+            low, high = high, low
+        # A date at the top includes its whole day
+        return low[0] if low else None, (high[0] if high[2] else before(high[1])) if high else None
+
+    match = COMPARISON_PATTERN.fullmatch(value)
+    if not match:
+        raise ValueError(f"Missing value: {value}")
+    operator, text = match.group(1) or "=", match.group(2)
+    if column == "size":
+        size = parse_size(text)
+        return {"<": (None, size - 1), "<=": (None, size), ">": (size + 1, None), ">=": (size, None), "=": (size, size)}[operator]
+
+    start, end, is_age = parse_time(text, now)
+    if is_age:
+        # Less than 7 days old is newer than a week ago, a bare "7d" means within the last 7 days
+        operator = {"<": ">", "<=": ">=", ">": "<", ">=": "<=", "=": ">="}[operator]
+        return (start, None) if operator in (">", ">=") else (None, start)
+    return {
+        "<": (None, before(start)), "<=": (None, before(end)), ">": (end, None), ">=": (start, None), "=": (start, before(end))
+    }[operator]
@@ -0,0 +1,191 @@
+"""
+File Search Pro - ranked fuzzy matching
+Copyright (C) 2024 [Kristopher Sorensen]
+
+Licensed under the GNU General Public License v3 or later, see LICENSE.txt.
+
+The query matches a file name if its characters appear in the name in order, as
+in fzf. Matches are scored by how well the characters line up with the name:
+consecutive runs, word boundaries, a matching prefix and an exact extension score
+higher, gaps cost points. Only the best limit matches are kept.
+"""
+
+import re
+import heapq
+
+from .config import FUZZY_RESULT_LIMIT
+
+SCORE_MATCH = 16
+SCORE_GAP_START = -5  # Outweighs a word boundary bonus minus the consecutive bonus, see match_tiers()
+SCORE_GAP_EXTENSION = -1
+BONUS_BOUNDARY = 8  # Match at the start of a word, after a separator
+BONUS_FIRST_CHAR = 2  # Multiplier for the boundary bonus of the first query character
+BONUS_CONSECUTIVE = 4
+BONUS_PREFIX = 8  # Match at the very start of the name
+BONUS_EXTENSION = 24  # Query ends with the name's exact extension
+MAX_ALIGNMENTS = 4  # Start positions tried per name
+CANCEL_CHECK_INTERVAL = 4096  # Matches checked between cancellation checks
+SEPARATORS = frozenset(" _-.()[]{}+,;~")
+
+
+def match_positions(query, name, start=0):
+    """Returns the positions of the shortest match of query in name at or after start, or None.
+
+    Finds the leftmost end of a match scanning forward, then walks backward from
+    there so the match is as tight as possible.
+    """
+    pos = start - 1
+    find = name.find
+    for char in query:
+        pos = find(char, pos + 1)
+        if pos < 0:
+            return None
+
+    positions = [0] * len(query)
+    rfind = name.rfind
+    end = pos + 1
+    for i in range(len(query) - 1, -1, -1):
+        end = rfind(query[i], start, end)
+        positions[i] = end
+    return positions
+
+
+def score_positions(name, positions):
+    """Returns the score of a match at the given positions."""
+    score = 0
+    previous = -2
+    for i, pos in enumerate(positions):
+        score += SCORE_MATCH
+        if pos == 0 or name[pos - 1] in SEPARATORS:
+            score += BONUS_BOUNDARY * (BONUS_FIRST_CHAR if i == 0 else 1)
+        if pos == previous + 1:
+            score += BONUS_CONSECUTIVE
+        elif i:
+            score += SCORE_GAP_START + SCORE_GAP_EXTENSION * (pos - previous - 2)
+        previous = pos
+    if positions[0] == 0:
+        score += BONUS_PREFIX
+    return score
+
+
+def fuzzy_score(query, name):
+    """Returns the best score of query in a lowercased name, or None if it does not match.
+
+    Besides the leftmost match, matches starting at word boundaries are tried so
+    "rep" scores "draft_report" on "report" rather than on "r...ep".
+    """
+    positions = match_positions(query, name)
+    if positions is None:
+        return None
+    best = score_positions(name, positions)
+    pos = name.find(query)
+    if pos > positions[0]:  # The tightest match is not always the leftmost one
+        best = max(best, score_positions(name, range(pos, pos + len(query))))
+
+    first = query[0]
+    pos = positions[0]
+    tried = 1
+    while tried < MAX_ALIGNMENTS:
+        pos = name.find(first, pos + 1)
+        if pos < 0:
+            break
+        if name[pos - 1] not in SEPARATORS:
+            continue
+        positions = match_positions(query, name, pos)
+        if positions is None:
+            break
+        best = max(best, score_positions(name, positions))
+        tried += 1
+
+    dot = query.rfind(".")
+    if dot >= 0 and name.endswith(query[dot:]) and name.rfind(".") == len(name) - len(query) + dot:
+        best += BONUS_EXTENSION
+    return best
+
+
+def subsequence_pattern(query):
+    """Returns a pattern for query as a subsequence. Each gap is a negated character class, so it never backtracks."""
+    parts = [re.escape(query[0])]
+    for char in query[1:]:
+        parts.append(f"[^\\n{re.escape(char)}]*{re.escape(char)}")
+    return "".join(parts)
+
+
+def match_tiers(query):
+    """Returns [(pattern, offset, best possible score)] from the tightest kind of match to the loosest.
+
+    The patterns run over a name block (see PathTable.name_block()), offset is
+    added to a match start to land inside the matching name. Prefix matches come
+    first, then the query anywhere in the name, then scattered subsequence matches.
+    Each score bounds every name found by that tier and not by an earlier one. A
+    scattered match loses at least one consecutive bonus, so its best score is
+    below that of a prefix match. All three patterns start with a literal, which
+    the regular expression engine skips to without looking at the other names.
+    """
+    escaped = re.escape(query)
+    extension = BONUS_EXTENSION if "." in query else 0
+    contiguous = list(range(len(query)))
+    best_prefix = score_positions(query, contiguous) + extension
+    best_boundary = score_positions("_" + query, [pos + 1 for pos in contiguous]) + extension
+    # At least one character follows a gap: it can gain a boundary bonus but pays the gap and loses the consecutive bonus
+    best_scattered = best_prefix + BONUS_BOUNDARY + SCORE_GAP_START - BONUS_CONSECUTIVE if len(query) > 1 else 0
+    return [
+        (re.compile("\n" + escaped), 1, best_prefix),
+        (re.compile(escaped), 0, max(best_boundary, best_scattered)),
+        (re.compile(subsequence_pattern(query)), 0, best_scattered),
+    ]
+
+
+def rank(query, name_block, limit=FUZZY_RESULT_LIMIT, accept=None, is_cancelled=None):
+    """Returns the best limit matches in a name block as (score, -name length, file id), best first.
+
+    Matching runs as regular expressions over every name at once, so names that
+    cannot match are never touched from Python. The tiers of match_tiers() run in
+    order and a later tier is skipped once the bounded heap is full of results it
+    cannot beat, so a query that matches almost everything mostly scores prefix
+    matches. Ties go to the shorter name. accept(file id) can reject candidates
+    before they are scored. Returns [] as soon as is_cancelled() is true.
+    """
+    query = query.lower()
+    ids, block = name_block
+    if not query or not ids or limit <= 0:
+        return []
+
+    count = block.count
+    find = block.find
+    rfind = block.rfind
+    heap = []  # (score, -name length, -line), the worst kept result on top, earlier lines win ties
+    seen = set()
+    checked = 0
+
+    for pattern, offset, best_score in match_tiers(query):
+        if len(heap) >= limit and best_score < heap[0][0]:
+            break
+        line = -1
+        line_start = 0
+        for match in pattern.finditer(block):
+            checked += 1
+            if is_cancelled is not None and checked % CANCEL_CHECK_INTERVAL == 0 and is_cancelled():
+                return []
+            pos = match.start() + offset
+            line += count("\n", line_start, pos)
+            line_start = pos
+            if line in seen:
+                continue
+            name_end = find("\n", pos)
+            name = block[rfind("\n", 0, pos) + 1:name_end if name_end >= 0 else len(block)]
+            if len(heap) >= limit and (best_score, -len(name)) <= heap[0][:2]:
+                continue  # Cannot beat the worst kept result even with the best score of this tier
+            seen.add(line)
+            if accept is not None and not accept(ids[line]):
+                continue
+            score = fuzzy_score(query, name)
+            if score is None:
+                continue
+            entry = (score, -len(name), -line)
+            if len(heap) < limit:
+                heapq.heappush(heap, entry)
+            elif entry > heap[0]:
+                heapq.heapreplace(heap, entry)
+
+    return [(score, negative_length, ids[-negative_line]) for score, negative_length, negative_line in sorted(heap, reverse=True)]
@@ -0,0 +1,82 @@
+"""
+File Search Pro - cancellable indexing jobs
+Copyright (C) 2024 [Kristopher Sorensen]
+
+Licensed under the GNU General Public License v3 or later, see LICENSE.txt.
+
+A scan of one monitored directory runs as an IndexJob. The crawler polls the
+job's cancel token between directories, so cancelling stops a scan within one
+directory listing. Every batch the scan writes also records the directories it
+found but has not listed yet, so an interrupted scan, cancelled or crashed,
+resumes from that frontier instead of starting over.
+"""
+
+import time
+import threading
+
+# Job states
+RUNNING = "running"
+DONE = "done"
+CANCELLED = "cancelled"
+FAILED = "failed"
+
+
+class CancelToken:
+    """A cancellation flag that is cheap to poll. A token is also cancelled when its parent is."""
+    def __init__(self, parent=None):
+        self.event = threading.Event()
+        self.parent = parent
+
+    def cancel(self):
+        self.event.set()
+
+    def is_cancelled(self):
+        return self.event.is_set() or (self.parent is not None and self.parent.is_cancelled())
+
+
+class IndexJob:
+    """One scan of one monitored directory. The engine runs at most one job per directory."""
+    def __init__(self, root, parent_token=None, pending_directories=0):
+        self.root = root
+        self.token = CancelToken(parent_token)
+        self.state = RUNNING
+        self.scan = None  # The IndexScan, once started
+        self.error = None
+        self.pending_directories = pending_directories  # Left unlisted by an interrupted scan
+        self.started = time.time()
+        self.finished = None
+        self.done = threading.Event()
+
+    @property
+    def resumed(self):
+        """True if the job picks up an interrupted scan."""
+        return self.pending_directories > 0
+
+    def cancel(self):
+        """Asks the job to stop after the directories being listed now."""
+        self.token.cancel()
+
+    def is_cancelled(self):
+        return self.token.is_cancelled()
+
+    def finish(self, state, error=None):
+        self.state = state
+        self.error = error
+        self.finished = time.time()
+        self.done.set()
+
+    def wait(self, timeout=None):
+        """Waits for the job to end. Returns False on timeout."""
+        return self.done.wait(timeout)
+
+    def status(self):
+        """Returns the job's progress as a JSON serialisable dict."""
+        scan = self.scan
+        return {
+            "state": self.state,
+            "resumed": self.resumed,
+            "seconds": round((self.finished or time.time()) - self.started, 3),
+            "directories_checked": scan.directories_checked if scan else 0,
+            "files_added": scan.files_added if scan else 0,
+            "files_removed": scan.files_removed if scan else 0,
+        }
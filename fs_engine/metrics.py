@@ -0,0 +1,240 @@
+"""
+File Search Pro - engine metrics
+Copyright (C) 2024 [Kristopher Sorensen]
+
+Licensed under the GNU General Public License v3 or later, see LICENSE.txt.
+
+Counters, gauges and latency histograms for the engine's hot paths: scans, file
+events, store writes, index loads, lock waits and queries. Recording one value is
+a dict lookup and an addition under an uncontended lock, and values are recorded
+per batch, per scan or per query, never per file.
+
+Metrics carry optional labels, such as the directory of a scan or the type of a
+query. snapshot() returns them as a JSON serialisable dict and prometheus_text()
+in the Prometheus text exposition format. write_metrics() saves either one to a
+file.
+"""
+
+import os
+import json
+import time
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+
+from .config import METRICS_LATENCY_BUCKETS
+
+COUNTER = "counter"
+GAUGE = "gauge"
+HISTOGRAM = "histogram"
+SNAPSHOT_SECTIONS = {COUNTER: "counters", GAUGE: "gauges", HISTOGRAM: "histograms"}
+
+
+class Histogram:
+    """Counts observations per bucket, plus their count, sum and maximum."""
+    __slots__ = ("buckets", "counts", "count", "sum", "max")
+
+    def __init__(self, buckets):
+        self.buckets = buckets  # Ascending upper bounds, the last bucket is unbounded
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    def quantile(self, q):
+        """Returns the upper bound of the bucket holding the q quantile, or the maximum for the last bucket."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "sum": round(self.sum, 6),
+            "mean": round(self.sum / self.count, 6) if self.count else 0.0,
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "max": round(self.max, 6),
+            "buckets": dict(zip(map(str, self.buckets + ("+Inf",)), self.cumulative_counts())),
+        }
+
+    def cumulative_counts(self):
+        total = 0
+        counts = []
+        for count in self.counts:
+            total += count
+            counts.append(total)
+        return counts
+
+
+class Metrics:
+    """A registry of labelled counters, gauges and histograms, safe to update from any thread.
+
+    Collectors added with add_collector() run before every snapshot, to set values
+    that are cheaper to read on demand than to keep current, like queue depths.
+    """
+    def __init__(self, buckets=METRICS_LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.lock = threading.Lock()
+        self.values = {}  # (name, labels) -> number or Histogram, labels is a sorted tuple of (key, value)
+        self.kinds = {}  # name -> COUNTER, GAUGE or HISTOGRAM
+        self.collectors = []
+        self.started = time.time()
+
+    @staticmethod
+    def key(name, labels):
+        return name, tuple(sorted(labels.items())) if labels else ()
+
+    def inc(self, name, value=1, **labels):
+        """Adds value to a counter."""
+        key = self.key(name, labels)
+        with self.lock:
+            self.kinds[name] = COUNTER
+            self.values[key] = self.values.get(key, 0) + value
+
+    def set(self, name, value, kind=GAUGE, **labels):
+        """Sets a gauge, or with kind COUNTER a counter that is kept elsewhere, e.g. by a collector."""
+        key = self.key(name, labels)
+        with self.lock:
+            self.kinds[name] = kind
+            self.values[key] = value
+
+    def observe(self, name, value, **labels):
+        """Adds an observation, usually in seconds, to a histogram."""
+        key = self.key(name, labels)
+        with self.lock:
+            histogram = self.values.get(key)
+            if histogram is None:
+                self.kinds[name] = HISTOGRAM
+                histogram = self.values[key] = Histogram(self.buckets)
+            histogram.observe(value)
+
+    @contextmanager
+    def timer(self, name, **labels):
+        """Observes the seconds the with block takes in a histogram, also when it raises."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, **labels)
+
+    def remove(self, **labels):
+        """Drops every metric that carries all of these labels, e.g. those of a directory no longer monitored."""
+        wanted = set(labels.items())
+        with self.lock:
+            for key in [key for key in self.values if wanted <= set(key[1])]:
+                del self.values[key]
+
+    def add_collector(self, collector):
+        """Calls collector(metrics) before every snapshot."""
+        self.collectors.append(collector)
+
+    def collect(self):
+        """Runs the collectors and returns [(name, kind, labels dict, value)] sorted by name and labels."""
+        for collector in self.collectors:
+            collector(self)
+        with self.lock:
+            entries = sorted(self.values.items())
+            return [
+                (name, self.kinds[name], dict(labels), value.summary() if isinstance(value, Histogram) else value)
+                for (name, labels), value in entries
+            ]
+
+    def snapshot(self):
+        """Returns every metric as a JSON serialisable dict: {"counters": [...], "gauges": [...], "histograms": [...]}."""
+        snapshot = {"uptime_seconds": round(time.time() - self.started, 3)}
+        snapshot.update((section, []) for section in SNAPSHOT_SECTIONS.values())
+        for name, kind, labels, value in self.collect():
+            snapshot[SNAPSHOT_SECTIONS[kind]].append({"name": name, "labels": labels, "value": value})
+        return snapshot
+
+    def prometheus_text(self):
+        """Returns every metric in the Prometheus text exposition format."""
+        lines = []
+        last_name = None
+        for name, kind, labels, value in self.collect():
+            if name != last_name:
+                lines.append(f"# TYPE {name} {kind}")
+                last_name = name
+            if kind != HISTOGRAM:
+                lines.append(f"{name}{format_labels(labels)} {value}")
+                continue
+            for bound, count in value["buckets"].items():
+                lines.append(f"{name}_bucket{format_labels({**labels, 'le': bound})} {count}")
+            lines.append(f"{name}_sum{format_labels(labels)} {value['sum']}")
+            lines.append(f"{name}_count{format_labels(labels)} {value['count']}")
+        return "\n".join(lines) + "\n"
+
+
+def format_labels(labels):
+    """Returns labels as a Prometheus label set, e.g. {type="name"}, or "" without labels."""
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{escape_label(value)}"' for key, value in labels.items()) + "}"
+
+
+def escape_label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def write_metrics(metrics, file_path, prometheus=None):
+    """Writes a metrics dump atomically, in the Prometheus text format for a .prom or .txt file and as JSON otherwise."""
+    if prometheus is None:
+        prometheus = file_path.lower().endswith((".prom", ".txt"))
+    text = metrics.prometheus_text() if prometheus else json.dumps(metrics.snapshot(), indent=2)
+    temp_file = file_path + ".tmp"
+    with open(temp_file, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(temp_file, file_path)
+
+
+# Lock with wait time metrics
+class TimedLock:
+    """A threading.Lock that records how long each contended acquire waited.
+
+    An acquire that gets the lock at once records nothing, so the uncontended path
+    costs one extra non-blocking acquire.
+    """
+    def __init__(self, metrics, name):
+        self.lock = threading.Lock()
+        self.metrics = metrics
+        self.name = name
+
+    def acquire(self, blocking=True, timeout=-1):
+        if self.lock.acquire(False):
+            return True
+        return self.wait(timeout) if blocking else False
+
+    def wait(self, timeout=-1):
+        """Blocks until the lock is free and records the wait."""
+        started = time.perf_counter()
+        acquired = self.lock.acquire(True, timeout)
+        self.metrics.observe("filesearch_lock_wait_seconds", time.perf_counter() - started, lock=self.name)
+        return acquired
+
+    def release(self):
+        self.lock.release()
+
+    def locked(self):
+        return self.lock.locked()
+
+    def __enter__(self):
+        if not self.lock.acquire(False):
+            self.wait()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.lock.release()
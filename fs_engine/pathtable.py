@@ -0,0 +1,344 @@
+"""
+File Search Pro - compact in-memory path table
+Copyright (C) 2024 [Kristopher Sorensen]
+
+Licensed under the GNU General Public License v3 or later, see LICENSE.txt.
+
+Every indexed file of a monitored directory is a row id. A directory is stored
+once in the directory table (parent id + name, with its path prefix cached), and
+a file is a row in typed array columns plus its interned basename, instead of a
+full path string held in a set, a dict and every trigram bucket it belongs to.
+"""
+
+import os
+import sys
+from array import array
+from itertools import compress
+
+from .trigram import TrigramIndex
+
+NO_PARENT = -1
+STALE_REBUILD_MIN = 10000  # Removed files tolerated in the trigram postings before they are rebuilt
+SORT_COLUMNS = ("name", "size", "modified", "created")
+
+
+def bisect_order(order, values, value, right=False):
+    """Returns the position of value in order, a sequence of file ids sorted by values[file id]."""
+    low, high = 0, len(order)
+    while low < high:
+        middle = (low + high) // 2
+        current = values[order[middle]]
+        if current < value or (right and current == value):
+            low = middle + 1
+        else:
+            high = middle
+    return low
+
+
+# Path table
+class PathTable:
+    """Files below one root as row ids with directory, extension and basename columns.
+
+    Ids are never reused: a removed row is only marked dead, so an id held by a
+    result list keeps naming the same file. Queries return iterators over ids,
+    paths are joined only for the rows that are actually read. Size, mtime and
+    ctime come from the directory listing; range filters and sorting read them
+    through per-column orders of ids that are sorted on first use.
+
+    With name_index False the trigram index is left out, and name queries scan the
+    name block until build_name_index() and set_name_index() add it. A stored
+    index is loaded that way so it can be searched before the trigrams are built.
+    """
+    def __init__(self, root, name_index=True):
+        self.root = root
+        # Directory table, indexed by directory id
+        self.dir_parent = array("i")  # Parent directory id, NO_PARENT for the root
+        self.dir_names = []  # Directory name, the full path for the root
+        self.dir_prefixes = []  # Full path ending in a separator, a file path is its prefix + basename
+        self.dir_ids = {}  # Full path -> directory id
+        self.dir_files = []  # {basename: file id} of the live files in the directory
+        # File columns, indexed by file id
+        self.file_dir = array("I")
+        self.file_ext = array("I")  # Index into extensions
+        self.names = []  # Interned basename, as on disk
+        self.file_size = array("q")
+        self.file_mtime = array("d")
+        self.file_ctime = array("d")
+        self.columns = {"size": self.file_size, "modified": self.file_mtime, "created": self.file_ctime}
+        self.orders = {}  # Sort column -> live file ids sorted by it, dropped whenever a file changes
+        self.live = bytearray()  # 1 while the file is indexed, 0 once removed
+        self.live_count = 0
+        self.extensions = [""]  # Lowercased extensions, "" for none
+        self.extension_ids = {"": 0}
+        # Extension facet, indexed by extension id
+        self.extension_files = [array("I")]  # Ascending file ids, removed ids stay until compact()
+        self.extension_counts = array("I", (0,))  # Live files, kept current on every add and remove
+        self.stale = 0  # Removed files whose ids are still in the facet and trigram postings
+        self.name_index = TrigramIndex() if name_index else None
+        self.block = None  # Cached name_block(), dropped whenever a file is added or removed
+
+    def __len__(self):
+        return self.live_count
+
+    def __contains__(self, file_path):
+        return self.file_id(file_path) is not None
+
+    def __iter__(self):
+        """Yields the path of every live file."""
+        for file_id in self.ids():
+            yield self.path(file_id)
+
+    def ids(self):
+        """Returns an iterator over the live file ids. Nothing is copied up front."""
+        return compress(range(len(self.live)), self.live)
+
+    def directory_id(self, directory):
+        """Returns the id of a directory, adding it and any missing parents below the root."""
+        dir_id = self.dir_ids.get(directory)
+        if dir_id is not None:
+            return dir_id
+        parent = os.path.dirname(directory)
+        if directory == self.root or parent == directory or len(parent) < len(self.root):
+            parent_id, name = NO_PARENT, directory
+        else:
+            parent_id, name = self.directory_id(parent), os.path.basename(directory)
+        dir_id = len(self.dir_prefixes)
+        self.dir_parent.append(parent_id)
+        self.dir_names.append(sys.intern(name))
+        self.dir_prefixes.append(os.path.join(directory, ""))
+        self.dir_files.append({})
+        self.dir_ids[directory] = dir_id
+        return dir_id
+
+    @staticmethod
+    def extension(name):
+        """Returns the lowercased extension of a basename: from its last dot, "" without one.
+
+        Unlike os.path.splitext() a leading dot counts, so a name ends with a
+        single-dot suffix exactly when that suffix is its extension.
+        """
+        dot = name.rfind(".")
+        return name[dot:].lower() if dot >= 0 else ""
+
+    def extension_id(self, name):
+        """Returns the id of the extension of a basename, adding it if new."""
+        extension = self.extension(name)
+        ext_id = self.extension_ids.get(extension)
+        if ext_id is None:
+            ext_id = self.extension_ids[extension] = len(self.extensions)
+            self.extensions.append(extension)
+            self.extension_files.append(array("I"))
+            self.extension_counts.append(0)
+        return ext_id
+
+    def count_extensions(self):
+        """Returns {extension: live file count} for the extensions with live files."""
+        return {extension: count for extension, count in zip(self.extensions, self.extension_counts) if count}
+
+    def facet(self, ext_id):
+        """Returns an iterator over the live file ids with an extension id, in id order."""
+        file_ids = self.extension_files[ext_id]
+        return compress(file_ids, map(self.live.__getitem__, file_ids))
+
+    def file_id(self, file_path):
+        """Returns the id of a live file, or None."""
+        directory, name = os.path.split(file_path)
+        dir_id = self.dir_ids.get(directory)
+        return None if dir_id is None else self.dir_files[dir_id].get(name)
+
+    def path(self, file_id):
+        """Returns the full path of a file id, live or dead."""
+        return self.dir_prefixes[self.file_dir[file_id]] + self.names[file_id]
+
+    def name(self, file_id):
+        """Returns the basename of a file id."""
+        return self.names[file_id]
+
+    def metadata(self, file_id):
+        """Returns (size, mtime, ctime) of a file id."""
+        return self.file_size[file_id], self.file_mtime[file_id], self.file_ctime[file_id]
+
+    def add(self, file_path, size=0, mtime=0.0, ctime=0.0):
+        """Adds a file, or updates its metadata if it is already indexed. Returns its id."""
+        directory, name = os.path.split(file_path)
+        dir_id = self.directory_id(directory)
+        files = self.dir_files[dir_id]
+        file_id = files.get(name)
+        if file_id is not None:
+            if self.metadata(file_id) != (size, mtime, ctime):
+                self.file_size[file_id] = size
+                self.file_mtime[file_id] = mtime
+                self.file_ctime[file_id] = ctime
+                self.orders = {}
+            return file_id
+        name = sys.intern(name)
+        file_id = files[name] = len(self.names)
+        ext_id = self.extension_id(name)
+        self.file_dir.append(dir_id)
+        self.file_ext.append(ext_id)
+        self.extension_files[ext_id].append(file_id)
+        self.extension_counts[ext_id] += 1
+        self.names.append(name)
+        self.file_size.append(size)
+        self.file_mtime.append(mtime)
+        self.file_ctime.append(ctime)
+        self.orders = {}
+        self.live.append(1)
+        self.live_count += 1
+        if self.name_index is not None:
+            self.name_index.add(file_id, name.lower())
+        self.block = None
+        return file_id
+
+    def load(self, rows):
+        """Adds (path, size, mtime, ctime) rows of files that are not indexed yet, such as the stored index.
+
+        Same as add() for every row, minus the per-row upsert checks. Rows in path
+        order keep the files of a directory together, so the directory is looked up
+        once per run of its files.
+        """
+        file_dir, file_ext, names, live = self.file_dir, self.file_ext, self.names, self.live
+        file_size, file_mtime, file_ctime = self.file_size, self.file_mtime, self.file_ctime
+        extension_ids, extension_files, extension_counts = self.extension_ids, self.extension_files, self.extension_counts
+        name_index = self.name_index
+        last_directory = None
+        dir_id = files = None
+        count = 0
+        for file_path, size, mtime, ctime in rows:
+            directory, name = os.path.split(file_path)
+            if directory != last_directory:
+                last_directory = directory
+                dir_id = self.directory_id(directory)
+                files = self.dir_files[dir_id]
+            if name in files:
+                continue
+            name = sys.intern(name)
+            file_id = files[name] = len(names)
+            dot = name.rfind(".")
+            ext_id = extension_ids.get(name[dot:].lower() if dot >= 0 else "")
+            if ext_id is None:
+                ext_id = self.extension_id(name)
+            file_dir.append(dir_id)
+            file_ext.append(ext_id)
+            extension_files[ext_id].append(file_id)
+            extension_counts[ext_id] += 1
+            names.append(name)
+            file_size.append(size)
+            file_mtime.append(mtime)
+            file_ctime.append(ctime)
+            live.append(1)
+            if name_index is not None:
+                name_index.add(file_id, name.lower())
+            count += 1
+        self.live_count += count
+        self.orders = {}
+        self.block = None
+        return count
+
+    def remove(self, file_path):
+        """Marks a file as removed. Returns its id, or None if it was not indexed."""
+        directory, name = os.path.split(file_path)
+        dir_id = self.dir_ids.get(directory)
+        file_id = None if dir_id is None else self.dir_files[dir_id].pop(name, None)
+        if file_id is None:
+            return None
+        self.live[file_id] = 0
+        self.live_count -= 1
+        self.extension_counts[self.file_ext[file_id]] -= 1
+        self.block = None
+        self.orders = {}
+        self.stale += 1
+        if self.stale > max(STALE_REBUILD_MIN, self.live_count):
+            self.compact()
+        return file_id
+
+    def compact(self):
+        """Drops the ids of removed files from the trigram and facet postings."""
+        names = self.names
+        if self.name_index is not None:
+            self.name_index.rebuild((file_id, names[file_id].lower()) for file_id in self.ids())
+        self.extension_files = [array("I", self.facet(ext_id)) for ext_id in range(len(self.extensions))]
+        self.stale = 0
+
+    def range(self, column, low, high):
+        """Returns the live file ids with a column value between low and high (inclusive), as a view of its sorted order."""
+        order = self.order(column)
+        values = self.columns[column]
+        start = 0 if low is None else bisect_order(order, values, low)
+        end = len(order) if high is None else bisect_order(order, values, high, right=True)
+        return memoryview(order)[start:end]
+
+    def sort_key(self, column):
+        """Returns key(file id) for sorting by one of SORT_COLUMNS. Names sort case-insensitively."""
+        if column == "name":
+            names = self.names
+            return lambda file_id: names[file_id].lower()
+        return self.columns[column].__getitem__
+
+    def order(self, column):
+        """Returns an array of the live file ids sorted by one of SORT_COLUMNS, ties in id order.
+
+        It is cached until a file is added, removed or changed.
+        """
+        order = self.orders.get(column)
+        if order is None:
+            order = self.orders[column] = array("I", sorted(self.ids(), key=self.sort_key(column)))
+        return order
+
+    def match_names(self, query):
+        """Returns the live file ids whose lowercased basename contains a non-empty query."""
+        live = self.live
+        names = self.names
+        if len(query) < 3 or self.name_index is None:
+            # Too short for a trigram or no trigram index yet, scan the lowercased names in one block instead
+            ids, block = self.name_block()
+            matched = []
+            line = -1
+            line_start = 0
+            pos = block.find(query)
+            while pos >= 0:
+                line += block.count("\n", line_start, pos)
+                line_start = pos
+                matched.append(ids[line])
+                pos = block.find("\n", pos)  # Skip the rest of the matching name
+                if pos < 0:
+                    break
+                pos = block.find(query, pos)
+            return matched
+
+        candidates = sorted(self.name_index.candidates(query))
+        # Trigrams can match out of order, so longer queries are verified against the name
+        if len(query) == 3:
+            return [file_id for file_id in candidates if live[file_id]]
+        return [file_id for file_id in candidates if live[file_id] and query in names[file_id].lower()]
+
+    def build_name_index(self, count):
+        """Returns a trigram index of the first count file ids, dead ones included.
+
+        Rows are only ever appended, so this can run without the caller's lock while
+        the table keeps changing. Pass the result to set_name_index().
+        """
+        names = self.names
+        name_index = TrigramIndex()
+        name_index.rebuild((file_id, names[file_id].lower()) for file_id in range(count))
+        return name_index
+
+    def set_name_index(self, name_index, count):
+        """Installs a trigram index from build_name_index(count), adding the files added since. Call with the lock held."""
+        names = self.names
+        for file_id in range(count, len(names)):
+            name_index.add(file_id, names[file_id].lower())
+        self.name_index = name_index
+
+    def name_block(self):
+        """Returns (ids, block): the live file ids and their lowercased basenames joined into one string.
+
+        Each name follows a newline, the n-th name in the block belongs to ids[n].
+        Short and fuzzy queries run over the block. It is cached until the table changes.
+        """
+        block = self.block
+        if block is None:
+            ids = array("I", self.ids())
+            names = self.names
+            block = self.block = (ids, "\n" + "\n".join([names[file_id] for file_id in ids]).lower())
+        return block
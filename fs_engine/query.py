@@ -0,0 +1,778 @@
+"""
+File Search Pro - query language
+Copyright (C) 2024 [Kristopher Sorensen]
+
+Licensed under the GNU General Public License v3 or later, see LICENSE.txt.
+
+A search is a list of terms, all of which must match:
+
+    report                      the file name contains "report"
+    "annual report"             the file name contains the phrase
+    *.pdf  report_??.docx       a glob over the whole file name
+    /v\\d+\\.docx$/  re:^img_     a regular expression searched in the file name
+    ext:pdf  ext:jpg,png        the file extension
+    tag:client                  a tag contains "client", tag: alone matches every tagged file
+    path:projects/2024          the full path contains the text, or matches a glob
+    content:connection timeout  the content index, the words after content: belong to it
+    size:>100MB  modified:<7d  created:2024-01-01..2024-06-30   see filters.py
+
+Names, paths and tags match case-insensitively, and so do regular expressions.
+OR (or |) between terms matches either side, NOT (or a leading - or !) negates a
+term and parentheses group terms. NOT binds tightest, then AND, then OR. A value
+with spaces can be quoted, e.g. tag:"client a". Parsing never fails, so a query
+that is still being typed still runs. Parts that cannot be used, like an
+unbalanced parenthesis or a bad regular expression, are dropped or read as
+plain text, and a warning is added.
+
+parse_query() returns the syntax tree. bind() compiles it into a plan for one
+path table. An AND runs its most selective index-backed term (extension facet,
+sorted size or date range, tag or content index, trigram name index) as the
+driver. Its other terms then filter the driver's candidates, cheapest first, so
+an expensive term such as a regular expression only sees what is left.
+explain() runs a plan and counts the candidates at every stage.
+"""
+
+import os
+import re
+import time
+import heapq
+import logging
+import fnmatch
+
+from .filters import parse_range
+
+log = logging.getLogger(__name__)
+
+OPERATORS = {"AND", "OR", "NOT"}
+FIELDS = {"ext", "tag", "path", "content", "re", "size", "modified", "created"}
+RANGE_FIELDS = {"size", "modified", "created"}
+GLOB_CHARACTERS = "*?["
+FIELD_PATTERN = re.compile(r"([a-z]+):")
+GLOB_CLASS_PATTERN = re.compile(r"\[[^\]]*\]?")
+GLOB_LITERAL_PATTERN = re.compile(r"[^*?]+")
+
+# Per candidate cost of testing a term, lower is cheaper
+COST_LOOKUP = 1  # Array or set lookup
+COST_NAME = 2  # Substring of the name
+COST_PATH = 3  # Substring of the joined path
+COST_GLOB = 4
+COST_REGEX = 5
+
+
+# Syntax tree
+class Term:
+    """One search term: field is None for file name text, value is the text after the colon."""
+    def __init__(self, field, value, quoted=False):
+        self.field = field
+        self.value = value
+        self.quoted = quoted
+        self.paths = None  # Files of a tag: or content: term, set by resolve()
+        self.column = self.low = self.high = None  # Bounds of a range term
+        self.pattern = None  # Compiled regular expression or glob
+
+    def __repr__(self):
+        text = f'"{self.value}"' if self.quoted or " " in self.value else self.value
+        return f"{self.field}:{text}" if self.field else text
+
+    @property
+    def kind(self):
+        """Returns what the term matches: name, glob, regex, ext, suffix, tag, path, content or range."""
+        if self.field is None:
+            return "glob" if self.pattern is not None else "name"
+        if self.field in RANGE_FIELDS:
+            return "range"
+        return "regex" if self.field == "re" else self.field
+
+    def terms(self):
+        yield self
+
+
+class Not:
+    def __init__(self, child):
+        self.child = child
+
+    def __repr__(self):
+        return f"NOT {self.child!r}"
+
+    def terms(self):
+        yield from self.child.terms()
+
+
+class And:
+    def __init__(self, children):
+        self.children = children
+
+    def __repr__(self):
+        return "(" + " AND ".join(map(repr, self.children)) + ")"
+
+    def terms(self):
+        for child in self.children:
+            yield from child.terms()
+
+
+class Or:
+    def __init__(self, children):
+        self.children = children
+
+    def __repr__(self):
+        return "(" + " OR ".join(map(repr, self.children)) + ")"
+
+    def terms(self):
+        for child in self.children:
+            yield from child.terms()
+
+
+class Query:
+    """A parsed query: its syntax tree (None for an empty query) and the warnings from parsing it."""
+    def __init__(self, text, root, warnings):
+        self.text = text
+        self.root = root
+        self.warnings = warnings
+
+    def terms(self):
+        return list(self.root.terms()) if self.root is not None else []
+
+    def kind(self, fuzzy=False):
+        """Returns the kind of search the query runs, the label of its latency metrics."""
+        kinds = {term.kind for term in self.terms()}
+        for kind in ("content", "tag", "regex", "glob"):
+            if kind in kinds:
+                return kind
+        if "name" in kinds:
+            return "fuzzy" if fuzzy else "name"
+        if "path" in kinds:
+            return "path"
+        return "filter" if kinds else "all"
+
+    def resolve(self, tag_files, content_files):
+        """Looks up the files of tag: and content: terms once, for every path table the query runs on."""
+        for term in self.terms():
+            if term.field == "tag":
+                term.paths = tag_files(term.value)
+            elif term.field == "content":
+                term.paths = content_files(term.value)
+
+    def split_fuzzy(self):
+        """Returns (fuzzy text, rest): the plain name words that must all match, and the query without them.
+
+        A fuzzy search ranks names by those words and filters the ranked names by the rest.
+        """
+        root = self.root
+        children = root.children if isinstance(root, And) else [root] if root is not None else []
+        words = [child for child in children if isinstance(child, Term) and child.kind == "name"]
+        rest = [child for child in children if child not in words]
+        text = " ".join(term.value for term in words)
+        rest = None if not rest else rest[0] if len(rest) == 1 else And(rest)
+        return text, Query(self.text, rest, self.warnings)
+
+
+# Tokenizer and parser
+def tokenize(text, warnings):
+    """Returns the query as ("(" | ")" | "AND" | "OR" | "NOT", None) and ("term", Term) tokens."""
+    tokens = []
+    position = 0
+    length = len(text)
+    while position < length:
+        char = text[position]
+        if char.isspace():
+            position += 1
+        elif char in "()":
+            tokens.append((char, None))
+            position += 1
+        elif char == "|":
+            tokens.append(("OR", None))
+            position += 1
+        elif char in "-!" and (position + 1 == length or not text[position + 1].isspace()):
+            # A - or ! at the very end is a NOT still being typed, the parser drops it
+            tokens.append(("NOT", None))
+            position += 1
+        elif char == '"':
+            value, position = read_quoted(text, position, warnings)
+            tokens.append(("term", Term(None, value, quoted=True)))
+        elif char == "/" and text.find("/", position + 1) > position + 1:
+            end = text.find("/", position + 1)
+            tokens.append(("term", Term("re", text[position + 1:end])))
+            position = end + 1
+        else:
+            match = FIELD_PATTERN.match(text, position)
+            if match and match.group(1) in FIELDS:
+                field = match.group(1)
+                position = match.end()
+                if position < length and text[position] == '"':
+                    value, position = read_quoted(text, position, warnings)
+                    tokens.append(("term", Term(field, value, quoted=True)))
+                    continue
+                value, position = read_word(text, position, allow_parentheses=field == "re")
+                tokens.append(("term", Term(field, value)))
+                continue
+            word, position = read_word(text, position)
+            if word in OPERATORS:
+                tokens.append((word, None))
+            else:
+                tokens.append(("term", Term(None, word)))
+    return tokens
+
+
+def read_quoted(text, position, warnings):
+    """Returns (text between the quotes starting at position, position after the closing quote)."""
+    end = text.find('"', position + 1)
+    if end < 0:
+        warnings.append("Missing closing quote")
+        return text[position + 1:], len(text)
+    return text[position + 1:end], end + 1
+
+
+def read_word(text, position, allow_parentheses=False):
+    """Returns (word, end): the text up to the next space or parenthesis.
+
+    A regular expression keeps its own balanced parentheses, so (re:a(b|c)) ends before the last one.
+    """
+    start = position
+    depth = 0
+    while position < len(text) and not text[position].isspace():
+        char = text[position]
+        if char == "(":
+            if not allow_parentheses:
+                break
+            depth += 1
+        elif char == ")":
+            if not depth:
+                break
+            depth -= 1
+        position += 1
+    return text[start:position], position
+
+
+class Parser:
+    """Recursive descent over the tokens: or := and (OR and)*, and := not (AND? not)*, not := NOT not | ( or ) | term."""
+    def __init__(self, tokens, warnings):
+        self.tokens = tokens
+        self.position = 0
+        self.warnings = warnings
+
+    def peek(self):
+        return self.tokens[self.position][0] if self.position < len(self.tokens) else None
+
+    def next(self):
+        token = self.tokens[self.position]
+        self.position += 1
+        return token
+
+    def parse(self):
+        nodes = []
+        while self.position < len(self.tokens):
+            node = self.parse_or()
+            if node is not None:
+                nodes.append(node)
+            if self.peek() == ")":
+                self.warnings.append("Unmatched closing parenthesis")
+                self.next()
+        return simplify(And, nodes)
+
+    def parse_or(self):
+        nodes = [self.parse_and()]
+        while self.peek() == "OR":
+            self.next()
+            nodes.append(self.parse_and())
+        return simplify(Or, [node for node in nodes if node is not None])
+
+    def parse_and(self):
+        nodes = []
+        while self.peek() not in (None, ")", "OR"):
+            if self.peek() == "AND":
+                self.next()
+                continue
+            node = self.parse_not()
+            if node is None:
+                continue
+            previous = nodes[-1] if nodes else None
+            if (
+                isinstance(previous, Term) and previous.field == "content" and not previous.quoted
+                and isinstance(node, Term) and node.field is None and not node.quoted
+            ):
+                previous.value = f"{previous.value} {node.value}".strip()  # content:connection timeout
+                continue
+            nodes.append(node)
+        return simplify(And, nodes)
+
+    def parse_not(self):
+        kind, term = self.next()
+        if kind == "NOT":
+            if self.peek() in (None, ")", "OR", "AND"):
+                return None  # Still being typed
+            child = self.parse_not()
+            return None if child is None else Not(child)
+        if kind == "(":
+            node = self.parse_or()
+            if self.peek() == ")":
+                self.next()
+            else:
+                self.warnings.append("Missing closing parenthesis")
+            return node
+        return term
+
+
+def simplify(node_type, nodes):
+    if not nodes:
+        return None
+    return nodes[0] if len(nodes) == 1 else node_type(nodes)
+
+
+def parse_query(text, now=None):
+    """Parses a query into a Query. Terms that cannot be used are dropped with a warning."""
+    warnings = []
+    root = Parser(tokenize(text.strip(), warnings), warnings).parse()
+    now = time.time() if now is None else now
+    root = prepare(root, now, warnings)
+    return Query(text, root, warnings)
+
+
+def prepare(node, now, warnings):
+    """Normalizes the terms of a syntax tree and drops the unusable ones. Returns the tree, or None if nothing is left."""
+    if node is None:
+        return None
+    if isinstance(node, Term):
+        return prepare_term(node, now, warnings)
+    if isinstance(node, Not):
+        child = prepare(node.child, now, warnings)
+        return None if child is None else Not(child)
+    children = [child for child in (prepare(child, now, warnings) for child in node.children) if child is not None]
+    return simplify(type(node), children)
+
+
+def prepare_term(term, now, warnings):
+    field, value = term.field, term.value
+    if field in RANGE_FIELDS:
+        try:
+            term.low, term.high = parse_range(field if field == "size" else "modified", value, now)
+        except ValueError as e:
+            if value:
+                warnings.append(f"Ignoring {field}:{value}: {e}")
+            return None
+        term.column = field
+        return term
+    if field == "re":
+        try:
+            term.pattern = re.compile(value, re.IGNORECASE)
+        except re.error as e:
+            warnings.append(f"Invalid regular expression {value!r}, searching it as text: {e}")
+            return Term(None, value.lower(), quoted=True) if value else None
+        return term if value else None
+    if field == "ext":
+        extensions = {extension.strip().lower() for extension in value.split(",") if extension.strip()}
+        if not extensions:
+            return None
+        term.value = ",".join(sorted(extension if extension.startswith(".") else "." + extension for extension in extensions))
+        return term
+    if field == "tag":
+        term.value = value.lower()
+        return term  # tag: alone matches every tagged file
+    if not value:
+        return None
+    term.value = value.lower()
+    if field == "path":
+        term.value = term.value.replace("/", os.sep)  # path:projects/2024 on Windows too
+    if not term.quoted and any(char in value for char in GLOB_CHARACTERS):
+        if field is None:
+            extension = glob_extension(term.value)
+            if extension is not None:
+                return Term("ext", extension)  # *.pdf is answered by the extension facet
+        term.pattern = re.compile(fnmatch.translate(term.value), re.IGNORECASE | re.DOTALL)
+    return term
+
+
+def glob_extension(pattern):
+    """Returns the extension a glob like "*.pdf" selects, or None if it is not that simple."""
+    if pattern.startswith("*.") and len(pattern) > 2 and not any(char in pattern[1:] for char in GLOB_CHARACTERS):
+        return pattern[1:] if pattern.rfind(".") == 1 else None
+    return None
+
+
+def suffix_terms(suffixes):
+    """Returns terms for required file name suffixes: an ext: term for a single-dot extension, else a suffix term."""
+    terms = []
+    for suffix in suffixes:
+        suffix = suffix.lower()
+        if len(suffix) > 1 and suffix.rfind(".") == 0:
+            terms.append(Term("ext", suffix))
+        else:
+            terms.append(Term("suffix", suffix))
+    return terms
+
+
+def with_terms(query, terms):
+    """Returns the query with extra terms that must all match too."""
+    if not terms:
+        return query
+    children = ([query.root] if query.root is not None else []) + list(terms)
+    return Query(query.text, simplify(And, children), query.warnings)
+
+
+# Plans
+class Plan:
+    """A compiled node for one path table.
+
+    An indexed node can list its matching ids straight from an index, ids(),
+    with estimate an upper bound of how many. Every node can test(file_id), at
+    a per-candidate cost. An explained plan counts what each node produced and
+    tested.
+    """
+    indexed = False
+    cost = COST_LOOKUP
+    strategy = ""
+
+    def __init__(self, table, label, estimate):
+        self.table = table
+        self.label = label
+        self.estimate = estimate
+        self.children = []
+        self.role = None  # "driver" or "filter" within an AND
+        self.produced = self.tested = self.passed = None
+
+    def ids(self):
+        raise NotImplementedError
+
+    def test(self, file_id):
+        raise NotImplementedError
+
+    def instrument(self):
+        """Makes the node and its children count the ids they produce and test, for explain()."""
+        self.produced = self.tested = self.passed = 0
+        ids, test = self.ids, self.test
+
+        def counting_ids():
+            for file_id in ids():
+                self.produced += 1
+                yield file_id
+
+        def counting_test(file_id):
+            self.tested += 1
+            if test(file_id):
+                self.passed += 1
+                return True
+            return False
+
+        self.ids, self.test = counting_ids, counting_test
+        for child in self.children:
+            child.instrument()
+
+    def explain(self):
+        entry = {"node": self.label, "strategy": self.strategy, "estimate": self.estimate}
+        if self.role:
+            entry["role"] = self.role
+        if self.produced is not None:
+            # A driver produces ids and a filter tests them, a node that was never reached shows produced 0
+            if self.produced or not self.tested:
+                entry["produced"] = self.produced
+            if self.tested:
+                entry["tested"] = self.tested
+                entry["passed"] = self.passed
+        if self.children:
+            entry["children"] = [child.explain() for child in self.children]
+        return entry
+
+
+class AllPlan(Plan):
+    indexed = True
+    strategy = "every file"
+
+    def __init__(self, table):
+        super().__init__(table, "all files", len(table))
+
+    def ids(self):
+        return self.table.ids()
+
+    def test(self, file_id):
+        return True
+
+
+class NamePlan(Plan):
+    """Substring of the lowercased file name, from the trigram index or a scan of the name block."""
+    indexed = True
+    cost = COST_NAME
+
+    def __init__(self, table, text, label=None):
+        trigram = table.name_index is not None and len(text) >= 3
+        super().__init__(table, label or f"name {text!r}", table.name_index.estimate(text) if trigram else len(table))
+        self.text = text
+        self.strategy = "trigram index" if trigram else "name scan"
+
+    def ids(self):
+        return self.table.match_names(self.text)
+
+    def test(self, file_id):
+        return self.text in self.table.names[file_id].lower()
+
+
+class GlobPlan(Plan):
+    """A glob over the file name. Its longest literal part finds the candidates when it has one."""
+    cost = COST_GLOB
+
+    def __init__(self, table, term):
+        # A character class like [0-9] is no literal, so it is replaced first
+        literals = sorted(GLOB_LITERAL_PATTERN.findall(GLOB_CLASS_PATTERN.sub("?", term.value)), key=len)
+        self.literal = literals[-1] if literals else ""
+        super().__init__(table, f"glob {term.value}", len(table))
+        self.match = term.pattern.match
+        if self.literal:
+            self.indexed = True
+            self.literal_plan = NamePlan(table, self.literal)
+            self.estimate = self.literal_plan.estimate
+            self.strategy = f"{self.literal_plan.strategy} for {self.literal!r}, then glob"
+        else:
+            self.strategy = "glob"
+
+    def ids(self):
+        names, match = self.table.names, self.match
+        return [file_id for file_id in self.literal_plan.ids() if match(names[file_id])]
+
+    def test(self, file_id):
+        return self.match(self.table.names[file_id]) is not None
+
+
+class RegexPlan(Plan):
+    cost = COST_REGEX
+    strategy = "regular expression"
+
+    def __init__(self, table, term):
+        super().__init__(table, f"regex /{term.value}/", len(table))
+        self.search = term.pattern.search
+
+    def test(self, file_id):
+        return self.search(self.table.names[file_id]) is not None
+
+
+class ExtPlan(Plan):
+    """File extensions, from the extension facet."""
+    indexed = True
+    strategy = "extension facet"
+
+    def __init__(self, table, extensions):
+        self.ext_ids = {table.extension_ids[extension] for extension in extensions if extension in table.extension_ids}
+        super().__init__(table, "ext " + ",".join(extensions), sum(table.extension_counts[ext_id] for ext_id in self.ext_ids))
+
+    def ids(self):
+        facets = [self.table.facet(ext_id) for ext_id in sorted(self.ext_ids)]
+        return facets[0] if len(facets) == 1 else heapq.merge(*facets)
+
+    def test(self, file_id):
+        return self.table.file_ext[file_id] in self.ext_ids
+
+
+class SuffixPlan(Plan):
+    cost = COST_NAME
+    strategy = "name suffix"
+
+    def __init__(self, table, suffix):
+        super().__init__(table, f"suffix {suffix}", len(table))
+        self.suffix = suffix
+
+    def test(self, file_id):
+        return self.table.names[file_id].lower().endswith(self.suffix)
+
+
+class RangePlan(Plan):
+    """Size or date bounds, from the column's sorted order."""
+    indexed = True
+    strategy = "sorted range"
+
+    def __init__(self, table, term):
+        self.column, self.low, self.high = term.column, term.low, term.high
+        self.view = table.range(self.column, self.low, self.high)
+        super().__init__(table, repr(term), len(self.view))
+
+    def ids(self):
+        return self.view
+
+    def test(self, file_id):
+        value = self.table.columns[self.column][file_id]
+        return (self.low is None or value >= self.low) and (self.high is None or value <= self.high)
+
+
+class FileSetPlan(Plan):
+    """Files listed by another index, the tag index or the content index, as ids of this table."""
+    indexed = True
+
+    def __init__(self, table, term):
+        file_ids = (table.file_id(file_path) for file_path in term.paths or ())
+        self.file_ids = {file_id for file_id in file_ids if file_id is not None}
+        super().__init__(table, repr(term), len(self.file_ids))
+        self.strategy = f"{term.field} index"
+
+    def ids(self):
+        return sorted(self.file_ids)
+
+    def test(self, file_id):
+        return file_id in self.file_ids
+
+
+class PathPlan(Plan):
+    """Substring of, or glob over, the full lowercased path. Directory prefixes are checked once per directory."""
+    cost = COST_PATH
+
+    def __init__(self, table, term):
+        super().__init__(table, repr(term), len(table))
+        self.text = term.value
+        self.match = term.pattern.match if term.pattern is not None else None
+        self.strategy = "path glob" if self.match else "path substring"
+        self.directories = {}  # Directory id -> (prefix contains the text, lowercased prefix tail)
+
+    def test(self, file_id):
+        table = self.table
+        if self.match is not None:
+            return self.match(table.path(file_id)) is not None
+        dir_id = table.file_dir[file_id]
+        directory = self.directories.get(dir_id)
+        if directory is None:
+            prefix = table.dir_prefixes[dir_id].lower()
+            # A match that does not lie in the prefix starts in its last len(text) - 1 characters at the earliest
+            directory = self.directories[dir_id] = (self.text in prefix, prefix[max(0, len(prefix) - len(self.text) + 1):])
+        return directory[0] or self.text in directory[1] + table.names[file_id].lower()
+
+
+class NotPlan(Plan):
+    def __init__(self, table, child):
+        # An unindexed child's estimate is only the table size, so nothing can be subtracted from it
+        super().__init__(table, "NOT", len(table) - child.estimate if child.indexed else len(table))
+        self.children = [child]
+        self.cost = child.cost
+        self.strategy = "exclude"
+        self.excluded = None
+
+    def test(self, file_id):
+        child = self.children[0]
+        if child.indexed and child.estimate <= len(self.table) // 2:
+            # A small indexed set is read once and then looked up
+            if self.excluded is None:
+                self.excluded = set(child.ids())
+            return file_id not in self.excluded
+        return not child.test(file_id)
+
+
+class OrPlan(Plan):
+    strategy = "union"
+
+    def __init__(self, table, children):
+        super().__init__(table, "OR", min(len(table), sum(child.estimate for child in children)))
+        self.children = sorted(children, key=lambda child: (child.cost, -child.estimate))
+        self.indexed = all(child.indexed for child in children)
+        self.cost = max(child.cost for child in children)
+        if not self.indexed:
+            self.strategy = "any of"
+
+    def ids(self):
+        file_ids = set()
+        for child in self.children:
+            file_ids.update(child.ids())
+        return sorted(file_ids)
+
+    def test(self, file_id):
+        return any(child.test(file_id) for child in self.children)
+
+
+class AndPlan(Plan):
+    """Runs the indexed child with the lowest estimate and filters its ids through the others, cheapest first."""
+    indexed = True
+
+    def __init__(self, table, children):
+        indexed = [child for child in children if child.indexed]
+        driver = min(indexed, key=lambda child: child.estimate) if indexed else AllPlan(table)
+        filters = sorted((child for child in children if child is not driver), key=lambda child: (child.cost, child.estimate))
+        super().__init__(table, "AND", driver.estimate)
+        driver.role = "driver"
+        for child in filters:
+            child.role = "filter"
+        self.driver = driver
+        self.filters = filters
+        self.children = [driver] + filters
+        self.cost = max(child.cost for child in self.children)
+        if filters:
+            self.strategy = f"{driver.strategy}, then {len(filters)} filter{'s' if len(filters) > 1 else ''}"
+        else:
+            self.strategy = driver.strategy
+
+    def ids(self):
+        file_ids = self.driver.ids()
+        for child in self.filters:
+            file_ids = filter(child.test, file_ids)
+        return file_ids
+
+    def test(self, file_id):
+        return all(child.test(file_id) for child in self.children)
+
+
+def bind(node, table):
+    """Compiles a syntax tree (None: every file) into a Plan for one path table. The plan can always list its ids."""
+    plan = bind_node(node, table)
+    return plan if plan.indexed else AndPlan(table, [plan])
+
+
+def bind_node(node, table):
+    if node is None:
+        return AllPlan(table)
+    if isinstance(node, And):
+        return AndPlan(table, [bind_node(child, table) for child in node.children])
+    if isinstance(node, Or):
+        return OrPlan(table, [bind_node(child, table) for child in node.children])
+    if isinstance(node, Not):
+        return NotPlan(table, bind_node(node.child, table))
+    kind = node.kind
+    if kind == "name":
+        return NamePlan(table, node.value, f'name "{node.value}"' if node.quoted else None)
+    if kind == "glob":
+        return GlobPlan(table, node)
+    if kind == "regex":
+        return RegexPlan(table, node)
+    if kind == "ext":
+        return ExtPlan(table, node.value.split(","))
+    if kind == "suffix":
+        return SuffixPlan(table, node.value)
+    if kind == "range":
+        return RangePlan(table, node)
+    if kind in ("tag", "content"):
+        return FileSetPlan(table, node)
+    return PathPlan(table, node)
+
+
+def run(plan, sort=None, descending=False):
+    """Returns an iterable of the ids a plan matches, in id order or sorted by one of SORT_COLUMNS.
+
+    Index reads happen here, call it with the table's lock held. Filters run
+    lazily, as the result is read. A plan driven by every file or by a range of
+    the sort column reads ids in sorted order, so nothing is sorted.
+    """
+    if sort is None:
+        return plan.ids()
+    table = plan.table
+    driver, filters = (plan.driver, plan.filters) if isinstance(plan, AndPlan) else (plan, [])
+    if isinstance(driver, AllPlan):
+        file_ids = table.order(sort)
+    elif isinstance(driver, RangePlan) and driver.column == sort:
+        file_ids = driver.view
+    else:
+        file_ids = sorted(plan.ids(), key=table.sort_key(sort))
+        filters = []
+    if descending:
+        file_ids = reversed(file_ids)
+    for child in filters:
+        file_ids = filter(child.test, file_ids)
+    return file_ids
+
+
+def explain_text(explanation):
+    """Returns an explain() result as indented text, one line per plan node."""
+    lines = [f"Query: {explanation['query']}"]
+    lines += [f"Warning: {warning}" for warning in explanation["warnings"]]
+
+    def add(node, depth):
+        counts = ", ".join(f"{key} {node[key]:,}" for key in ("produced", "tested", "passed") if key in node)
+        role = f"{node['role']}: " if "role" in node else ""
+        lines.append(f"{'  ' * depth}{role}{node['node']} [{node['strategy']}] estimate {node['estimate']:,}" + (f", {counts}" if counts else ""))
+        for child in node.get("children", ()):
+            add(child, depth + 1)
+
+    for shard in explanation["directories"]:
+        lines.append(f"{shard['directory']}: {shard['results']:,} results")
+        add(shard["plan"], 1)
+    lines.append(f"Total: {explanation['results']:,} results in {explanation['seconds'] * 1000:.1f} ms")
+    return "\n".join(lines)
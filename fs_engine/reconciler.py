@@ -0,0 +1,248 @@
+"""
+File Search Pro - polling reconciler
+Copyright (C) 2024 [Kristopher Sorensen]
+
+Licensed under the GNU General Public License v3 or later, see LICENSE.txt.
+
+Native file events are not always delivered. Network shares often send none,
+a burst of changes can overflow the kernel's event buffer, which watchdog drops
+silently, and a watch can stop when its share disconnects. The index then drifts
+until the next full refresh.
+
+The Reconciler runs incremental scans of each monitored directory in the
+background. A pass stats every indexed directory and lists only those whose
+mtime changed, so a quiet tree costs one stat per directory. Edits that only
+change a file's contents leave its directory's mtime alone and are not picked up
+by a pass. Directories are polled when their events are unreliable: on a network
+file system, when the watch could not be started or has stopped, or once a pass
+finds changes that the events missed. Pending events are applied before each
+pass, so a pass only counts the changes they missed, and a directory polled for
+missed events trusts them again after POLL_TRUST_PASSES passes in a row find
+none. The interval of a polled directory halves after a pass that found changes
+and grows by half after a quiet one, between POLL_MIN_INTERVAL and
+POLL_MAX_INTERVAL, and never drops below what keeps the passes within
+POLL_IO_BUDGET of the time. Directories with trusted events get a pass every
+POLL_VERIFY_INTERVAL to detect missed events.
+"""
+
+import os
+import re
+import sys
+import time
+import logging
+import threading
+
+from .config import (
+    POLL_MIN_INTERVAL, POLL_MAX_INTERVAL, POLL_VERIFY_INTERVAL, POLL_IO_BUDGET, POLL_WATCH_CHECK_INTERVAL, POLL_TRUST_PASSES,
+    NETWORK_FILE_SYSTEMS
+)
+from .jobs import CancelToken
+
+log = logging.getLogger(__name__)
+
+DRIVE_REMOTE = 4  # GetDriveTypeW() of a mapped network drive
+
+
+def network_file_system(path):
+    """Returns the type of the network file system a path is on, e.g. "nfs4" or "smb", or None for local paths.
+
+    Windows reports UNC paths and mapped network drives. Linux reads the mount
+    table. Other systems return None, their directories are still polled once a
+    pass finds missed events.
+    """
+    if sys.platform == "win32":
+        if path.startswith(("\\\\", "//")):
+            return "smb"
+        import ctypes
+        drive = os.path.splitdrive(os.path.abspath(path))[0] + "\\"
+        return "smb" if ctypes.windll.kernel32.GetDriveTypeW(drive) == DRIVE_REMOTE else None
+    try:
+        with open("/proc/self/mounts", encoding="utf-8", errors="replace") as f:
+            mounts = [line.split()[1:3] for line in f]
+    except OSError:
+        return None
+    path = os.path.realpath(path)
+    best = ""
+    file_system = None
+    for mount_point, mount_type in mounts:
+        # Spaces and other special characters in mount points are octal escapes like \040
+        mount_point = re.sub(r"\\([0-7]{3})", lambda match: chr(int(match.group(1), 8)), mount_point)
+        if len(mount_point) > len(best) and (path == mount_point or path.startswith(os.path.join(mount_point, ""))):
+            best = mount_point
+            file_system = mount_type
+    return file_system if file_system in NETWORK_FILE_SYSTEMS else None
+
+
+class PollState:
+    """Reconciler state of one monitored directory."""
+    def __init__(self, root, reason, now):
+        self.root = root
+        self.reason = reason  # Why the directory is polled, None while its file events are trusted
+        self.recoverable = False  # Polled because events were missed, trusted again after POLL_TRUST_PASSES quiet passes
+        self.quiet_passes = 0  # Passes in a row that found no changes
+        self.trusted_again = 0  # Times the directory went back from polling to its file events
+        self.interval = POLL_MIN_INTERVAL if reason else POLL_VERIFY_INTERVAL
+        self.due = now + POLL_MIN_INTERVAL  # The first pass picks up changes made before the watch started
+        self.baseline = True  # The first pass is not held against the file events
+        self.passes = 0
+        self.changes = 0  # Files added and removed by passes
+        self.last_seconds = None
+
+    def status(self):
+        return {
+            "polling": self.reason is not None,
+            "reason": self.reason,
+            "interval": round(self.interval, 1),
+            "passes": self.passes,
+            "changes": self.changes,
+            "quiet_passes": self.quiet_passes,
+            "trusted_again": self.trusted_again,
+            "last_seconds": None if self.last_seconds is None else round(self.last_seconds, 3),
+        }
+
+
+class Reconciler:
+    """Background thread that brings directories up to date with incremental scans, see the module docstring.
+
+    engine is the SearchEngine: its directories are reconciled with
+    engine.reconcile_directory(), and engine.stopped_watches() reports the
+    directories whose watch failed or stopped.
+    """
+    def __init__(self, engine):
+        self.engine = engine
+        self.states = {}  # Directory path -> PollState
+        self.condition = threading.Condition()
+        self.running = True
+        self.token = CancelToken()  # Cancels the running pass on stop()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def update(self):
+        """Picks up added and removed directories."""
+        with self.condition:
+            self.condition.notify()
+
+    def poll(self, root, reason, recoverable=False):
+        """Starts polling a directory, if it is not polled already.
+
+        A recoverable reason ends after POLL_TRUST_PASSES passes in a row without changes.
+        """
+        with self.condition:
+            state = self.states.get(root)
+            if state is None or state.reason is not None:
+                return
+            state.reason = reason
+            state.recoverable = recoverable
+            state.interval = POLL_MIN_INTERVAL
+            state.due = min(state.due, time.monotonic() + POLL_MIN_INTERVAL)
+            self.condition.notify()
+        log.warning("File events of %s are unreliable (%s), polling it for changes.", root, reason)
+        self.engine.metrics.set("filesearch_polling", 1, root=root)
+
+    def sync(self, now):
+        """Adds a state for new directories and drops those of removed ones. The caller holds the condition."""
+        directories = list(self.engine.directories)
+        for root in list(self.states):
+            if root not in directories:
+                del self.states[root]
+        for root in directories:
+            if root not in self.states:
+                file_system = network_file_system(root)
+                reason = f"network file system {file_system}" if file_system else None
+                self.states[root] = PollState(root, reason, now)
+                self.engine.metrics.set("filesearch_polling", int(reason is not None), root=root)
+                if reason:
+                    log.info("Polling %s for changes, it is on a %s.", root, reason)
+
+    def run(self):
+        next_watch_check = 0
+        while True:
+            now = time.monotonic()
+            with self.condition:
+                if not self.running:
+                    return
+                self.sync(now)
+            if now >= next_watch_check:
+                next_watch_check = now + POLL_WATCH_CHECK_INTERVAL
+                for root, reason in self.engine.stopped_watches().items():
+                    self.poll(root, reason)
+            with self.condition:
+                if not self.running:
+                    return
+                state = min(self.states.values(), key=lambda state: state.due, default=None)
+                wait = next_watch_check - now if state is None else min(state.due, next_watch_check) - now
+                if wait > 0:
+                    self.condition.wait(wait)
+                    continue
+                self.token = CancelToken(self.engine.index_token)  # Also cancelled by cancel_indexing()
+                token = self.token
+            if state.due <= now:
+                self.reconcile(state, token)
+
+    def reconcile(self, state, token):
+        """Runs one pass over a directory and schedules the next one."""
+        root = state.root
+        started = time.perf_counter()
+        try:
+            scan = self.engine.reconcile_directory(root, token)
+        except Exception as e:
+            log.exception("Error reconciling directory %s: %s", root, e)
+            scan = None
+        seconds = time.perf_counter() - started
+        if scan is None or scan.cancelled:
+            state.due = time.monotonic() + POLL_MIN_INTERVAL  # Busy with another scan, or not loaded yet
+            return
+
+        changes = scan.files_added + scan.files_removed
+        state.passes += 1
+        state.changes += changes
+        state.last_seconds = seconds
+        metrics = self.engine.metrics
+        metrics.inc("filesearch_poll_passes_total", root=root)
+        metrics.inc("filesearch_poll_changes_total", changes, root=root)
+        metrics.observe("filesearch_poll_seconds", seconds, root=root)
+        if changes:
+            log.info("Reconciled %s: %d files added, %d removed.", root, scan.files_added, scan.files_removed)
+
+        baseline, state.baseline = state.baseline, False
+        state.quiet_passes = 0 if changes else state.quiet_passes + 1
+        if state.reason is None and changes and not baseline:
+            self.poll(root, f"file events missed {changes} changes", recoverable=True)
+        elif state.recoverable and state.quiet_passes >= POLL_TRUST_PASSES:
+            self.trust(state)
+        if state.reason is None:
+            interval = POLL_VERIFY_INTERVAL
+        elif scan.directories_listed:
+            interval = max(POLL_MIN_INTERVAL, state.interval / 2)
+        else:
+            interval = min(POLL_MAX_INTERVAL, state.interval * 1.5)
+        # A slow share gets fewer passes, so polling never keeps it busy
+        state.interval = max(interval, seconds / POLL_IO_BUDGET)
+        state.due = time.monotonic() + state.interval
+        metrics.set("filesearch_poll_interval_seconds", round(state.interval, 1), root=root)
+
+    def trust(self, state):
+        """Stops polling a directory whose events were missed once, after enough passes found nothing they missed."""
+        with self.condition:
+            if state.reason is None:
+                return
+            state.reason = None
+            state.recoverable = False
+            state.trusted_again += 1
+        log.info("No missed file events in %s for %d passes, trusting its events again.", state.root, state.quiet_passes)
+        metrics = self.engine.metrics
+        metrics.set("filesearch_polling", 0, root=state.root)
+        metrics.inc("filesearch_poll_trusted_again_total", root=state.root)
+
+    def status(self):
+        """Returns {directory: PollState.status()}."""
+        with self.condition:
+            return {root: state.status() for root, state in self.states.items()}
+
+    def stop(self):
+        """Cancels the running pass and stops the thread."""
+        with self.condition:
+            self.running = False
+            self.token.cancel()
+            self.condition.notify()
+        self.thread.join(timeout=5)
@@ -0,0 +1,361 @@
+"""
+File Search Pro - index service
+Copyright (C) 2024 [Kristopher Sorensen]
+
+Licensed under the GNU General Public License v3 or later, see LICENSE.txt.
+
+An optional long running process that owns the index: it loads it once, keeps
+it up to date by scanning, watching and reconciling, and answers search, tag and
+stats requests from any number of clients. Clients share its warm in-memory
+index instead of each loading and scanning their own.
+
+The service listens on a Unix domain socket on POSIX systems and on a named pipe
+on Windows, one address per index database. Messages are framed by
+multiprocessing.connection, a 4 byte length and the payload, and the payload is
+compact JSON. A request is {"op": name, ...arguments}, the reply {"ok": result}
+or {"error": text}. Connections authenticate with the HMAC challenge of
+multiprocessing.connection. The key is random per service run and written next
+to the index database, readable by the owner only.
+
+    python -m fs_engine serve
+    python -m fs_engine --connect search "report ext:pdf"
+"""
+
+import os
+import sys
+import json
+import hashlib
+import logging
+import tempfile
+import threading
+from multiprocessing.connection import Listener, Client, AuthenticationError
+
+from .config import INDEX_DB_FILE, SERVICE_MAX_REQUEST_BYTES, SERVICE_SEARCH_PAGE_SIZE, SERVICE_MAX_SEARCH_PAGE_SIZE
+from .engine import is_safe_path
+
+log = logging.getLogger(__name__)
+
+FAMILY = "AF_PIPE" if sys.platform == "win32" else "AF_UNIX"
+
+
+class ServiceError(Exception):
+    """The service is not running, or it answered a request with an error."""
+
+
+def service_address(db_path=INDEX_DB_FILE):
+    """Returns the socket path or pipe name of the service of an index database."""
+    digest = hashlib.sha1(os.path.abspath(db_path).encode("utf-8")).hexdigest()[:12]
+    if sys.platform == "win32":
+        return f"\\\\.\\pipe\\FileSearchPro-{digest}"
+    # Socket paths are limited to about 100 bytes, so they live in the temporary directory
+    return os.path.join(tempfile.gettempdir(), f"filesearch-{os.getuid()}-{digest}.sock")
+
+
+def key_file(db_path=INDEX_DB_FILE):
+    return db_path + ".key"
+
+
+def encode(message):
+    return json.dumps(message, separators=(",", ":")).encode("utf-8")
+
+
+# Service
+class IndexService:
+    """Serves one SearchEngine to local clients, one thread per connection.
+
+    Queries run one at a time: they share the engine's content snippets, and
+    each takes milliseconds. Scans run on their own thread.
+    """
+    def __init__(self, engine, address=None):
+        self.engine = engine
+        self.address = address or service_address(engine.index_store.db_path)
+        self.key_file = key_file(engine.index_store.db_path)
+        self.authkey = os.urandom(32)
+        self.listener = None
+        self.stopping = threading.Event()
+        self.query_lock = threading.Lock()
+        self.index_thread = None
+        self.index_lock = threading.Lock()  # Guards index_thread
+        self.lock = threading.Lock()  # Guards connections
+        self.connections = 0
+        self.ops = {
+            "ping": self.op_ping,
+            "search": self.op_search,
+            "explain": self.op_explain,
+            "counts": self.op_counts,
+            "stats": self.op_stats,
+            "metrics": self.op_metrics,
+            "tags": self.op_tags,
+            "set_tags": self.op_set_tags,
+            "index": self.op_index,
+            "shutdown": self.op_shutdown,
+        }
+
+    def start(self):
+        """Starts listening. Raises ServiceError if a service for the index database is running already."""
+        try:
+            with ServiceClient(self.engine.index_store.db_path, self.address) as client:
+                client.request("ping")
+        except ServiceError:
+            if FAMILY == "AF_UNIX" and os.path.exists(self.address):
+                os.unlink(self.address)  # Left behind by a service that did not shut down
+        else:
+            raise ServiceError(f"The index service is already running at {self.address}.")
+        # The key file is readable by the owner only, clients prove they could read it
+        fd = os.open(self.key_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "w") as f:
+            f.write(self.authkey.hex())
+        self.listener = Listener(self.address, FAMILY, backlog=16, authkey=self.authkey)
+        if FAMILY == "AF_UNIX":
+            os.chmod(self.address, 0o600)
+        log.info("Index service listening at %s", self.address)
+
+    def serve_forever(self):
+        """Indexes and watches every directory, and answers requests until shutdown() or a shutdown request.
+
+        Call start() first.
+        """
+        self.op_index()
+        try:
+            while not self.stopping.is_set():
+                try:
+                    conn = self.listener.accept()
+                except AuthenticationError as e:
+                    log.warning("Rejected a client: %s", e)
+                    continue
+                except OSError:
+                    if self.stopping.is_set():
+                        break
+                    raise
+                if self.stopping.is_set():
+                    conn.close()
+                    break
+                threading.Thread(target=self.handle, args=(conn,), daemon=True).start()
+        finally:
+            self.close()
+
+    def shutdown(self):
+        """Stops accepting connections. serve_forever() returns and closes the engine."""
+        if self.stopping.is_set():
+            return
+        self.stopping.set()
+        # accept() does not return when the listener is closed from another thread, a connection wakes it
+        try:
+            Client(self.address, FAMILY, authkey=self.authkey).close()
+        except (OSError, AuthenticationError):
+            pass
+
+    def close(self):
+        if self.listener is not None:
+            self.listener.close()
+            self.listener = None
+        try:
+            os.remove(self.key_file)
+        except OSError:
+            pass
+        self.engine.cancel_indexing(0)
+        with self.index_lock:
+            index_thread = self.index_thread
+        if index_thread is not None:
+            index_thread.join()
+        log.info("Index service stopped.")
+
+    def handle(self, conn):
+        """Answers the requests of one client until it disconnects."""
+        with self.lock:
+            self.connections += 1
+        try:
+            while not self.stopping.is_set():
+                try:
+                    request = json.loads(conn.recv_bytes(SERVICE_MAX_REQUEST_BYTES))
+                except (EOFError, OSError):
+                    return
+                except ValueError:
+                    conn.send_bytes(encode({"error": "Request is not valid JSON."}))
+                    continue
+                conn.send_bytes(encode(self.dispatch(request)))
+        except OSError:
+            pass  # The client went away while the reply was sent
+        finally:
+            with self.lock:
+                self.connections -= 1
+            conn.close()
+
+    def dispatch(self, request):
+        """Runs one request and returns the reply."""
+        if not isinstance(request, dict):
+            return {"error": "A request is a JSON object."}
+        arguments = dict(request)
+        name = arguments.pop("op", None)
+        op = self.ops.get(name) if isinstance(name, str) else None
+        if op is None:
+            return {"error": f"Unknown op {request.get('op')!r}, expected one of: {', '.join(self.ops)}."}
+        try:
+            return {"ok": op(**arguments)}
+        except (TypeError, ValueError) as e:
+            return {"error": str(e)}
+        except Exception as e:
+            log.exception("Error answering %s: %s", request.get("op"), e)
+            return {"error": f"{type(e).__name__}: {e}"}
+
+    def roots(self, roots):
+        """Checks that requested roots are monitored directories. None means all of them."""
+        if roots is None:
+            return None
+        unknown = [root for root in roots if root not in self.engine.directories]
+        if unknown:
+            raise ValueError(f"Not a monitored directory: {unknown[0]}")
+        return list(roots)
+
+    # Requests
+    def op_ping(self):
+        return {"pid": os.getpid(), "directories": self.engine.directories, "clients": self.connections}
+
+    def op_search(self, query, roots=None, suffixes=(), limit=None, offset=0, fuzzy=False, sort=None, descending=False):
+        """Returns one page of results as columns: paths, sizes and modified times, plus tags and content snippets by path.
+
+        The page holds at most limit results from offset on. limit defaults to
+        SERVICE_SEARCH_PAGE_SIZE and is clamped to SERVICE_MAX_SEARCH_PAGE_SIZE.
+        next_offset is where the next page starts, or None after the last one.
+        """
+        limit = SERVICE_SEARCH_PAGE_SIZE if limit is None else limit
+        if not isinstance(limit, int) or isinstance(limit, bool) or limit < 1:
+            raise ValueError("limit must be a positive integer.")
+        if not isinstance(offset, int) or isinstance(offset, bool) or offset < 0:
+            raise ValueError("offset must be a non-negative integer.")
+        limit = min(limit, SERVICE_MAX_SEARCH_PAGE_SIZE)
+        engine = self.engine
+        roots = self.roots(roots)
+        with self.query_lock:
+            # One more result than the page tells whether there is a next one
+            refs = engine.search_refs(query, roots, tuple(suffixes), offset + limit + 1, fuzzy, sort, descending)
+            snippets = engine.content_snippets
+        more = len(refs) > offset + limit
+        refs = refs[offset:offset + limit]
+        paths, sizes, modified = [], [], []
+        for ref in refs:
+            metadata = engine.metadata_of(ref)
+            if metadata is None:
+                continue  # The directory was removed since the query ran
+            paths.append(engine.path_of(ref))
+            sizes.append(metadata[0])
+            modified.append(metadata[1])
+        get_tags = engine.tag_manager.get_tags
+        return {
+            "paths": paths,
+            "sizes": sizes,
+            "modified": modified,
+            "tags": {path: get_tags(path) for path in paths if get_tags(path)},
+            "snippets": {path: snippets[path] for path in paths if path in snippets},
+            "next_offset": offset + limit if more else None,
+        }
+
+    def op_explain(self, query, roots=None, suffixes=()):
+        roots = self.roots(roots)
+        with self.query_lock:
+            return self.engine.explain(query, roots, tuple(suffixes))
+
+    def op_counts(self, roots=None):
+        """Returns the number of indexed files in the given directories (default: all), in total and by extension."""
+        roots = self.roots(roots)
+        return {"files": self.engine.file_count(roots), "extensions": self.engine.extension_counts(roots)}
+
+    def op_stats(self):
+        return self.engine.stats()
+
+    def op_metrics(self, prometheus=False):
+        metrics = self.engine.metrics
+        return metrics.prometheus_text() if prometheus else metrics.snapshot()
+
+    def op_tags(self, path):
+        return self.engine.tag_manager.get_tags(path)
+
+    def op_set_tags(self, path, tags):
+        """Replaces the tags of a file in a monitored directory and returns them."""
+        if not isinstance(path, str):
+            raise ValueError("path must be a string.")
+        if not isinstance(tags, list) or not all(isinstance(tag, str) for tag in tags):
+            raise ValueError("tags must be a list of strings.")
+        if not any(is_safe_path(root, path) for root in self.engine.directories):
+            raise ValueError(f"Not in a monitored directory: {path}")
+        tags = [tag.strip() for tag in tags if tag.strip()]
+        self.engine.tag_manager.set_tags(path, tags)
+        return self.engine.tag_manager.get_tags(path)
+
+    def op_index(self, roots=None, wait=False):
+        """Starts bringing the index up to date on the index thread and watching. Returns False if it is running already.
+
+        With wait set, a running scan is waited for and followed by this one, and the
+        reply is sent once it is done: {"files": indexed files, "complete": False if
+        it was cancelled}.
+        """
+        roots = self.roots(roots)
+        result = {}
+
+        def index():
+            try:
+                scans = self.engine.index_directories(roots)
+                result["complete"] = len(scans) == len(roots or self.engine.directories) and not any(
+                    scan.cancelled for scan in scans.values()
+                )
+                self.engine.start_watching()
+            except Exception as e:
+                log.exception("Error indexing: %s", e)
+
+        with self.index_lock:
+            if self.index_thread is not None and self.index_thread.is_alive():
+                if not wait:
+                    return False
+                self.index_thread.join()
+            if self.stopping.is_set():
+                raise ValueError("The index service is shutting down.")
+            thread = self.index_thread = threading.Thread(target=index, daemon=True)
+            thread.start()
+        if not wait:
+            return True
+        thread.join()
+        return {"files": self.engine.file_count(roots), "complete": result.get("complete", False)}
+
+    def op_shutdown(self):
+        self.shutdown()
+        return True
+
+
+# Client
+class ServiceClient:
+    """A connection to a running index service.
+
+    Raises ServiceError if no service runs for the index database. request()
+    sends one request and returns its result, or raises ServiceError with the
+    service's error message.
+    """
+    def __init__(self, db_path=INDEX_DB_FILE, address=None):
+        try:
+            with open(key_file(db_path), "r") as f:
+                authkey = bytes.fromhex(f.read().strip())
+        except (OSError, ValueError):
+            raise ServiceError("The index service is not running, start it with: python -m fs_engine serve") from None
+        address = address or service_address(db_path)
+        try:
+            self.conn = Client(address, FAMILY, authkey=authkey)
+        except (OSError, EOFError, AuthenticationError) as e:
+            raise ServiceError(f"Could not connect to the index service at {address}: {e}") from None
+
+    def request(self, op, **arguments):
+        try:
+            self.conn.send_bytes(encode({"op": op, **arguments}))
+            reply = json.loads(self.conn.recv_bytes())
+        except (OSError, EOFError) as e:
+            raise ServiceError(f"Lost the connection to the index service: {e}") from None
+        if "error" in reply:
+            raise ServiceError(reply["error"])
+        return reply["ok"]
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
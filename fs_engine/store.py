@@ -0,0 +1,417 @@
+"""
+File Search Pro - persistent index store
+Copyright (C) 2024 [Kristopher Sorensen]
+
+Licensed under the GNU General Public License v3 or later, see LICENSE.txt.
+"""
+
+import os
+import json
+import logging
+import sqlite3
+
+from .config import INDEX_DB_FILE, INDEX_FILE, LOAD_BATCH_SIZE
+from .metrics import Metrics, TimedLock
+
+log = logging.getLogger(__name__)
+
+# Persistent index store
+def path_prefix_range(root):
+    """Returns the (low, high) bounds of every path below root for an indexed range query."""
+    prefix = root if root.endswith(("/", os.sep)) else root + os.sep
+    return prefix, prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+class IndexStore:
+    """SQLite (WAL mode) index store. Single path inserts, deletes and renames are one-row writes."""
+    SCHEMA_VERSION = 7
+
+    def __init__(self, db_path=INDEX_DB_FILE, legacy_index_file=INDEX_FILE, metrics=None):
+        self.db_path = db_path
+        self.legacy_index_file = legacy_index_file
+        self.metrics = metrics if metrics is not None else Metrics()  # Write durations and lock waits
+        self.lock = TimedLock(self.metrics, "store")  # One connection shared between the GUI, indexing and watchdog threads
+        self.conn = sqlite3.connect(db_path, timeout=10, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.create_schema()
+        self.migrate_legacy_index()
+
+    def create_schema(self):
+        """Creates the index tables, upgrading an older schema version in place."""
+        with self.lock, self.conn:
+            version = self.conn.execute("PRAGMA user_version").fetchone()[0]
+            self.conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+            self.conn.execute("CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, directory TEXT) WITHOUT ROWID")
+
+            if version < 2:
+                # Version 2 records each file's directory and every scanned directory's mtime
+                columns = {row[1] for row in self.conn.execute("PRAGMA table_info(files)")}
+                if "directory" not in columns:
+                    self.conn.create_function("dirname", 1, os.path.dirname)
+                    self.conn.execute("ALTER TABLE files ADD COLUMN directory TEXT")
+                    self.conn.execute("UPDATE files SET directory = dirname(path)")
+                self.conn.execute("CREATE INDEX IF NOT EXISTS files_directory ON files (directory)")
+                self.conn.execute(
+                    "CREATE TABLE IF NOT EXISTS directories (path TEXT PRIMARY KEY, parent TEXT, mtime REAL) WITHOUT ROWID"
+                )
+
+            if version < 3:
+                # Version 3 records each file's (device, inode) identity so renames can be matched up
+                columns = {row[1] for row in self.conn.execute("PRAGMA table_info(files)")}
+                if "ino" not in columns:
+                    self.conn.execute("ALTER TABLE files ADD COLUMN dev INTEGER")
+                    self.conn.execute("ALTER TABLE files ADD COLUMN ino INTEGER")
+                    # Forget directory mtimes so the next scan lists everything once and records the identities
+                    self.conn.execute("UPDATE directories SET mtime = NULL")
+
+            if version < 4:
+                # Version 4 adds the optional content index: token -> (file, first line) plus the text of those lines
+                self.conn.execute(
+                    "CREATE TABLE IF NOT EXISTS content_files (path TEXT PRIMARY KEY, mtime REAL, size INTEGER) WITHOUT ROWID"
+                )
+                self.conn.execute(
+                    "CREATE TABLE IF NOT EXISTS content_postings (token TEXT, path TEXT, line INTEGER, "
+                    "PRIMARY KEY (token, path)) WITHOUT ROWID"
+                )
+                self.conn.execute("CREATE INDEX IF NOT EXISTS content_postings_path ON content_postings (path)")
+                self.conn.execute(
+                    "CREATE TABLE IF NOT EXISTS content_lines (path TEXT, line INTEGER, text TEXT, "
+                    "PRIMARY KEY (path, line)) WITHOUT ROWID"
+                )
+
+            if version < 5:
+                # Version 5 keeps each file's size, mtime and ctime from the directory listing
+                columns = {row[1] for row in self.conn.execute("PRAGMA table_info(files)")}
+                if "size" not in columns:
+                    self.conn.execute("ALTER TABLE files ADD COLUMN size INTEGER")
+                    self.conn.execute("ALTER TABLE files ADD COLUMN mtime REAL")
+                    self.conn.execute("ALTER TABLE files ADD COLUMN ctime REAL")
+                    # Forget directory mtimes so the next scan lists everything once and records the metadata
+                    self.conn.execute("UPDATE directories SET mtime = NULL")
+
+            if version < 6:
+                # Version 6 caches file hashes for the duplicate finder, valid while size and mtime match
+                self.conn.execute(
+                    "CREATE TABLE IF NOT EXISTS file_hashes (dev INTEGER, ino INTEGER, size INTEGER, mtime REAL, "
+                    "partial BLOB, full BLOB, PRIMARY KEY (dev, ino)) WITHOUT ROWID"
+                )
+
+            if version < 7:
+                # Version 7 records the exclusion rules that skipped entries of each listed directory, as a JSON list
+                columns = {row[1] for row in self.conn.execute("PRAGMA table_info(directories)")}
+                if "exclusions" not in columns:
+                    self.conn.execute("ALTER TABLE directories ADD COLUMN exclusions TEXT")
+
+            self.conn.execute(f"PRAGMA user_version = {self.SCHEMA_VERSION}")
+
+    def migrate_legacy_index(self):
+        """Imports an existing file_index.json once and keeps it as a .migrated backup."""
+        if not os.path.exists(self.legacy_index_file) or self.get_meta("migrated_from_json"):
+            return
+        try:
+            with open(self.legacy_index_file, "r") as f:
+                saved_data = json.load(f)
+        except (OSError, ValueError) as e:
+            log.warning("Could not read legacy index %s: %s", self.legacy_index_file, e)
+            return
+
+        with self.lock, self.conn:
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO files (path, directory) VALUES (?, ?)",
+                ((path, os.path.dirname(path)) for path in saved_data.get("files", []))
+            )
+            self._set_meta("directories", json.dumps(saved_data.get("directories", [])))
+            self._set_meta("last_modified_time", json.dumps(saved_data.get("last_modified_time", 0)))
+            self._set_meta("migrated_from_json", json.dumps(True))
+        try:
+            os.replace(self.legacy_index_file, f"{self.legacy_index_file}.migrated")
+        except OSError as e:
+            log.warning("Could not rename legacy index %s: %s", self.legacy_index_file, e)
+        log.info("Migrated legacy index %s to %s", self.legacy_index_file, self.db_path)
+
+    def _set_meta(self, key, value):
+        self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+    def set_meta(self, key, value):
+        """Stores a JSON encoded meta value."""
+        with self.lock, self.conn:
+            self._set_meta(key, json.dumps(value))
+
+    def get_meta(self, key, default=None):
+        """Returns a JSON decoded meta value."""
+        with self.lock:
+            row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def load(self):
+        """Returns the saved directories and last_modified_time."""
+        return {
+            "directories": self.get_meta("directories", []),
+            "last_modified_time": self.get_meta("last_modified_time", 0),
+        }
+
+    def load_files(self, root, batch_size=LOAD_BATCH_SIZE):
+        """Yields (path, size, mtime, ctime) rows below root in path order, so the files of a directory come together.
+
+        Rows are read batch_size at a time, holding the lock per batch only, so a
+        large root is never materialised as one list. Metadata that was never
+        recorded is 0.
+        """
+        low, high = path_prefix_range(root)
+        while True:
+            with self.lock:
+                rows = self.conn.execute(
+                    "SELECT path, IFNULL(size, 0), IFNULL(mtime, 0), IFNULL(ctime, 0) FROM files "
+                    "WHERE path >= ? AND path < ? ORDER BY path LIMIT ?", (low, high, batch_size)
+                ).fetchall()
+            yield from rows
+            if len(rows) < batch_size:
+                return
+            low = rows[-1][0] + "\0"  # The smallest path after the last row
+
+    def has_files(self, root):
+        """Returns True if any file below root is indexed."""
+        low, high = path_prefix_range(root)
+        with self.lock:
+            return self.conn.execute("SELECT 1 FROM files WHERE path >= ? AND path < ? LIMIT 1", (low, high)).fetchone() is not None
+
+    def file_directories(self, root):
+        """Returns the set of directories below root that contain indexed files."""
+        low, high = path_prefix_range(root)
+        with self.lock:
+            return {row[0] for row in self.conn.execute(
+                "SELECT DISTINCT directory FROM files WHERE path >= ? AND path < ?", (low, high)
+            )}
+
+    def files_in_directory(self, directory):
+        """Returns {path: (identity, size, mtime, ctime)} for the indexed files directly inside a directory."""
+        with self.lock:
+            return {
+                path: ((dev, ino) if ino is not None else None, size, mtime, ctime)
+                for path, dev, ino, size, mtime, ctime in self.conn.execute(
+                    "SELECT path, dev, ino, size, mtime, ctime FROM files WHERE directory = ?", (directory,)
+                )
+            }
+
+    def file_identities(self, paths):
+        """Returns {path: identity} for the given paths that are indexed with an identity."""
+        with self.lock:
+            identities = {}
+            for path in paths:
+                row = self.conn.execute("SELECT dev, ino FROM files WHERE path = ? AND ino IS NOT NULL", (path,)).fetchone()
+                if row:
+                    identities[path] = row
+            return identities
+
+    def load_directories(self, root):
+        """Returns {directory: (mtime, [subdirectories])} for root and every scanned directory below it."""
+        low, high = path_prefix_range(root)
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT path, parent, mtime FROM directories WHERE path = ? OR (path >= ? AND path < ?)",
+                (root, low, high)
+            ).fetchall()
+        children = {}
+        for path, parent, _ in rows:
+            children.setdefault(parent, []).append(path)
+        return {path: (mtime, children.get(path, [])) for path, _, mtime in rows}
+
+    def pending_directory_count(self, root):
+        """Returns the number of directories below root that were found but never listed, e.g. by a cancelled scan."""
+        low, high = path_prefix_range(root)
+        with self.lock:
+            return self.conn.execute(
+                "SELECT COUNT(*) FROM directories WHERE (path = ? OR (path >= ? AND path < ?)) AND mtime IS NULL",
+                (root, low, high)
+            ).fetchone()[0]
+
+    def save_directories(self, directories, last_modified_time):
+        """Saves the directory list without touching the file rows."""
+        with self.lock, self.metrics.timer("filesearch_store_write_seconds", operation="directories"), self.conn:
+            self._set_meta("directories", json.dumps(directories))
+            self._set_meta("last_modified_time", json.dumps(last_modified_time))
+
+    def apply_scan_batch(self, directory_rows, added, removed, removed_directories=(), pending_directories=()):
+        """Writes one batch of scan results in a single transaction.
+
+        directory_rows are (path, parent, mtime, exclusions) tuples for the directories
+        listed, exclusions being a JSON list of the rules that skipped entries or None. added maps new or changed file paths to their (identity or None, size,
+        mtime, ctime) record and removed_directories are directories that no longer exist.
+        pending_directories are (path, parent) pairs of subdirectories found by a
+        listing; those not stored yet are added without an mtime, so a later scan
+        lists them even if this one stops first.
+        """
+        with self.lock, self.metrics.timer("filesearch_store_write_seconds", operation="scan_batch"), self.conn:
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO directories (path, parent, mtime) VALUES (?, ?, NULL)", pending_directories
+            )
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO directories (path, parent, mtime, exclusions) VALUES (?, ?, ?, ?)", directory_rows
+            )
+            self.conn.executemany("DELETE FROM files WHERE path = ?", ((path,) for path in removed))
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO files (path, directory, dev, ino, size, mtime, ctime) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    (path, os.path.dirname(path)) + (record[0] or (None, None)) + tuple(record[1:])
+                    for path, record in added.items()
+                )
+            )
+            for directory in removed_directories:
+                self.conn.execute("DELETE FROM files WHERE directory = ?", (directory,))
+                self.conn.execute("DELETE FROM directories WHERE path = ?", (directory,))
+
+    def directory_exclusions(self, root):
+        """Returns {directory: [rule]} for the directories below root whose last listing skipped entries by a rule."""
+        low, high = path_prefix_range(root)
+        with self.lock:
+            return {
+                path: json.loads(exclusions) for path, exclusions in self.conn.execute(
+                    "SELECT path, exclusions FROM directories WHERE (path = ? OR (path >= ? AND path < ?)) AND exclusions IS NOT NULL",
+                    (root, low, high)
+                )
+            }
+
+    def apply_rule_change(self, removed, pruned_directories, relisted_directories, exclusions):
+        """Writes the effect of changed exclusion rules in one transaction.
+
+        removed are files that are excluded now. pruned_directories are excluded
+        now too, they are deleted with everything below them. relisted_directories
+        lose their mtime, so the next scan lists them again. exclusions maps
+        directories to the rules that removed or pruned their entries, added to
+        the rules recorded for them.
+        """
+        with self.lock, self.metrics.timer("filesearch_store_write_seconds", operation="rule_change"), self.conn:
+            for directory, rules in exclusions.items():
+                row = self.conn.execute("SELECT exclusions FROM directories WHERE path = ?", (directory,)).fetchone()
+                if row is not None:
+                    rules = sorted(set(rules).union(json.loads(row[0]) if row[0] else ()))
+                    self.conn.execute("UPDATE directories SET exclusions = ? WHERE path = ?", (json.dumps(rules), directory))
+            self.conn.executemany("DELETE FROM files WHERE path = ?", ((path,) for path in removed))
+            for directory in pruned_directories:
+                low, high = path_prefix_range(directory)
+                self.conn.execute("DELETE FROM files WHERE path >= ? AND path < ?", (low, high))
+                self.conn.execute("DELETE FROM directories WHERE path = ? OR (path >= ? AND path < ?)", (directory, low, high))
+            self.conn.executemany("UPDATE directories SET mtime = NULL WHERE path = ?", ((path,) for path in relisted_directories))
+
+    def remove_root(self, root):
+        """Deletes every file, directory and content row below root."""
+        low, high = path_prefix_range(root)
+        with self.lock, self.conn:
+            self.conn.execute("DELETE FROM files WHERE path >= ? AND path < ?", (low, high))
+            self.conn.execute("DELETE FROM directories WHERE path = ? OR (path >= ? AND path < ?)", (root, low, high))
+            for table in ("content_files", "content_postings", "content_lines"):
+                self.conn.execute(f"DELETE FROM {table} WHERE path >= ? AND path < ?", (low, high))
+
+    def load_content_files(self, root):
+        """Returns {path: (mtime, size)} for the content indexed files below root."""
+        low, high = path_prefix_range(root)
+        with self.lock:
+            return {
+                path: (mtime, size) for path, mtime, size in self.conn.execute(
+                    "SELECT path, mtime, size FROM content_files WHERE path >= ? AND path < ?", (low, high)
+                )
+            }
+
+    def apply_content_batch(self, results, removed=()):
+        """Replaces the content rows of tokenized files and deletes those of removed files in one transaction.
+
+        results are (path, mtime, size, postings, lines) tuples from content.index_file().
+        """
+        with self.lock, self.metrics.timer("filesearch_store_write_seconds", operation="content_batch"), self.conn:
+            for path in list(removed) + [result[0] for result in results]:
+                self.conn.execute("DELETE FROM content_postings WHERE path = ?", (path,))
+                self.conn.execute("DELETE FROM content_lines WHERE path = ?", (path,))
+            self.conn.executemany("DELETE FROM content_files WHERE path = ?", ((path,) for path in removed))
+            for path, mtime, size, postings, lines in results:
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO content_files (path, mtime, size) VALUES (?, ?, ?)", (path, mtime, size)
+                )
+                self.conn.executemany(
+                    "INSERT INTO content_postings (token, path, line) VALUES (?, ?, ?)",
+                    ((token, path, line) for token, line in postings.items())
+                )
+                self.conn.executemany(
+                    "INSERT INTO content_lines (path, line, text) VALUES (?, ?, ?)",
+                    ((path, line, text) for line, text in lines.items())
+                )
+
+    def search_content(self, tokens, roots=None, limit=None, accept=None):
+        """Returns [(path, line, text)] for files containing a token starting with each of tokens, sorted by path.
+
+        line and text are the first line of the file matching the first token. roots
+        limits the files to those below any of the given directories, accept(path)
+        can reject more of them before the limit is applied.
+        """
+        if not tokens:
+            return []
+        ranges = [path_prefix_range(root) for root in roots] if roots is not None else None
+        with self.lock:
+            matches = None
+            for token in tokens:
+                # Every token is a prefix, so "conf" finds "config" and "configure"
+                lines = {}
+                for path, line in self.conn.execute(
+                    "SELECT path, MIN(line) FROM content_postings WHERE token >= ? AND token < ? GROUP BY path",
+                    (token, token[:-1] + chr(ord(token[-1]) + 1))
+                ):
+                    if matches is None or path in matches:
+                        lines[path] = line
+                matches = lines if matches is None else {path: matches[path] for path in lines}
+                if not matches:
+                    return []
+
+            paths = sorted(
+                path for path in matches
+                if (ranges is None or any(low <= path < high for low, high in ranges)) and (accept is None or accept(path))
+            )
+            if limit is not None:
+                paths = paths[:limit]
+            results = []
+            for path in paths:
+                row = self.conn.execute("SELECT text FROM content_lines WHERE path = ? AND line = ?", (path, matches[path])).fetchone()
+                results.append((path, matches[path], row[0] if row else ""))
+            return results
+
+    def load_hashes(self, identities):
+        """Returns {identity: (size, mtime, partial, full)} of the cached hashes for the given identities."""
+        with self.lock:
+            hashes = {}
+            for identity in identities:
+                row = self.conn.execute(
+                    "SELECT size, mtime, partial, full FROM file_hashes WHERE dev = ? AND ino = ?", identity
+                ).fetchone()
+                if row:
+                    hashes[identity] = row
+            return hashes
+
+    def save_hashes(self, rows):
+        """Caches (identity, size, mtime, partial, full) hash rows in one transaction."""
+        with self.lock, self.metrics.timer("filesearch_store_write_seconds", operation="hashes"), self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO file_hashes (dev, ino, size, mtime, partial, full) VALUES (?, ?, ?, ?, ?, ?)",
+                (identity + tuple(entry) for identity, *entry in rows)
+            )
+
+    def prune_hashes(self):
+        """Drops cached hashes of files that are no longer indexed. Returns the number dropped."""
+        with self.lock, self.conn:
+            return self.conn.execute(
+                "DELETE FROM file_hashes WHERE (dev, ino) NOT IN (SELECT dev, ino FROM files WHERE ino IS NOT NULL)"
+            ).rowcount
+
+    def content_file_count(self):
+        """Returns the number of content indexed files."""
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM content_files").fetchone()[0]
+
+    def clear_content(self):
+        """Drops the whole content index."""
+        with self.lock, self.conn:
+            for table in ("content_files", "content_postings", "content_lines"):
+                self.conn.execute(f"DELETE FROM {table}")
+
+    def close(self):
+        """Closes the database connection."""
+        with self.lock:
+            self.conn.close()
@@ -0,0 +1,178 @@
+"""
+File Search Pro - tag storage
+Copyright (C) 2024 [Kristopher Sorensen]
+
+Licensed under the GNU General Public License v3 or later, see LICENSE.txt.
+"""
+
+import os
+import json
+import bisect
+import threading
+from contextlib import contextmanager
+
+from .config import TAGS_FILE
+
+# Tag features
+class TagManager:
+    """File path -> tags mapping with an inverted tag -> paths index.
+
+    Tags are matched case-insensitively. Mutations inside batch() are written to
+    the tags file once, when the outermost batch ends.
+    """
+    def __init__(self, tags_file=TAGS_FILE):
+        self.tags_file = tags_file
+        self.tags = {}  # File path -> list of tags, as stored in the tags file
+        self.tag_paths = {}  # Lowercased tag -> set of file paths
+        self.vocabulary = []  # Sorted lowercased tags, for prefix and substring lookups
+        self.lock = threading.RLock()  # Queries read the index from the search thread
+        self.batch_depth = 0
+        self.dirty = False
+        self.load_tags()
+
+    def load_tags(self):
+        """Loads tags from the JSON file."""
+        if os.path.exists(self.tags_file):
+            with open(self.tags_file, "r") as f:
+                tags = json.load(f)
+        else:
+            tags = {}
+        with self.lock:
+            self.tags = tags
+            self.rebuild_index()
+
+    def rebuild_index(self):
+        """Rebuilds the inverted index from the path -> tags mapping."""
+        self.tag_paths = {}
+        for file_path, tags in self.tags.items():
+            for tag in tags:
+                self.tag_paths.setdefault(tag.lower(), set()).add(file_path)
+        self.vocabulary = sorted(self.tag_paths)
+
+    def save_tags(self):
+        """Saves tags to the JSON file, or marks them dirty while a batch is open."""
+        with self.lock:
+            if self.batch_depth:
+                self.dirty = True
+                return
+            # Written to a temporary file first so a crash never leaves a truncated tags file
+            temp_file = self.tags_file + ".tmp"
+            with open(temp_file, "w") as f:
+                json.dump(self.tags, f, separators=(",", ":"))
+            os.replace(temp_file, self.tags_file)
+            self.dirty = False
+
+    @contextmanager
+    def batch(self):
+        """Groups tag changes into a single write of the tags file."""
+        with self.lock:
+            self.batch_depth += 1
+        try:
+            yield self
+        finally:
+            with self.lock:
+                self.batch_depth -= 1
+                if not self.batch_depth and self.dirty:
+                    self.save_tags()
+
+    def index_tag(self, file_path, tag):
+        """Adds a file to the inverted index entry of a tag. The caller holds the lock."""
+        key = tag.lower()
+        paths = self.tag_paths.get(key)
+        if paths is None:
+            paths = self.tag_paths[key] = set()
+            bisect.insort(self.vocabulary, key)
+        paths.add(file_path)
+
+    def unindex_tag(self, file_path, tag):
+        """Removes a file from the inverted index entry of a tag. The caller holds the lock."""
+        key = tag.lower()
+        paths = self.tag_paths.get(key)
+        if paths is None:
+            return
+        # Another tag of the same file may differ only in case
+        if any(other.lower() == key for other in self.tags.get(file_path, [])):
+            return
+        paths.discard(file_path)
+        if not paths:
+            del self.tag_paths[key]
+            del self.vocabulary[bisect.bisect_left(self.vocabulary, key)]
+
+    def add_tag(self, file_path, tag):
+        """Adds a tag to a file."""
+        with self.lock:
+            if file_path not in self.tags:
+                self.tags[file_path] = []
+            if tag not in self.tags[file_path]:
+                self.tags[file_path].append(tag)
+                self.index_tag(file_path, tag)
+                self.save_tags()
+
+    def remove_tag(self, file_path, tag):
+        """Removes a tag from a file."""
+        with self.lock:
+            if file_path in self.tags and tag in self.tags[file_path]:
+                self.tags[file_path].remove(tag)
+                if not self.tags[file_path]:  # Remove file if no tags left
+                    del self.tags[file_path]
+                self.unindex_tag(file_path, tag)
+                self.save_tags()
+
+    def set_tags(self, file_path, tags):
+        """Replaces every tag of a file with one write. An empty list removes the file."""
+        with self.lock, self.batch():
+            for tag in list(self.get_tags(file_path)):
+                if tag not in tags:
+                    self.remove_tag(file_path, tag)
+            for tag in tags:
+                self.add_tag(file_path, tag)
+
+    def clear_tags(self, file_path):
+        """Removes every tag from a file with one write."""
+        self.set_tags(file_path, [])
+
+    def rename_files(self, renamed):
+        """Moves the tags of renamed files to their new paths with one write. Returns the number of files moved."""
+        moved = 0
+        with self.lock, self.batch():
+            for old_path, new_path in renamed:
+                tags = list(self.get_tags(old_path))
+                if not tags:
+                    continue
+                self.clear_tags(old_path)
+                current_tags = self.get_tags(new_path)
+                self.set_tags(new_path, current_tags + [tag for tag in tags if tag not in current_tags])
+                moved += 1
+        return moved
+
+    def get_tags(self, file_path):
+        """Gets tags for a file."""
+        return self.tags.get(file_path, [])
+
+    def find_files(self, text):
+        """Returns the file paths with a tag containing text. An empty text matches every tagged file.
+
+        Only the tag vocabulary is scanned, so the cost follows the number of
+        distinct tags and matching files rather than the number of indexed files.
+        """
+        text = text.lower()
+        with self.lock:
+            if not text:
+                return set(self.tags)
+            matched = set()
+            for tag in self.vocabulary:
+                if text in tag:
+                    matched.update(self.tag_paths[tag])
+            return matched
+
+    def find_files_by_prefix(self, prefix):
+        """Returns the file paths with a tag starting with prefix."""
+        prefix = prefix.lower()
+        with self.lock:
+            matched = set()
+            for i in range(bisect.bisect_left(self.vocabulary, prefix), len(self.vocabulary)):
+                tag = self.vocabulary[i]
+                if not tag.startswith(prefix):
+                    break
+                matched.update(self.tag_paths[tag])
+            return matched
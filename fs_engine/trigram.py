@@ -0,0 +1,64 @@
+"""
+File Search Pro - substring search index
+Copyright (C) 2024 [Kristopher Sorensen]
+
+Licensed under the GNU General Public License v3 or later, see LICENSE.txt.
+"""
+
+from array import array
+
+# Substring search index
+class TrigramIndex:
+    """Trigram postings over lowercased basenames so substring queries only check a small candidate set.
+
+    Postings are arrays of file ids from a PathTable. Ids of removed files stay
+    in the postings: ids are never reused, so the owner filters dead ids out of
+    the candidates and rebuilds the index once they pile up.
+    """
+    def __init__(self):
+        self.postings = {}  # trigram -> array of file ids whose basename contains it
+
+    @staticmethod
+    def trigrams(text):
+        """Returns the set of 3-character substrings of text."""
+        return {text[i:i + 3] for i in range(len(text) - 2)}
+
+    def clear(self):
+        """Removes every entry."""
+        self.postings = {}
+
+    def rebuild(self, entries):
+        """Rebuilds the index from scratch for (file id, lowercased basename) pairs."""
+        self.clear()
+        for file_id, name in entries:
+            self.add(file_id, name)
+
+    def add(self, file_id, name):
+        """Indexes the lowercased basename of a file id."""
+        postings = self.postings
+        for gram in self.trigrams(name):
+            bucket = postings.get(gram)
+            if bucket is None:
+                postings[gram] = array("I", (file_id,))
+            else:
+                bucket.append(file_id)
+
+    def estimate(self, query):
+        """Returns an upper bound of the candidates of query: the length of its shortest postings."""
+        return min(len(self.postings.get(gram, ())) for gram in self.trigrams(query))
+
+    def candidates(self, query):
+        """Returns the set of file ids whose basename holds every trigram of query, dead ids included.
+
+        query must be at least 3 characters long.
+        """
+        # Intersect the smallest postings first so the candidate set shrinks quickly
+        buckets = sorted((self.postings.get(gram, ()) for gram in self.trigrams(query)), key=len)
+        if not buckets[0]:
+            return set()
+        candidates = set(buckets[0])
+        for bucket in buckets[1:]:
+            candidates.intersection_update(bucket)
+            if not candidates:
+                break
+        return candidates